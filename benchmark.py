@@ -0,0 +1,359 @@
+""" Benchmarks for DynamoDB Config Store
+
+Runs against DynamoDB Local (see ``make dynamodb_local``), or in memory with
+``--backend memory``, and writes the results as JSON, so that they can be
+compared between commits:
+::
+
+    python benchmark.py --output before.json
+    git checkout feature-branch
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from random import choice
+
+from boto.dynamodb2.layer1 import DynamoDBConnection
+
+from dynamodb_config_store import DynamoDBConfigStore, __version__
+from dynamodb_config_store.memory import MemoryConnection
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+TABLE_NAME = 'benchmark'
+STORE_NAME = 'benchmark'
+
+
+def percentile(samples, fraction):
+    """ Get a percentile of a list of samples
+
+    :type samples: list
+    :param samples: Sorted list of samples
+    :type fraction: float
+    :param fraction: Percentile as a fraction, e.g. 0.99
+    :returns: float -- The percentile
+    """
+    index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+    return samples[index]
+
+
+def latency_stats(samples):
+    """ Summarize latency samples
+
+    :type samples: list
+    :param samples: Latencies in seconds
+    :returns: dict -- Mean and percentiles in milliseconds
+    """
+    samples = sorted(samples)
+    return {
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'samples': len(samples)
+    }
+
+
+def make_options(size, width):
+    """ Generate options
+
+    :type size: int
+    :param size: Number of options
+    :type width: int
+    :param width: Number of keys per option
+    :returns: dict -- {'option': {'key': 'value'}}
+    """
+    return {
+        'option{:06d}'.format(number): {
+            'key{}'.format(key): 'value-{:06d}-{:04d}'.format(number, key)
+            for key in range(width)
+        }
+        for number in range(size)
+    }
+
+
+def bench_get_option(store, options, iterations):
+    """ Measure the latency of SimpleConfigStore.get_option """
+    names = list(options)
+    samples = []
+    for _ in range(iterations):
+        option = choice(names)
+        start = clock()
+        store.config.get_option(option)
+        samples.append(clock() - start)
+
+    return latency_stats(samples)
+
+
+def bench_get_all(store, options, iterations):
+    """ Measure the throughput of reading the full store with get() """
+    repetitions = max(1, min(iterations // 10, 1000000 // len(options)))
+
+    start = clock()
+    for _ in range(repetitions):
+        store.config.get()
+    elapsed = clock() - start
+
+    return {
+        'options_per_second': len(options) * repetitions / elapsed,
+        'seconds_per_get': elapsed / repetitions
+    }
+
+
+def bench_set(store, options, iterations):
+    """ Measure the throughput of set() """
+    names = list(options)[:iterations]
+
+    start = clock()
+    for option in names:
+        store.set(option, dict(options[option]))
+    elapsed = clock() - start
+
+    return {'sets_per_second': len(names) / elapsed}
+
+
+def bench_time_based_refresh(store, options, iterations):
+    """ Measure the refresh time and memory of the TimeBasedConfigStore """
+    repetitions = max(1, min(5, iterations // 100))
+
+    samples = []
+    for _ in range(repetitions):
+        start = clock()
+        store.config._fetch_options()
+        samples.append(clock() - start)
+
+    result = {
+        'refresh_{}'.format(metric): value
+        for metric, value in latency_stats(samples).items()
+    }
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        snapshot = store.config._fetch_options()
+        result['snapshot_bytes'] = tracemalloc.get_traced_memory()[0]
+        result['bytes_per_option'] = result['snapshot_bytes'] / len(options)
+        tracemalloc.stop()
+        del snapshot
+
+    return result
+
+
+def bench_contention(store, options, iterations, threads):
+    """ Measure reads of the TimeBasedConfigStore from many threads """
+    names = list(options)
+    per_thread = max(1, iterations * 10 // threads)
+    errors = []
+
+    def read():
+        try:
+            for _ in range(per_thread):
+                store.config.get(choice(names))
+        except Exception as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=read) for _ in range(threads)]
+
+    start = clock()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = clock() - start
+
+    if errors:
+        sys.stderr.write('{} of {} reader threads failed\n'.format(
+            len(errors), threads))
+        raise errors[0]
+
+    return {
+        'threads': threads,
+        'reads_per_second': per_thread * threads / elapsed
+    }
+
+
+def create_store(connection, config_store='SimpleConfigStore', **kwargs):
+    """ Create a store in the benchmark table """
+    return DynamoDBConfigStore(
+        connection,
+        TABLE_NAME,
+        STORE_NAME,
+        read_units=10000,
+        write_units=10000,
+        config_store=config_store,
+        config_store_kwargs=kwargs)
+
+
+def run(connection, sizes, widths, iterations, threads):
+    """ Run all benchmarks
+
+    :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+    :param connection: Boto connection object to use
+    :type sizes: list
+    :param sizes: Store sizes, in options, to benchmark
+    :type widths: list
+    :param widths: Option widths, in keys, to benchmark
+    :type iterations: int
+    :param iterations: Number of operations per benchmark
+    :type threads: int
+    :param threads: Number of threads for the contention benchmark
+    :returns: list -- List of result dicts
+    """
+    results = []
+
+    for size in sizes:
+        for width in widths:
+            options = make_options(size, width)
+
+            store = create_store(connection)
+            try:
+                store.set_many(
+                    {option: dict(data) for option, data in options.items()})
+
+                measurements = [
+                    ('get_option', bench_get_option(
+                        store, options, iterations)),
+                    ('get_all', bench_get_all(store, options, iterations)),
+                    ('set', bench_set(store, options, iterations))
+                ]
+
+                store = create_store(
+                    connection, 'TimeBasedConfigStore',
+                    update_interval=3600)
+                measurements.extend([
+                    ('time_based_refresh', bench_time_based_refresh(
+                        store, options, iterations)),
+                    ('contention', bench_contention(
+                        store, options, iterations, threads))
+                ])
+            finally:
+                if hasattr(store.config, 'close'):
+                    store.config.close()
+                store.table.delete()
+
+            for benchmark, measurement in measurements:
+                result = {'benchmark': benchmark, 'size': size, 'width': width}
+                result.update(measurement)
+                results.append(result)
+
+                sys.stderr.write('{} size={} width={}: {}\n'.format(
+                    benchmark, size, width, json.dumps(measurement)))
+
+    return results
+
+
+def git_commit():
+    """ Get the current git commit, None if it is not known """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    """ Print the change of each result compared to a baseline
+
+    :type baseline: dict
+    :param baseline: Earlier benchmark output
+    :type results: list
+    :param results: List of result dicts
+    :returns: None
+    """
+    def key(result):
+        return (result['benchmark'], result['size'], result['width'])
+
+    previous = {key(result): result for result in baseline['results']}
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+
+        for metric, value in sorted(result.items()):
+            if not isinstance(value, (int, float)) or metric in (
+                    'size', 'width', 'threads', 'samples',
+                    'refresh_samples'):
+                continue
+            if not old.get(metric):
+                continue
+
+            sys.stdout.write('{} size={} width={} {}: {:+.1f}%\n'.format(
+                result['benchmark'], result['size'], result['width'], metric,
+                (float(value) / old[metric] - 1) * 100))
+
+
+def main():
+    """ Parse the command line and run the benchmarks """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--backend', choices=['dynamodb', 'memory'], default='dynamodb',
+        help='Run against DynamoDB (Local) or the in-memory backend')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--sizes', default='10,100,1000,10000,100000',
+        help='Comma separated store sizes, in options')
+    parser.add_argument(
+        '--widths', default='1,10',
+        help='Comma separated option widths, in keys')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--output', help='File to write the results to')
+    parser.add_argument('--compare', help='Earlier results to compare with')
+    args = parser.parse_args()
+
+    if args.backend == 'memory':
+        connection = MemoryConnection()
+    else:
+        connection = DynamoDBConnection(
+            aws_access_key_id='foo',
+            aws_secret_access_key='bar',
+            host=args.host,
+            port=args.port,
+            is_secure=False)
+
+    results = run(
+        connection,
+        [int(size) for size in args.sizes.split(',')],
+        [int(width) for width in args.widths.split(',')],
+        args.iterations,
+        args.threads)
+
+    output = {
+        'backend': args.backend,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'results': results,
+        'timestamp': time.time(),
+        'version': __version__
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), results)
+
+
+if __name__ == '__main__':
+    main()
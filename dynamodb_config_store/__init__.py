@@ -32,7 +32,6 @@ prod        | secret-key     |                |                | test1234
 **) Range key
 """
 import os.path
-import time
 import sys
 if sys.version_info.major > 2:
     from configparser import ConfigParser as SafeConfigParser
@@ -49,12 +48,23 @@ from boto.dynamodb2.fields import HashKey, RangeKey
 from boto.dynamodb2.table import Table
 from boto.exception import JSONResponseError
 
+from dynamodb_config_store.batch import BatchWriter
+from dynamodb_config_store.config_stores.cached import CachedConfigStore
+from dynamodb_config_store.config_stores.shared_memory import (
+    SharedMemoryConfigStore)
 from dynamodb_config_store.config_stores.simple import SimpleConfigStore
+from dynamodb_config_store.config_stores.stream import StreamConfigStore
 from dynamodb_config_store.config_stores.time_based import TimeBasedConfigStore
 from dynamodb_config_store.exceptions import (
     MisconfiguredSchemaException,
     TableNotCreatedException,
     TableNotReadyException)
+from dynamodb_config_store.instrumentation import InstrumentedConnection
+from dynamodb_config_store.retry import RetryingConnection
+from dynamodb_config_store.snapshot import read_snapshot
+from dynamodb_config_store.validation import LazyTable, SchemaCache
+from dynamodb_config_store.versioning import next_version, set_store_version
+from dynamodb_config_store.waiter import wait_for_table
 
 # Publish the module __version__
 config_file = SafeConfigParser()
@@ -68,8 +78,11 @@ class DynamoDBConfigStore(object):
 
     config = None           # Instance of the a ConfigStore
     connection = None       # boto.dynamodb2.layer1.DynamoDBConnection instance
+    instrumentation = None  # Callable receiving instrumentation events
     option_key = None       # Key for the option (default: _option)
     read_units = None       # Number of read units to provision to new tables
+    schema_cache = None     # SchemaCache with validated tables, or None
+    skip_validation = False  # Validate the table on first use
     store_key = None        # Key for the store (default: _store)
     store_name = None       # Name of the Store
     config_store = None       # Store type to use
@@ -77,6 +90,9 @@ class DynamoDBConfigStore(object):
     config_store_kwargs = None  # Store type key word args
     table = None            # boto.dynamodb2.table.Table instance
     table_name = None       # Name of the DynamoDB table
+    version_key = None      # Key for the option version (default: None)
+    wait_callback = None    # Called while waiting for a new table
+    wait_timeout = 150      # Seconds to wait for a new table to get ACTIVE
     write_units = None      # Number of write units to provision to new tables
 
     def __init__(
@@ -84,7 +100,11 @@ class DynamoDBConfigStore(object):
             store_key='_store', option_key='_option',
             read_units=1, write_units=1,
             config_store='SimpleConfigStore',
-            config_store_args=[], config_store_kwargs={}):
+            config_store_args=[], config_store_kwargs={},
+            version_key=None, retry_policy=None, read_limiter=None,
+            write_limiter=None, circuit_breaker=None, instrumentation=None,
+            measure_bytes=False, table=None, schema_cache=None,
+            skip_validation=False, wait_timeout=150, wait_callback=None):
         """ Constructor for the config store
 
         :type connection: boto.dynamodb2.layer1.DynamoDBConnection
@@ -103,11 +123,74 @@ class DynamoDBConfigStore(object):
         :param config_store_args: Store type arguments
         :type config_store_kwargs: dict
         :param config_store_kwargs: Store type key word arguments
+        :type version_key: str
+        :param version_key: Key name for the option version in DynamoDB.
+            Enables versioned writes and delta updates. Default None
+        :type retry_policy: dynamodb_config_store.retry.RetryPolicy
+        :param retry_policy: Retry policy for all requests towards DynamoDB
+        :type read_limiter: dynamodb_config_store.retry.TokenBucket
+        :param read_limiter: Rate limiter for reads from the table
+        :type write_limiter: dynamodb_config_store.retry.TokenBucket
+        :param write_limiter: Rate limiter for writes to the table
+        :type circuit_breaker:
+            dynamodb_config_store.circuit_breaker.CircuitBreaker
+        :param circuit_breaker: Circuit breaker for all requests towards
+            DynamoDB
+        :type instrumentation: callable
+        :param instrumentation: Callable receiving an event for every request
+            towards DynamoDB and every cache lookup, see
+            dynamodb_config_store.instrumentation
+        :type measure_bytes: bool
+        :param measure_bytes: Report the size of the responses in the
+            request events. The size is measured by encoding each response
+            as JSON again, which is slow
+        :type table: boto.dynamodb2.table.Table
+        :param table: Table instance to use, e.g. the table of another store.
+            The table is neither described nor validated, and all requests
+            are made with the connection of the table, so the connection
+            wrappers (retries, rate limiters, circuit breaker and
+            instrumentation) are not applied
+        :type schema_cache: dynamodb_config_store.validation.SchemaCache
+        :param schema_cache: Cache of validated tables. Tables in the cache
+            are not described, see dynamodb_config_store.validation
+        :type skip_validation: bool
+        :param skip_validation: Validate (and create) the table on the first
+            request instead of when the store is created. Validation errors
+            are then raised by the first request
+        :type wait_timeout: float
+        :param wait_timeout: Maximum number of seconds to wait for a new
+            table to get ACTIVE
+        :type wait_callback: callable
+        :param wait_callback: Called with the table status and the number of
+            seconds waited, each time the status of a new table is checked
         :returns: None
         """
+        if table is not None:
+            if isinstance(table, LazyTable):
+                # Its connection property would validate the table right away
+                connection = table._connection
+            else:
+                connection = table.connection
+        else:
+            if instrumentation is not None:
+                connection = InstrumentedConnection(
+                    connection, instrumentation, measure_bytes=measure_bytes)
+
+            if (retry_policy or read_limiter or write_limiter or
+                    circuit_breaker):
+                connection = RetryingConnection(
+                    connection,
+                    retry_policy=retry_policy,
+                    read_limiter=read_limiter,
+                    write_limiter=write_limiter,
+                    circuit_breaker=circuit_breaker)
+
         self.connection = connection
+        self.instrumentation = instrumentation
         self.option_key = option_key
         self.read_units = read_units
+        self.schema_cache = schema_cache
+        self.skip_validation = skip_validation
         self.store_key = store_key
         self.store_name = store_name
         self.table_name = table_name
@@ -115,8 +198,15 @@ class DynamoDBConfigStore(object):
         self.config_store = config_store
         self.config_store_args = config_store_args
         self.config_store_kwargs = config_store_kwargs
+        self.version_key = version_key
+        self.wait_callback = wait_callback
+        self.wait_timeout = wait_timeout
+
+        if table is not None:
+            self.table = table
+        else:
+            self._initialize_table()
 
-        self._initialize_table()
         self._initialize_store()
 
     def _initialize_store(self):
@@ -127,6 +217,7 @@ class DynamoDBConfigStore(object):
                 self.store_name,
                 self.store_key,
                 self.option_key,
+                version_key=self.version_key,
                 *self.config_store_args,
                 **self.config_store_kwargs)
         elif self.config_store == 'SimpleConfigStore':
@@ -135,16 +226,105 @@ class DynamoDBConfigStore(object):
                 self.store_name,
                 self.store_key,
                 self.option_key,
+                version_key=self.version_key,
+                *self.config_store_args,
+                **self.config_store_kwargs)
+        elif self.config_store == 'CachedConfigStore':
+            self.config = CachedConfigStore(
+                self.table,
+                self.store_name,
+                self.store_key,
+                self.option_key,
+                version_key=self.version_key,
+                instrumentation=self.instrumentation,
+                *self.config_store_args,
+                **self.config_store_kwargs)
+        elif self.config_store == 'SharedMemoryConfigStore':
+            self.config = SharedMemoryConfigStore(
+                self.table,
+                self.store_name,
+                self.store_key,
+                self.option_key,
+                version_key=self.version_key,
+                *self.config_store_args,
+                **self.config_store_kwargs)
+        elif self.config_store == 'StreamConfigStore':
+            self.config = StreamConfigStore(
+                self.table,
+                self.store_name,
+                self.store_key,
+                self.option_key,
+                version_key=self.version_key,
                 *self.config_store_args,
                 **self.config_store_kwargs)
         else:
             raise NotImplementedError
 
+    def _options_written(self, options):
+        """ Handle options that have been written to DynamoDB
+
+        :type options: list
+        :param options: List of configuration option names
+        :returns: None
+        """
+        if self.version_key:
+            set_store_version(
+                self.table,
+                self.store_name,
+                self.store_key,
+                self.option_key,
+                self.version_key)
+
+        if isinstance(self.config, CachedConfigStore):
+            for option in options:
+                self.config.invalidate(option)
+
     def _initialize_table(self):
         """ Initialize the table
 
         :returns: None
         """
+        if self.skip_validation or self._has_snapshot():
+            self.table = LazyTable(
+                self.table_name, self.connection, self._validate_table)
+            return
+
+        self._validate_table()
+        self.table = Table(self.table_name, connection=self.connection)
+
+    def _has_snapshot(self):
+        """ Check if the config store can start from a snapshot file
+
+        The table is then validated on the first request instead, so that
+        the snapshot is served even if DynamoDB can not be reached.
+
+        :returns: bool -- True if there is a valid snapshot file to serve
+        """
+        if self.config_store not in (
+                'TimeBasedConfigStore', 'SharedMemoryConfigStore'):
+            return False
+
+        snapshot_file = self.config_store_kwargs.get('snapshot_file')
+        return (
+            snapshot_file is not None and
+            read_snapshot(snapshot_file) is not None)
+
+    def _validate_table(self):
+        """ Validate the table schema, creating the table if it is missing
+
+        Tables in the schema cache are not validated again.
+
+        :returns: None
+        """
+        if self.schema_cache is not None:
+            cache_key = SchemaCache.key(
+                self.connection,
+                self.table_name,
+                self.store_key,
+                self.option_key)
+            if self.schema_cache.is_valid(cache_key):
+                return
+
         try:
             table = self.connection.describe_table(self.table_name)
             status = table[u'Table'][u'TableStatus']
@@ -177,8 +357,12 @@ class DynamoDBConfigStore(object):
 
                 if not table_created:
                     raise TableNotCreatedException
+            else:
+                # The table could not be validated, do not cache it
+                return
 
-        self.table = Table(self.table_name, connection=self.connection)
+        if self.schema_cache is not None:
+            self.schema_cache.add(cache_key)
 
     def _create_table(self, read_units=1, write_units=1):
         """ Create a new table
@@ -189,7 +373,7 @@ class DynamoDBConfigStore(object):
         :param write_units: Number of write capacity units to provision
         :returns: bool -- Returns True if the table was created
         """
-        self.table = Table.create(
+        Table.create(
             self.table_name,
             schema=[
                 HashKey(self.store_key),
@@ -204,38 +388,78 @@ class DynamoDBConfigStore(object):
         # Wait for the table to get ACTIVE
         return self._wait_for_table(target_state='ACTIVE')
 
-    def _wait_for_table(self, target_state, sleep_time=5, retries=30):
+    def _wait_for_table(self, target_state):
         """ Wait for the table to get to a certain state
 
         :type target_state: str
         :param target_state: The target state to wait for
-        :type sleep_time: int
-        :param sleep_time: Number of seconds to wait between the checks
-        :type retries: int
-        :param retries: Number of retries before giving up
         :returns: bool -- True if the target state was reached, else False
         """
-        while retries > 0:
-            desc = self.connection.describe_table(self.table_name)
-            if desc[u'Table'][u'TableStatus'] == target_state.upper():
-                return True
+        return wait_for_table(
+            self.connection,
+            self.table_name,
+            target_state=target_state,
+            timeout=self.wait_timeout,
+            callback=self.wait_callback)
+
+    def batch_writer(self):
+        """ Get a context manager for batched upserts of config items
 
-            time.sleep(sleep_time)
-            retries -= 1
+        Options are written with BatchWriteItem requests of up to 25 items.
+        Anything still queued is written when the context is left:
+        ::
 
-        return False
+            with store.batch_writer() as batch:
+                batch.set('option', {'key': 'value'})
+
+            batch.results   # {'option': True}
+
+        :returns: dynamodb_config_store.batch.BatchWriter
+        """
+        return BatchWriter(
+            self.table,
+            self.store_name,
+            self.store_key,
+            self.option_key,
+            version_key=self.version_key,
+            callback=self._options_written)
+
+    def get_many(self, options, keys=None, consistent=None):
+        """ Get a list of options in as few requests as possible
+
+        Only supported by the SimpleConfigStore and the CachedConfigStore.
+
+        :type options: list
+        :param options: List of configuration option names
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        if not isinstance(self.config, SimpleConfigStore):
+            raise NotImplementedError
+
+        return self.config.get_many(
+            options, keys=keys, consistent=consistent)
 
     def reload(self):
         """ Reload the config store
 
         :returns: None
         """
+        if hasattr(self.config, 'close'):
+            # Let the new store take over the updates
+            self.config.close()
+
         self._initialize_store()
 
     def set(self, option, data):
         """ Upsert a config item
 
         A write towards DynamoDB will be executed when this method is called.
+        If a CachedConfigStore is used, the option is removed from its cache.
 
         :type option: str
         :param option: Name of the configuration option
@@ -245,9 +469,18 @@ class DynamoDBConfigStore(object):
         """
         data[self.store_key] = self.store_name
         data[self.option_key] = option
+        if self.version_key:
+            data[self.version_key] = next_version(
+                self.table,
+                self.store_name,
+                self.store_key,
+                self.option_key,
+                self.version_key)
 
         try:
-            return self.table.put_item(data, overwrite=True)
+            result = self.table.put_item(data, overwrite=True)
+            self._options_written([option])
+            return result
         except LimitExceededException:
             raise
         except ProvisionedThroughputExceededException:
@@ -260,3 +493,20 @@ class DynamoDBConfigStore(object):
             raise
         except Exception:
             raise
+
+    def set_many(self, options):
+        """ Upsert many config items
+
+        The items are written with BatchWriteItem requests of up to 25
+        items each, retrying unprocessed items with exponential backoff.
+
+        :type options: dict
+        :param options: Dictionary with {'option': {'key': 'value'}}
+        :returns: dict -- Dictionary with {'option': bool}, where True means
+            that the option was stored successfully
+        """
+        with self.batch_writer() as batch:
+            for option, data in options.items():
+                batch.set(option, data)
+
+        return batch.results
@@ -0,0 +1,255 @@
+""" asyncio support for DynamoDB Config Store
+
+boto is a blocking library, so the DynamoDB requests are run in a shared
+thread pool. Many requests can be in flight at the same time, reusing the
+HTTP connections in boto's connection pool, without blocking the event loop.
+
+This module requires Python 3.5 or newer.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dynamodb_config_store import DynamoDBConfigStore
+from dynamodb_config_store.config_stores import ConfigStore
+from dynamodb_config_store.config_stores.simple import SimpleConfigStore
+from dynamodb_config_store.waiter import poll_delays, table_status
+
+logger = logging.getLogger(__name__)
+
+
+async def wait_for_table(
+        connection, table_name, target_state='ACTIVE', timeout=150,
+        initial_delay=0.05, max_delay=5, callback=None):
+    """ Wait for a table to reach a state without blocking the event loop
+
+    Takes the same arguments as dynamodb_config_store.waiter.wait_for_table.
+    The describe_table requests are run in the default thread pool.
+
+    :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+    :param connection: Boto connection object to use
+    :type table_name: str
+    :param table_name: Name of the DynamoDB table
+    :type target_state: str
+    :param target_state: State to wait for, e.g. 'ACTIVE'
+    :type timeout: float
+    :param timeout: Maximum number of seconds to wait, forever if None
+    :type initial_delay: float
+    :param initial_delay: Seconds to wait before the second poll
+    :type max_delay: float
+    :param max_delay: Maximum number of seconds between two polls
+    :type callback: callable
+    :param callback: Called after each poll with the table status and the
+        number of seconds waited so far
+    :returns: bool -- True if the target state was reached, else False
+    """
+    loop = asyncio.get_event_loop()
+    target_state = target_state.upper()
+    start = time.time()
+
+    for delay in poll_delays(initial_delay, max_delay, timeout):
+        status = await loop.run_in_executor(
+            None, table_status, connection, table_name)
+
+        if callback is not None:
+            callback(status, time.time() - start)
+
+        if status == target_state:
+            return True
+
+        await asyncio.sleep(delay)
+
+    return False
+
+
+class AsyncDynamoDBConfigStore(object):
+    """ asyncio DynamoDB Config Store instance
+
+    Wraps a DynamoDBConfigStore using the SimpleConfigStore. The optional
+    background refresher keeps the options in ``config`` up to date, like
+    the TimeBasedConfigStore does, as an asyncio task.
+    """
+
+    config = None           # ConfigStore with the options from the refresher
+    store = None            # DynamoDBConfigStore instance
+
+    def __init__(self, store, max_workers=32):
+        """ Constructor for the AsyncDynamoDBConfigStore
+
+        Use AsyncDynamoDBConfigStore.create() to avoid blocking the event
+        loop while the table is initialized.
+
+        :type store: dynamodb_config_store.DynamoDBConfigStore
+        :param store: Store using the SimpleConfigStore
+        :type max_workers: int
+        :param max_workers: Maximum number of concurrent DynamoDB requests
+        :returns: None
+        """
+        if not isinstance(store.config, SimpleConfigStore):
+            raise NotImplementedError
+
+        self.config = ConfigStore()
+        self.store = store
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._refresher = None
+
+    @classmethod
+    async def create(
+            cls, connection, table_name, store_name, max_workers=32,
+            **kwargs):
+        """ Create an AsyncDynamoDBConfigStore
+
+        Takes the same arguments as DynamoDBConfigStore.
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to use
+        :type table_name: str
+        :param table_name: Name of the DynamoDB table to use
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :type max_workers: int
+        :param max_workers: Maximum number of concurrent DynamoDB requests
+        :returns: AsyncDynamoDBConfigStore
+        """
+        loop = asyncio.get_event_loop()
+        store = await loop.run_in_executor(None, functools.partial(
+            DynamoDBConfigStore, connection, table_name, store_name,
+            **kwargs))
+
+        return cls(store, max_workers=max_workers)
+
+    async def _call(self, method, *args, **kwargs):
+        """ Run a blocking method in the thread pool
+
+        :type method: callable
+        :param method: Method to call
+        :returns: The return value of the method
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs))
+
+    async def get(self, option=None, keys=None, consistent=None):
+        """ Get a config item, see SimpleConfigStore.get
+
+        :type option: str
+        :param option: Name of the configuration option, all options if None
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        return await self._call(
+            self.store.config.get, option, keys=keys, consistent=consistent)
+
+    async def get_option(self, option, keys=None, consistent=None):
+        """ Get a specific option, see SimpleConfigStore.get_option
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        return await self._call(
+            self.store.config.get_option, option, keys=keys,
+            consistent=consistent)
+
+    async def get_many(self, options, keys=None, consistent=None):
+        """ Get a list of options, see DynamoDBConfigStore.get_many
+
+        :type options: list
+        :param options: List of configuration option names
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        return await self._call(
+            self.store.get_many, options, keys=keys, consistent=consistent)
+
+    async def set(self, option, data):
+        """ Upsert a config item, see DynamoDBConfigStore.set
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type data: dict
+        :param data: Dictionary with all option data
+        :returns: bool -- True if the data was stored successfully
+        """
+        return await self._call(self.store.set, option, data)
+
+    async def set_many(self, options):
+        """ Upsert many config items, see DynamoDBConfigStore.set_many
+
+        :type options: dict
+        :param options: Dictionary with {'option': {'key': 'value'}}
+        :returns: dict -- Dictionary with {'option': bool}
+        """
+        return await self._call(self.store.set_many, options)
+
+    async def refresh(self):
+        """ Read all options and publish them in ``config``
+
+        :returns: None
+        """
+        options = await self.get()
+        self.config._publish(options)
+
+    async def start_refresher(self, update_interval=300):
+        """ Start refreshing ``config`` in the background
+
+        The first refresh is done before this coroutine returns.
+
+        :type update_interval: int
+        :param update_interval: How often, in seconds, to fetch updates
+        :returns: None
+        """
+        await self.refresh()
+        self._refresher = asyncio.ensure_future(self._run(update_interval))
+
+    async def _run(self, update_interval):
+        """ Run periodic fetcher
+
+        Failed updates are logged, the current options are served until the
+        next update.
+
+        :type update_interval: int
+        :param update_interval: How often, in seconds, to fetch updates
+        :returns: None
+        """
+        while True:
+            await asyncio.sleep(update_interval)
+
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(
+                    'Could not update store %s', self.store.store_name)
+
+    async def close(self):
+        """ Stop the refresher and shut down the thread pool
+
+        :returns: None
+        """
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,294 @@
+""" Helpers for batched reads and writes towards DynamoDB """
+import socket
+import time
+from collections import OrderedDict
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+from boto.dynamodb2.items import Item
+from boto.exception import BotoClientError, BotoServerError
+
+from dynamodb_config_store.exceptions import (
+    CircuitOpenException,
+    UnprocessedItemsException,
+    UnprocessedKeysException)
+from dynamodb_config_store.versioning import next_version
+
+BATCH_GET_SIZE = 100    # Maximum number of keys in a BatchGetItem request
+BATCH_WRITE_SIZE = 25   # Maximum number of items in a BatchWriteItem request
+MAX_RETRIES = 8         # Number of retries of unprocessed keys or items
+
+
+def chunks(items, size):
+    """ Split a list into lists of at most size items
+
+    :type items: list
+    :param items: List to split
+    :type size: int
+    :param size: Maximum number of items per chunk
+    :returns: generator -- Yields lists of items
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def backoff_delay(attempt, base_delay=0.05, max_delay=5):
+    """ Get the exponential backoff delay for a retry attempt
+
+    :type attempt: int
+    :param attempt: Retry attempt, starting at 0
+    :type base_delay: float
+    :param base_delay: Delay, in seconds, of the first retry
+    :type max_delay: float
+    :param max_delay: Maximum delay, in seconds
+    :returns: float -- Number of seconds to wait
+    """
+    return min(max_delay, base_delay * (2 ** attempt))
+
+
+def batch_get(
+        table, keys, consistent=False, attributes=None,
+        max_retries=MAX_RETRIES):
+    """ Fetch items in BatchGetItem requests of up to 100 keys
+
+    Keys that DynamoDB returns as UnprocessedKeys are retried with
+    exponential backoff.
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type keys: list
+    :param keys: List of key dicts; [{'hash_key': 'x', 'range_key': 'y'}]
+    :type consistent: bool
+    :param consistent: Use strongly consistent reads
+    :type attributes: list
+    :param attributes: List of attributes to fetch, all attributes if None
+    :type max_retries: int
+    :param max_retries: Number of retries of unprocessed keys
+    :returns: list -- List of boto.dynamodb2.items.Item
+    """
+    request = {}
+    if consistent:
+        request['ConsistentRead'] = True
+    if attributes is not None:
+        request['AttributesToGet'] = attributes
+
+    items = []
+    for chunk in chunks(keys, BATCH_GET_SIZE):
+        raw_keys = [
+            {
+                key: table._dynamizer.encode(value)
+                for key, value in key_data.items()
+            }
+            for key_data in chunk
+        ]
+
+        attempt = 0
+        while raw_keys:
+            response = table.connection.batch_get_item({
+                table.table_name: dict(request, Keys=raw_keys)
+            })
+
+            for raw_item in response['Responses'].get(table.table_name, []):
+                item = Item(table)
+                item.load({'Item': raw_item})
+                items.append(item)
+
+            raw_keys = response.get('UnprocessedKeys', {}).get(
+                table.table_name, {}).get('Keys', [])
+
+            if raw_keys:
+                if attempt >= max_retries:
+                    raise UnprocessedKeysException
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+
+    return items
+
+
+class BatchWriter(object):
+    """ Context manager writing options with BatchWriteItem requests
+
+    Options are buffered and written in requests of up to 25 items. Items
+    that DynamoDB returns as UnprocessedItems are retried with exponential
+    backoff. The outcome of each option is available in ``results`` and
+    the errors of options that were not written in ``errors``.
+    """
+
+    errors = None           # Dict with {'option': exception}
+    results = None          # Dict with {'option': bool}
+    _written = None         # Options written since the last flush
+
+    def __init__(
+            self, table, store_name, store_key, option_key,
+            version_key=None, max_retries=MAX_RETRIES, callback=None):
+        """ Constructor for the BatchWriter
+
+        :type table: boto.dynamodb2.table.Table
+        :param table: Table instance
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :type store_key: str
+        :param store_key: Key name for the store in DynamoDB
+        :type option_key: str
+        :param option_key: Key name for the option in DynamoDB
+        :type version_key: str
+        :param version_key: Key name for the version in DynamoDB, if versioned
+        :type max_retries: int
+        :param max_retries: Number of retries of unprocessed items
+        :type callback: callable
+        :param callback: Called by flush() with a list of the options
+            written since the previous flush
+        :returns: None
+        """
+        self.errors = {}
+        self.results = {}
+
+        self._callback = callback
+        self._max_retries = max_retries
+        self._option_key = option_key
+        self._pending = OrderedDict()
+        self._store_key = store_key
+        self._store_name = store_name
+        self._table = table
+        self._version_key = version_key
+        self._written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def set(self, option, data):
+        """ Queue an upsert of a config item
+
+        Setting the same option twice before it is written replaces the
+        queued data, as DynamoDB does not accept duplicate keys in a batch.
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type data: dict
+        :param data: Dictionary with all option data
+        :returns: None
+        """
+        data = dict(data)
+        data[self._store_key] = self._store_name
+        data[self._option_key] = option
+        data.pop(self._version_key, None)
+
+        self._pending.pop(option, None)
+        self._pending[option] = data
+
+        if len(self._pending) >= BATCH_WRITE_SIZE:
+            self._write_pending()
+
+    def flush(self):
+        """ Write all queued options to DynamoDB
+
+        The callback is called once, with all options written since the
+        previous flush.
+
+        :returns: dict -- Dictionary with {'option': bool}
+        """
+        self._write_pending()
+
+        written, self._written = self._written, []
+        if written and self._callback:
+            self._callback(written)
+
+        return self.results
+
+    def _write_pending(self):
+        """ Write all queued options in chunks
+
+        :returns: None
+        """
+        while self._pending:
+            chunk = OrderedDict()
+            while self._pending and len(chunk) < BATCH_WRITE_SIZE:
+                option, data = self._pending.popitem(last=False)
+                chunk[option] = data
+
+            self._write(chunk)
+
+    def _stamp(self, requests):
+        """ Version the items of a request with a newly taken version
+
+        Retried items are stamped again, readers only allow a write a short
+        time after its version has been taken.
+
+        :type requests: OrderedDict
+        :param requests: Ordered dict with {'option': request}
+        :returns: None
+        """
+        version = self._table._dynamizer.encode(next_version(
+            self._table,
+            self._store_name,
+            self._store_key,
+            self._option_key,
+            self._version_key))
+
+        for request in requests.values():
+            request['PutRequest']['Item'][self._version_key] = version
+
+    def _write(self, chunk):
+        """ Write a chunk of options, retrying unprocessed items
+
+        :type chunk: OrderedDict
+        :param chunk: Ordered dict with {'option': data}
+        :returns: None
+        """
+        requests = OrderedDict()
+        for option, data in chunk.items():
+            requests[option] = {
+                'PutRequest': {
+                    'Item': Item(self._table, data=data).prepare_full()
+                }
+            }
+
+        attempt = 0
+        while requests:
+            try:
+                if self._version_key:
+                    self._stamp(requests)
+
+                response = self._table.connection.batch_write_item({
+                    self._table.table_name: list(requests.values())
+                })
+            except (BotoClientError, BotoServerError, CircuitOpenException,
+                    HTTPException, socket.error) as error:
+                for option in requests.keys():
+                    self.results[option] = False
+                    self.errors[option] = error
+                return
+
+            unprocessed = OrderedDict()
+            for request in response.get('UnprocessedItems', {}).get(
+                    self._table.table_name, []):
+                raw_option = request['PutRequest']['Item'][self._option_key]
+                option = self._table._dynamizer.decode(raw_option)
+                unprocessed[option] = request
+
+            written = [
+                option for option in requests.keys()
+                if option not in unprocessed
+            ]
+            for option in written:
+                self.results[option] = True
+            self._written.extend(written)
+
+            requests = unprocessed
+            if requests:
+                if attempt >= self._max_retries:
+                    for option in requests.keys():
+                        self.results[option] = False
+                        self.errors[option] = UnprocessedItemsException(
+                            'Option {} was not processed after {} '
+                            'retries'.format(option, self._max_retries))
+                    return
+
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
@@ -0,0 +1,123 @@
+""" Circuit breaker for requests towards DynamoDB
+
+After a number of consecutive failures the circuit opens and requests fail
+right away with a CircuitOpenException, instead of waiting for DynamoDB. After
+reset_timeout seconds the circuit is half-open and one probe request is let
+through. If it succeeds the circuit is closed again, otherwise it stays open
+for another reset_timeout seconds.
+"""
+import threading
+import time
+
+from dynamodb_config_store.exceptions import CircuitOpenException
+from dynamodb_config_store.retry import is_retryable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """ Circuit breaker
+
+    Only errors that indicate that DynamoDB is unavailable or overloaded
+    (throttling, server and connection errors, see retry.is_retryable) count
+    as failures. Other errors, e.g. validation errors, close the circuit like
+    successful requests do.
+    """
+
+    _failures = 0           # Number of consecutive failures
+    _failure_threshold = 5  # Failures before the circuit opens
+    _lock = None            # threading.Lock protecting the state
+    _opened = None          # Time the circuit was opened
+    _probing = False        # True while a half-open probe is in flight
+    _reset_timeout = 30     # Seconds before a probe is let through
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """ Constructor for the CircuitBreaker
+
+        :type failure_threshold: int
+        :param failure_threshold: Consecutive failures before the circuit
+            opens
+        :type reset_timeout: float
+        :param reset_timeout: Seconds the circuit stays open before a probe
+            request is let through
+        :returns: None
+        """
+        self._failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self._reset_timeout = reset_timeout
+
+    @property
+    def state(self):
+        """ Current state of the circuit
+
+        :returns: str -- 'closed', 'open' or 'half-open'
+        """
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        """ Current state of the circuit, the lock must be held
+
+        :returns: str -- 'closed', 'open' or 'half-open'
+        """
+        if self._opened is None:
+            return CLOSED
+
+        if time.time() - self._opened >= self._reset_timeout:
+            return HALF_OPEN
+
+        return OPEN
+
+    def call(self, method, *args, **kwargs):
+        """ Call a method through the circuit breaker
+
+        A dynamodb_config_store.exceptions.CircuitOpenException will be thrown
+        if the circuit is open.
+
+        :type method: callable
+        :param method: Method to call
+        :returns: The return value of the method
+        """
+        with self._lock:
+            state = self._state()
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                raise CircuitOpenException
+
+            if state == HALF_OPEN:
+                self._probing = True
+
+        try:
+            result = method(*args, **kwargs)
+        except Exception as error:
+            if is_retryable(error):
+                self._record_failure()
+            else:
+                self._record_success()
+            raise
+
+        self._record_success()
+        return result
+
+    def _record_success(self):
+        """ Close the circuit
+
+        :returns: None
+        """
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def _record_failure(self):
+        """ Count a failure and open the circuit if needed
+
+        :returns: None
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._failure_threshold:
+                self._opened = time.time()
+
+            self._probing = False
@@ -0,0 +1,197 @@
+""" Compact option values
+
+By default each option is held as a dict of its own. A dict has a large fixed
+overhead, and a store with many options repeats the same key names in every
+one of them. A CompactOption only holds a tuple with its values. The key
+names are interned and kept in a shape that is shared by all options with
+the same keys, so a store with a handful of schema shapes holds a handful of
+key tables. The most recently used shapes are kept for reuse, up to
+MAX_SHAPES; options keep their shape when it is evicted.
+
+CompactOptions are read-only mappings; they can be shared between callers
+without copying them. Maps, lists and sets in the values are made read-only
+as well, see freeze(). Enable them with compact=True on the config stores:
+::
+
+    store = DynamoDBConfigStore(
+        connection, 'conf', 'features',
+        config_store='TimeBasedConfigStore',
+        config_store_kwargs={'compact': True})
+"""
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    from sys import intern
+except ImportError:
+    # intern is a builtin in Python 2
+    pass
+
+try:
+    from types import MappingProxyType as frozen_mapping
+except ImportError:
+    # Python 2 has no read-only mapping type, fall back to a plain dict
+    frozen_mapping = dict
+
+# Maximum number of shapes kept for reuse
+MAX_SHAPES = 1024
+
+# Shapes kept for reuse, the least recently used first
+_shapes = OrderedDict()  # Ordered dict with {key names: _Shape}
+_shapes_lock = threading.Lock()
+
+
+class _Shape(object):
+    """ Key table shared by all options with the same keys """
+
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        """ Constructor for the _Shape
+
+        :type names: tuple
+        :param names: Sorted key names
+        :returns: None
+        """
+        self.names = names
+        self.index = dict((name, i) for i, name in enumerate(names))
+
+
+def _intern(name):
+    """ Intern a key name
+
+    :type name: str
+    :param name: Key name
+    :returns: str -- The interned name, or name if it can not be interned
+    """
+    if type(name) is str:
+        return intern(name)
+
+    return name
+
+
+def _get_shape(names):
+    """ Get the shared shape for a set of key names
+
+    :type names: tuple
+    :param names: Sorted key names
+    :returns: _Shape
+    """
+    with _shapes_lock:
+        shape = _shapes.pop(names, None)
+        if shape is None:
+            shape = _Shape(tuple(_intern(name) for name in names))
+
+        _shapes[shape.names] = shape
+        while len(_shapes) > MAX_SHAPES:
+            _shapes.popitem(last=False)
+
+    return shape
+
+
+def freeze(value):
+    """ Make a value read-only, including the values it holds
+
+    Dicts are converted to read-only mappings, lists and tuples to tuples and
+    sets to frozensets. Other values are returned as they are.
+
+    :type value: object
+    :param value: Value to freeze
+    :returns: object -- Read-only value
+    """
+    if isinstance(value, dict):
+        return frozen_mapping(
+            dict((key, freeze(item)) for key, item in value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+
+    if isinstance(value, set):
+        return frozenset(value)
+
+    return value
+
+
+def shape_count():
+    """ Get the number of key tables kept for reuse
+
+    :returns: int -- Number of shapes, at most MAX_SHAPES
+    """
+    return len(_shapes)
+
+
+class CompactOption(Mapping):
+    """ Read-only mapping with the keys and values of an option
+
+    Compares equal to a dict with the same keys and values.
+    """
+
+    __slots__ = ('_shape', '_values')
+
+    def __init__(self, data=()):
+        """ Constructor for the CompactOption
+
+        :type data: dict or iterable
+        :param data: Mapping or iterable of (key, value) pairs with unique
+            keys
+        :returns: None
+        """
+        if hasattr(data, 'keys'):
+            pairs = sorted(
+                ((key, data[key]) for key in data.keys()), key=itemgetter(0))
+        else:
+            pairs = sorted(data, key=itemgetter(0))
+
+        self._shape = _get_shape(tuple(key for key, _ in pairs))
+        self._values = tuple(freeze(value) for _, value in pairs)
+
+        if len(self._shape.index) != len(self._values):
+            raise ValueError('Duplicate keys in option')
+
+    def __getitem__(self, key):
+        """ Get the value of a key
+
+        :type key: str
+        :param key: Key name
+        :returns: object -- The value, raises KeyError if there is no key
+        """
+        return self._values[self._shape.index[key]]
+
+    def __contains__(self, key):
+        """ Check if the option has a key
+
+        :type key: str
+        :param key: Key name
+        :returns: bool -- True if the option has the key
+        """
+        return key in self._shape.index
+
+    def __iter__(self):
+        """ Iterate over the key names, in sorted order
+
+        :returns: iterator
+        """
+        return iter(self._shape.names)
+
+    def __len__(self):
+        """ Get the number of keys
+
+        :returns: int -- Number of keys
+        """
+        return len(self._values)
+
+    def __repr__(self):
+        return 'CompactOption({!r})'.format(dict(self.items()))
+
+    def __reduce__(self):
+        """ Support pickling and copying despite the slots
+
+        :returns: tuple -- Callable and arguments to recreate the option
+        """
+        return (self.__class__, (list(zip(self._shape.names, self._values)),))
@@ -1,24 +1,124 @@
 """ Config Store base class """
+from boto.dynamodb2.exceptions import ItemNotFound
+
+from dynamodb_config_store.compact import freeze, frozen_mapping
+
+
+def _freeze(options):
+    """ Make options and their data read-only
+
+    Maps, lists and sets in the data are made read-only as well. CompactOptions
+    and option data frozen by a previous snapshot are already read-only, and
+    are shared as they are.
+
+    :type options: dict
+    :param options: Dict with {'option': {'key': 'value'}}
+    :returns: dict -- Read-only dict with {'option': {'key': 'value'}}
+    """
+    return frozen_mapping({
+        option: freeze(data) if isinstance(data, dict) else data
+        for option, data in options.items()
+    })
 
 
 class ConfigStore(object):
-    """ Base class for config stores """
+    """ Base class for config stores
 
-    _attributes = []        # List of set instance attributes
+    Config stores that keep the options in memory publish them as a snapshot;
+    a read-only mapping with {'option': {'key': 'value'}}. A new snapshot is
+    published by replacing the reference, so readers always see a complete
+    and consistent set of options without taking any locks.
 
-    def _delete_instance_attributes(self):
-        """ Delete all the instance attributes
+    The options in the snapshot are exposed as instance attributes. The
+    data of each option is read-only as well, down to the maps, lists and
+    sets in its values, as it is shared by all readers.
 
-        :returns: None
+    If the store has a schema, the snapshot holds the decoded options, and
+    the options as read from DynamoDB are kept in the raw snapshot, see
+    dynamodb_config_store.decoding.
+    """
+
+    _raw_snapshot = frozen_mapping({})  # Current options, before decoding
+    _schema = None          # Schema decoding the options, if any
+    _snapshot = frozen_mapping({})  # Current snapshot of all options
+
+    def __getattr__(self, name):
+        """ Look up options in the snapshot
+
+        Only called if name is not a regular attribute.
+
+        :type name: str
+        :param name: Name of the configuration option
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
         """
-        for attr in self._attributes:
-            delattr(self, attr)
+        try:
+            return self._snapshot[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _publish(self, options):
+        """ Publish a new snapshot
 
-    def _set_instance_attributes(self, options):
-        """ Set instance attributes
+        The options dict is owned by the snapshot after this call and must
+        not be modified.
 
         :type options: dict
         :param options: Dict with {'option': {'key': 'value'}}
         :returns: None
         """
-        [setattr(self, key, options[key]) for key in options.keys()]
+        self._raw_snapshot, self._snapshot = self._decode_snapshot(
+            options, self._raw_snapshot, self._snapshot)
+
+    def _decode_snapshot(self, options, raw_snapshot, snapshot):
+        """ Decode options to publish
+
+        Options that have not changed since the previous snapshot are not
+        decoded again.
+
+        :type options: dict
+        :param options: Dict with {'option': {'key': 'value'}}, as read
+        :type raw_snapshot: dict
+        :param raw_snapshot: Previous snapshot, as read
+        :type snapshot: dict
+        :param snapshot: Previous snapshot, as decoded
+        :returns: tuple -- Read-only (raw snapshot, snapshot), the same
+            mapping twice if the store has no schema
+        """
+        options = _freeze(options)
+        if self._schema is None:
+            return options, options
+
+        decoded = self._schema.decode_options(options, raw_snapshot, snapshot)
+        return options, _freeze(decoded)
+
+    def get(self, option=None, keys=None):
+        """ Get a config item from the current snapshot
+
+        An boto.dynamodb2.exceptions.ItemNotFound will be thrown if the config
+        option does not exist.
+
+        :type option: str
+        :param option: Name of the configuration option, all options if None
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        # Take one reference, the snapshot may be replaced while we read
+        snapshot = self._snapshot
+
+        if not option:
+            return snapshot
+
+        try:
+            item = snapshot[option]
+        except KeyError:
+            raise ItemNotFound('Option {} not found'.format(option))
+
+        if keys:
+            return {
+                key: value
+                for key, value in item.items()
+                if key in keys
+            }
+        else:
+            return item
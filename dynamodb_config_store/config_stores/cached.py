@@ -0,0 +1,393 @@
+""" Cached config store
+
+This config store keeps recently read options in a bounded in-process cache
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from boto.dynamodb2.exceptions import ItemNotFound
+
+from dynamodb_config_store.config_stores.simple import SimpleConfigStore
+
+logger = logging.getLogger(__name__)
+
+
+class CachedConfigStore(SimpleConfigStore):
+    """ SimpleConfigStore with a read-through LRU/TTL cache
+
+    Options are read from DynamoDB the first time they are requested and are
+    then served from memory until they expire (``ttl``) or are evicted as the
+    least recently used entry when the cache grows beyond ``max_size``.
+
+    A read with consistent=True skips the cache, and refreshes the cache
+    with the strongly consistent result.
+
+    With a ``stale_ttl`` expired entries are served for up to stale_ttl more
+    seconds while they are refreshed in the background, so reads of cached
+    options never wait for DynamoDB.
+
+    Reads that were sent to DynamoDB before an option was invalidated, e.g.
+    by a write through the DynamoDBConfigStore, are not cached, so that the
+    cache does not keep serving the value from before the write.
+    """
+
+    _cache = None           # OrderedDict with {'option': (expires, data)}
+    _generation = 0         # Number of invalidations, see _cache_set
+    _hits = 0               # Number of reads served from the cache
+    _instrumentation = None  # Callable receiving cache events, or None
+    _lock = None            # threading.Lock protecting the cache
+    _max_size = 1000        # Maximum number of cached entries
+    _misses = 0             # Number of reads sent to DynamoDB
+    _revalidating = None    # Set of cache keys being refreshed
+    _stale_hits = 0         # Number of expired entries served
+    _stale_ttl = 0          # Time, in seconds, expired entries are served
+    _ttl = 60               # Time, in seconds, an entry is kept in the cache
+
+    # Cache key used for the full store, as returned by get()
+    _ALL_OPTIONS = None
+
+    def __init__(
+            self, table, store_name, store_key, option_key,
+            ttl=60, max_size=1000, version_key=None, snapshot_file=None,
+            consistent_read=False, stale_ttl=0, single_flight=False,
+            batch_window=None, instrumentation=None, compact=False,
+            schema=None):
+        """ Constructor for the CachedConfigStore
+
+        :type table: boto.dynamodb2.table.Table
+        :param table: Table instance
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :type store_key: str
+        :param store_key: Key name for the store in DynamoDB. Default _store
+        :type option_key: str
+        :param option_key: Key name for the option in DynamoDB. Default _option
+        :type ttl: int
+        :param ttl: Time, in seconds, to keep an entry in the cache
+        :type max_size: int
+        :param max_size: Maximum number of entries to keep in the cache
+        :type version_key: str
+        :param version_key: Key name for the version in DynamoDB, if versioned
+        :type snapshot_file: str
+        :param snapshot_file: Path to a local snapshot file to write the full
+            store to
+        :type consistent_read: bool
+        :param consistent_read: Use strongly consistent reads on cache misses
+        :type stale_ttl: int
+        :param stale_ttl: Time, in seconds, to serve an expired entry while it
+            is refreshed in the background. Disabled if 0
+        :type single_flight: bool
+        :param single_flight: Let concurrent cache misses for the same option
+            share one request
+        :type batch_window: float
+        :param batch_window: Seconds to collect concurrent cache misses into
+            one BatchGetItem request. Disabled if None
+        :type instrumentation: callable
+        :param instrumentation: Callable receiving an event for every cache
+            lookup, see dynamodb_config_store.instrumentation
+        :type compact: bool
+        :param compact: Return options as read-only CompactOptions
+        :type schema: dynamodb_config_store.decoding.Schema or dict
+        :param schema: Types of the option values. Options are cached
+            decoded
+        :returns: None
+        """
+        super(CachedConfigStore, self).__init__(
+            table, store_name, store_key, option_key,
+            version_key=version_key, snapshot_file=snapshot_file,
+            consistent_read=consistent_read, single_flight=single_flight,
+            batch_window=batch_window, compact=compact, schema=schema)
+
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+
+        self._cache = OrderedDict()
+        self._hits = 0
+        self._instrumentation = instrumentation
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._misses = 0
+        self._revalidating = set()
+        self._stale_hits = 0
+        self._stale_ttl = stale_ttl
+        self._ttl = ttl
+
+    def _cache_get(self, key):
+        """ Look up an entry in the cache
+
+        Expired entries are removed and treated as misses, unless they are
+        within the stale_ttl. Those are returned and refreshed in the
+        background.
+
+        :type key: str
+        :param key: Cache key, the option name or _ALL_OPTIONS
+        :returns: dict or None -- Cached data or None on a miss
+        """
+        data = None
+        stale = False
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires, cached = entry
+                now = time.time()
+                if expires + self._stale_ttl > now:
+                    # Mark the entry as the most recently used
+                    del self._cache[key]
+                    self._cache[key] = entry
+                    self._hits += 1
+                    data = cached
+
+                    if expires <= now:
+                        stale = True
+                        self._stale_hits += 1
+                        self._start_revalidation(key)
+                else:
+                    del self._cache[key]
+
+            if data is None:
+                self._misses += 1
+
+        if self._instrumentation is not None:
+            self._instrumentation({
+                'type': 'cache',
+                'store': self._store_name,
+                'option': key,
+                'hit': data is not None,
+                'stale': stale
+            })
+
+        return data
+
+    def _start_revalidation(self, key):
+        """ Refresh an entry in the background, the lock must be held
+
+        :type key: str
+        :param key: Cache key, the option name or _ALL_OPTIONS
+        :returns: None
+        """
+        if key in self._revalidating:
+            return
+
+        self._revalidating.add(key)
+
+        thread = threading.Thread(target=self._revalidate, args=(key,))
+        thread.daemon = True
+        thread.start()
+
+    def _revalidate(self, key):
+        """ Refresh an entry from DynamoDB
+
+        The stale entry is kept if DynamoDB can not be read.
+
+        :type key: str
+        :param key: Cache key, the option name or _ALL_OPTIONS
+        :returns: None
+        """
+        generation = self._generation
+        try:
+            if key is self._ALL_OPTIONS:
+                data = super(CachedConfigStore, self).get()
+            else:
+                data = super(CachedConfigStore, self).get_option(key)
+
+            self._cache_set(key, data, generation)
+        except ItemNotFound:
+            self.invalidate(key)
+        except Exception:
+            logger.warning(
+                'Could not refresh option %s of store %s',
+                key, self._store_name, exc_info=True)
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _cache_set(self, key, data, generation=None):
+        """ Add an entry to the cache, evicting the least recently used
+
+        :type key: str
+        :param key: Cache key, the option name or _ALL_OPTIONS
+        :type data: dict
+        :param data: Data to cache
+        :type generation: int
+        :param generation: Invalidation generation from before the data was
+            read. The data is not cached if the cache has been invalidated
+            since
+        :returns: None
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            if key in self._cache:
+                del self._cache[key]
+
+            self._cache[key] = (time.time() + self._ttl, data)
+
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def cache_info(self):
+        """ Get cache statistics
+
+        :returns: dict -- {'hits', 'misses', 'hit_rate', 'stale_hits',
+            'size', 'max_size'}
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': float(self._hits) / total if total else 0.0,
+                'stale_hits': self._stale_hits,
+                'size': len(self._cache),
+                'max_size': self._max_size
+            }
+
+    def get(self, option=None, keys=None, consistent=None):
+        """ Get a config item
+
+        A query towards DynamoDB will only be executed if the item is not
+        found in the cache or if the cached item has expired.
+
+        :type option: str
+        :param option: Name of the configuration option, all options if None
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Skip the cache and use a strongly consistent read
+            if True
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        if option:
+            return self.get_option(option, keys=keys, consistent=consistent)
+
+        items = None
+        if not consistent:
+            items = self._cache_get(self._ALL_OPTIONS)
+
+        if items is None:
+            generation = self._generation
+            items = super(CachedConfigStore, self).get(consistent=consistent)
+            self._cache_set(self._ALL_OPTIONS, items, generation)
+
+        if keys:
+            return {
+                option: {
+                    key: value
+                    for key, value in data.items()
+                    if key in keys
+                }
+                for option, data in items.items()
+            }
+        else:
+            return {
+                option: self._copy(data) for option, data in items.items()
+            }
+
+    def get_option(self, option, keys=None, consistent=None):
+        """ Get a specific option from the store.
+
+        The full option is cached, so requests for different subsets of keys
+        are served by the same cache entry.
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Skip the cache and use a strongly consistent read
+            if True
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        item = None
+        if not consistent:
+            item = self._cache_get(option)
+
+        if item is None:
+            generation = self._generation
+            item = super(CachedConfigStore, self).get_option(
+                option, consistent=consistent)
+            self._cache_set(option, item, generation)
+
+        if keys:
+            return {
+                key: value
+                for key, value in item.items()
+                if key in keys
+            }
+        else:
+            return self._copy(item)
+
+    def get_many(self, options, keys=None, consistent=None):
+        """ Get a list of options from the store.
+
+        Cached options are served from memory, the rest are fetched with
+        BatchGetItem requests and added to the cache.
+
+        :type options: list
+        :param options: List of configuration option names
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Skip the cache and use strongly consistent reads
+            if True
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        items = {}
+        missing = []
+        for option in set(options):
+            item = None
+            if not consistent:
+                item = self._cache_get(option)
+
+            if item is None:
+                missing.append(option)
+            else:
+                items[option] = item
+
+        if missing:
+            generation = self._generation
+            fetched = super(CachedConfigStore, self).get_many(
+                missing, consistent=consistent)
+            for option, item in fetched.items():
+                self._cache_set(option, item, generation)
+                items[option] = item
+
+        if keys:
+            return {
+                option: {
+                    key: value
+                    for key, value in item.items()
+                    if key in keys
+                }
+                for option, item in items.items()
+            }
+        else:
+            return {
+                option: self._copy(item) for option, item in items.items()
+            }
+
+    def invalidate(self, option):
+        """ Remove an option from the cache
+
+        The full store entry is removed as well, as it contains the option.
+
+        :type option: str
+        :param option: Name of the configuration option
+        :returns: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(option, None)
+            self._cache.pop(self._ALL_OPTIONS, None)
+
+    def invalidate_all(self):
+        """ Remove all entries from the cache
+
+        :returns: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
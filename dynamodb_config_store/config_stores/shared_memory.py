@@ -0,0 +1,421 @@
+""" Shared memory config store
+
+This config store shares one copy of the configuration between all processes
+on a host. One process refreshes the configuration and publishes it in a
+memory-mapped file, the other processes read from that file.
+
+This module requires a POSIX system.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from dynamodb_config_store.config_stores import frozen_mapping
+from dynamodb_config_store.config_stores.time_based import TimeBasedConfigStore
+from dynamodb_config_store.exceptions import DecodingException
+from dynamodb_config_store.snapshot import dumps, loads, write_snapshot
+from dynamodb_config_store.validation import VALIDATION_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# The segment starts with a header with a prefix identifying the format and
+# the store, the generation and the payload length
+_HEADER = struct.Struct('<16sQQ')
+_PREFIX = struct.Struct('<6sH8s')
+_GENERATION_OFFSET = 16
+_LENGTH_OFFSET = 24
+
+# Magic and version of the segment format
+_MAGIC = b'DCSSHM'
+_FORMAT_VERSION = 1
+
+# Seconds between checks while a write is in progress
+_WRITE_POLL = 0.001
+
+
+class _SharedSegment(object):
+    """ Memory-mapped file holding a serialized snapshot
+
+    The segment is protected by a seqlock. The writer makes the generation
+    odd while it writes and even when it is done. Readers retry if the
+    generation was odd or changed while they copied the payload. There must
+    only be one writer at a time, see try_lock.
+
+    A writer that dies during a write leaves the generation odd. Readers
+    give up waiting for that write after _READ_TIMEOUT seconds, and the next
+    writer starts from the following even generation.
+
+    A generation of 0 means that nothing has been written yet. A segment
+    left by another store, or in another format, is treated as empty until
+    it is overwritten.
+    """
+
+    _fd = None              # File descriptor of the segment file
+    _lock_fd = None         # File descriptor of the writer lock file
+    _mmap = None            # mmap.mmap of the segment file
+    _path = None            # Path to the segment file
+    _prefix = None          # Header prefix identifying the format and store
+    _stalled = None         # Odd generation of a write that never completed
+
+    # Initial size of the segment file, it is grown as needed
+    _INITIAL_SIZE = 65536
+
+    # Seconds to wait for a write in progress before giving up on it
+    _READ_TIMEOUT = 1.0
+
+    def __init__(self, path, identity):
+        """ Constructor for the _SharedSegment
+
+        :type path: str
+        :param path: Path to the segment file, e.g. in /dev/shm
+        :type identity: str
+        :param identity: Identity of the store sharing the segment
+        :returns: None
+        """
+        self._path = path
+        self._prefix = _PREFIX.pack(
+            _MAGIC,
+            _FORMAT_VERSION,
+            hashlib.sha256(identity.encode('utf-8')).digest()[:8])
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self._INITIAL_SIZE:
+                os.ftruncate(self._fd, self._INITIAL_SIZE)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._remap()
+
+    def _remap(self):
+        """ Map the whole segment file
+
+        The previous mapping is not closed, other threads may still read
+        from it. It is closed when it is garbage collected.
+
+        :returns: None
+        """
+        self._mmap = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    def generation(self):
+        """ Get the current generation
+
+        :returns: int -- Generation, 0 if nothing has been written
+        """
+        segment = self._mmap
+        if segment[:_PREFIX.size] != self._prefix:
+            return 0
+
+        return struct.unpack_from('<Q', segment, _GENERATION_OFFSET)[0]
+
+    def read(self):
+        """ Read a consistent copy of the payload
+
+        :returns: tuple -- (generation, payload), payload is None if nothing
+            has been written or a write did not complete in time
+        """
+        deadline = None
+        while True:
+            segment = self._mmap
+            prefix, generation, length = _HEADER.unpack_from(segment, 0)
+            if prefix != self._prefix:
+                return 0, None
+
+            if generation == 0 or generation == self._stalled:
+                return generation, None
+
+            if generation % 2:
+                # A write is in progress, wait for it without spinning
+                if deadline is None:
+                    deadline = time.time() + self._READ_TIMEOUT
+                elif time.time() >= deadline:
+                    self._stalled = generation
+                    return generation, None
+
+                time.sleep(_WRITE_POLL)
+                continue
+
+            if _HEADER.size + length > len(segment):
+                # The writer has grown the file
+                self._remap()
+                continue
+
+            payload = segment[_HEADER.size:_HEADER.size + length]
+            if self.generation() == generation:
+                return generation, payload
+
+    def write(self, payload):
+        """ Write a new payload
+
+        Must only be called by the process holding the writer lock.
+
+        :type payload: bytes
+        :param payload: Serialized snapshot
+        :returns: int -- The new generation
+        """
+        size = _HEADER.size + len(payload)
+        if size > len(self._mmap):
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size < size:
+                    os.ftruncate(self._fd, max(size, 2 * len(self._mmap)))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+            self._remap()
+
+        segment = self._mmap
+
+        # Skip the odd generation left by a writer that died during a write
+        generation = self.generation()
+        generation += generation % 2
+        struct.pack_into('<Q', segment, _GENERATION_OFFSET, generation + 1)
+        if segment[:_PREFIX.size] != self._prefix:
+            segment[:_PREFIX.size] = self._prefix
+
+        segment[_HEADER.size:size] = payload
+        struct.pack_into('<Q', segment, _LENGTH_OFFSET, len(payload))
+        struct.pack_into('<Q', segment, _GENERATION_OFFSET, generation + 2)
+
+        return generation + 2
+
+    def try_lock(self):
+        """ Try to become the writer of the segment
+
+        The lock is held until unlock is called or the process exits.
+
+        :returns: bool -- True if this process is the writer
+        """
+        if self._lock_fd is not None:
+            return True
+
+        lock_fd = os.open(
+            '{}.lock'.format(self._path), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            os.close(lock_fd)
+            return False
+
+        self._lock_fd = lock_fd
+        return True
+
+    def is_locked(self):
+        """ Check if this process is the writer of the segment
+
+        :returns: bool -- True if the writer lock is held
+        """
+        return self._lock_fd is not None
+
+    def unlock(self):
+        """ Give up the writer lock
+
+        :returns: None
+        """
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class SharedMemoryConfigStore(TimeBasedConfigStore):
+    """ TimeBasedConfigStore sharing its options between processes
+
+    All stores using the same path on a host share one copy of the options.
+    One of them, elected with a file lock, reads from DynamoDB like the
+    TimeBasedConfigStore does and publishes the options in a memory-mapped
+    file. If that process exits another one takes over at its next update.
+
+    Reading an option checks the generation of the shared snapshot, and the
+    snapshot is only decoded when a new generation has been published. Each
+    process decodes its own copy of the snapshot, so sharing it saves the
+    DynamoDB reads of the other processes but not their memory.
+
+    The shared file is tagged with the table, store and key names. A file
+    left by another store, or in another format, is ignored and overwritten.
+
+    The store must be created after the worker processes have been forked.
+    """
+
+    _decoded = (None, None, None)  # Last (generation, raw, decoded)
+    _fallback = frozen_mapping({})  # Options served until populated
+    _raw_fallback = frozen_mapping({})  # Fallback options, before decoding
+    _poll_interval = 0.1    # Seconds between checks until populated
+    _segment = None         # _SharedSegment with the shared snapshot
+    _writer_lock = None     # threading.Lock held while writing
+
+    def __init__(
+            self, table, store_name, store_key, option_key, path, **kwargs):
+        """ Constructor for the SharedMemoryConfigStore
+
+        Takes the same keyword arguments as the TimeBasedConfigStore, except
+        for the scheduler.
+
+        :type table: boto.dynamodb2.table.Table
+        :param table: Table instance
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :type store_key: str
+        :param store_key: Key name for the store in DynamoDB. Default _store
+        :type option_key: str
+        :param option_key: Key name for the option in DynamoDB. Default _option
+        :type path: str
+        :param path: Path to the shared file, e.g. /dev/shm/myapp-config
+        :returns: None
+        """
+        if fcntl is None:
+            raise NotImplementedError(
+                'SharedMemoryConfigStore requires a POSIX system')
+
+        if kwargs.get('scheduler') is not None:
+            raise ValueError(
+                'SharedMemoryConfigStore elects its own writer and can not '
+                'be updated by a scheduler')
+
+        self._segment = _SharedSegment(
+            path,
+            '\n'.join([table.table_name, store_name, store_key, option_key]))
+        self._writer_lock = threading.Lock()
+
+        super(SharedMemoryConfigStore, self).__init__(
+            table, store_name, store_key, option_key, **kwargs)
+
+    def _read(self):
+        """ Read the shared snapshot, decoding each generation once
+
+        :returns: tuple -- Read-only (raw snapshot, snapshot), the fallback
+            options until the shared snapshot is populated. The last good
+            copy while the shared snapshot can not be read
+        """
+        generation, raw_snapshot, snapshot = self._decoded
+        if self._segment.generation() == generation:
+            return raw_snapshot, snapshot
+
+        generation, payload = self._segment.read()
+        if payload is None:
+            if raw_snapshot is not None:
+                # Keep serving the last good copy until the next write
+                return raw_snapshot, snapshot
+
+            return self._raw_fallback, self._fallback
+
+        options = loads(payload)
+        if self._compact:
+            options = self._parse_options(options)
+
+        raw_snapshot, snapshot = self._decode_snapshot(
+            options, raw_snapshot, snapshot)
+        self._decoded = (generation, raw_snapshot, snapshot)
+        return raw_snapshot, snapshot
+
+    @property
+    def _snapshot(self):
+        """ Current snapshot of all options
+
+        :returns: dict -- Read-only dict with {'option': {'key': 'value'}}
+        """
+        return self._read()[1]
+
+    @property
+    def _raw_snapshot(self):
+        """ Current snapshot of all options, before decoding
+
+        :returns: dict -- Read-only dict with {'option': {'key': 'value'}}
+        """
+        return self._read()[0]
+
+    def _publish(self, options):
+        """ Publish options to serve until the shared snapshot is populated
+
+        :type options: dict
+        :param options: Dict with {'option': {'key': 'value'}}
+        :returns: None
+        """
+        self._raw_fallback, self._fallback = self._decode_snapshot(
+            options, self._raw_fallback, self._fallback)
+
+    def _run(self):
+        """ Run periodic fetcher
+
+        Only the writer reads from DynamoDB, the other processes check if
+        they can take over on each update.
+
+        :returns: None
+        """
+        failures = 0
+        while not self._closed.is_set():
+            try:
+                with self._writer_lock:
+                    if not self._closed.is_set() and self._segment.try_lock():
+                        self._update()
+            except Exception:
+                failures += 1
+                logger.exception(
+                    'Could not update store %s', self._store_name)
+            else:
+                failures = 0
+
+            if self._segment.generation():
+                self._populated = True
+                self._populated_event.set()
+
+            if failures:
+                interval = self._retry_interval(failures)
+            elif self._populated:
+                interval = self._next_interval()
+            else:
+                interval = self._poll_interval
+
+            self._closed.wait(interval)
+
+    def _update(self):
+        """ Read options from DynamoDB and write them to the shared file
+
+        :returns: None
+        """
+        try:
+            options = self._fetch_options()
+        except VALIDATION_ERRORS as error:
+            self._population_failed(error)
+            raise
+
+        if options is None:
+            return
+
+        # Options that can not be decoded are not shared with the readers
+        if self._schema is not None:
+            try:
+                self._decode_snapshot(options, *self._read())
+            except DecodingException:
+                self._reset_versions()
+                raise
+
+        self._segment.write(dumps(options))
+
+        if self._snapshot_file is not None:
+            write_snapshot(self._snapshot_file, options)
+
+    def is_writer(self):
+        """ Check if this store updates the shared snapshot
+
+        :returns: bool -- True if this store reads from DynamoDB
+        """
+        return self._segment.is_locked()
+
+    def close(self):
+        """ Stop updating and give up the writer lock
+
+        :returns: None
+        """
+        super(SharedMemoryConfigStore, self).close()
+        with self._writer_lock:
+            self._segment.unlock()
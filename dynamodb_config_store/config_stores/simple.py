@@ -1,22 +1,58 @@
 """ The Simple Config Store implementation """
+import functools
+
 from boto.dynamodb2.exceptions import ItemNotFound
 
+from dynamodb_config_store.batch import batch_get
+from dynamodb_config_store.compact import CompactOption
 from dynamodb_config_store.config_stores import ConfigStore
+from dynamodb_config_store.decoding import Schema
+from dynamodb_config_store.single_flight import BatchCoalescer, SingleFlight
+from dynamodb_config_store.snapshot import write_snapshot
 
 
 class SimpleConfigStore(ConfigStore):
     """ SimpleConfigStore fetching configuration directly from DynamoDB
 
     This config store will always poll for the latest changes from DynamoDB.
+
+    Reads are eventually consistent unless consistent_read is set. The
+    default can be overridden per call with the consistent parameter.
+
+    If a snapshot_file is given, the full store is written to it each time it
+    is read with get(). The file can be used to warm start a
+    TimeBasedConfigStore.
+
+    With single_flight concurrent get_option calls for the same option share
+    one request. With a batch_window, get_option calls for different options
+    made within the window are fetched with one BatchGetItem request.
+
+    With compact options are returned as read-only CompactOptions instead of
+    dicts, see dynamodb_config_store.compact.
+
+    If a schema is given, the option values are decoded as they are read,
+    see dynamodb_config_store.decoding. Snapshot files hold the values as
+    read from DynamoDB.
     """
 
+    _coalescer = None       # BatchCoalescer for get_option, if enabled
+    _compact = False        # Return options as CompactOptions
+    _consistent_read = False  # Use strongly consistent reads by default
     _option_key = None      # Option key in DynamoDB
     _populated = False      # True when the first population has been done
+    _schema = None          # Schema decoding the options, if any
+    _single_flight = None   # SingleFlight for get_option, if enabled
+    _snapshot_file = None   # Path to the local snapshot file, if any
     _store_key = None       # Store key in DynamoDB
     _store_name = None      # Name of the Store
     _table = None           # boto.dynamodb2.table.Table
+    _version_key = None     # Version key in DynamoDB, None if not versioned
 
-    def __init__(self, table, store_name, store_key, option_key):
+    def __init__(
+            self, table, store_name, store_key, option_key,
+            version_key=None, snapshot_file=None, consistent_read=False,
+            single_flight=False, batch_window=None, compact=False,
+            schema=None):
         """ Constructor for the SimpleConfigStore
 
         :type table: boto.dynamodb2.table.Table
@@ -27,18 +63,140 @@ class SimpleConfigStore(ConfigStore):
         :param store_key: Key name for the store in DynamoDB. Default _store
         :type option_key: str
         :param option_key: Key name for the option in DynamoDB. Default _option
+        :type version_key: str
+        :param version_key: Key name for the version in DynamoDB, if versioned
+        :type snapshot_file: str
+        :param snapshot_file: Path to a local snapshot file to write the full
+            store to
+        :type consistent_read: bool
+        :param consistent_read: Use strongly consistent reads by default
+        :type single_flight: bool
+        :param single_flight: Let concurrent reads of the same option share
+            one request
+        :type batch_window: float
+        :param batch_window: Seconds to collect concurrent reads of options
+            into one BatchGetItem request. Disabled if None
+        :type compact: bool
+        :param compact: Return options as read-only CompactOptions
+        :type schema: dynamodb_config_store.decoding.Schema or dict
+        :param schema: Types of the option values, as a Schema or a dict
+            with {'option': {'key': type}}
         :returns: None
         """
+        if schema is not None and not isinstance(schema, Schema):
+            schema = Schema(schema)
+
+        self._compact = compact
+        self._consistent_read = consistent_read
         self._option_key = option_key
+        self._schema = schema
+        self._snapshot_file = snapshot_file
         self._store_key = store_key
         self._store_name = store_name
         self._table = table
+        self._version_key = version_key
+
+        if single_flight:
+            self._single_flight = SingleFlight()
+
+        if batch_window is not None:
+            # Bypass get_many of subclasses, e.g. the cache lookups
+            self._coalescer = BatchCoalescer(
+                functools.partial(SimpleConfigStore.get_many, self),
+                window=batch_window)
+
+    def _attributes(self, keys):
+        """ Get the attributes to read from DynamoDB for a subset of keys
+
+        The store and option keys are always read, so that the item can be
+        identified.
+
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :returns: list or None -- Attribute names, None for all attributes
+        """
+        if not keys:
+            return None
+
+        metadata = [self._store_key, self._option_key]
+        return metadata + [key for key in keys if key not in metadata]
+
+    def _consistent(self, consistent):
+        """ Resolve the read consistency of a call
+
+        :type consistent: bool
+        :param consistent: Consistency requested by the caller, or None
+        :returns: bool -- True for a strongly consistent read
+        """
+        if consistent is None:
+            return self._consistent_read
+
+        return consistent
+
+    def _copy(self, item):
+        """ Copy an option that is shared with other callers
+
+        CompactOptions are read-only and are not copied.
+
+        :type item: dict
+        :param item: Dictionary with all data; {'key': 'value'}
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        if isinstance(item, CompactOption):
+            return item
+
+        return dict(item)
+
+    def _decode(self, option, data):
+        """ Decode the values of an option with the schema
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type data: dict
+        :param data: Dictionary with all data; {'key': 'value'}
+        :returns: dict -- Dictionary with the decoded data
+        """
+        if self._schema is None:
+            return data
+
+        return self._schema.decode(option, data)
+
+    def _parse_item(self, item, keys=None):
+        """ Convert an item from DynamoDB to an option dict
+
+        :type item: boto.dynamodb2.items.Item
+        :param item: Item as returned from DynamoDB
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        if self._compact:
+            metadata = (self._store_key, self._option_key, self._version_key)
+            return CompactOption(
+                (key, value)
+                for key, value in item.items()
+                if key not in metadata and (not keys or key in keys))
+
+        # Remove metadata
+        del item[self._store_key]
+        del item[self._option_key]
+        if self._version_key and self._version_key in item:
+            del item[self._version_key]
+
+        if keys:
+            return {
+                key: value
+                for key, value in item.items()
+                if key in keys
+            }
+        else:
+            return {key: value for key, value in item.items()}
 
-    def get(self, option=None, keys=None):
+    def get(self, option=None, keys=None, consistent=None):
         """ Get a config item
 
         A query towards DynamoDB will always be executed when this
-        method is called.
+        method is called. Only the requested keys are read from DynamoDB.
 
         An boto.dynamodb2.exceptions.ItemNotFound will be thrown if the config
         option does not exist.
@@ -47,35 +205,137 @@ class SimpleConfigStore(ConfigStore):
         :param option: Name of the configuration option, all options if None
         :type keys: list
         :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
         :returns: dict -- Dictionary with all data; {'key': 'value'}
         """
         if option:
-            return self.get_option(option, keys=keys)
+            return self.get_option(option, keys=keys, consistent=consistent)
 
         else:
             try:
-                items = {}
-                query = {'{}__eq'.format(self._store_key): self._store_name}
+                items = dict(self._query(
+                    {}, keys=keys, consistent=consistent, decode=False))
 
-                for item in self._table.query_2(**query):
-                    option = item[self._option_key]
+                # Only complete options belong in the snapshot file
+                if self._snapshot_file is not None and not keys:
+                    write_snapshot(self._snapshot_file, items)
 
-                    # Remove metadata
-                    del item[self._store_key]
-                    del item[self._option_key]
-
-                    items[option] = {k: v for k, v in item.items()}
+                if self._schema is not None:
+                    items = self._schema.decode_options(items)
 
                 return items
 
             except ItemNotFound:
                 raise
 
-    def get_option(self, option, keys=None):
+    def iter_options(
+            self, page_size=None, start_after=None, keys=None,
+            consistent=None):
+        """ Iterate over all options in the store
+
+        The options are read from DynamoDB one page at a time, as they are
+        consumed, in option name order. To resume an interrupted iteration,
+        pass the last option name seen as start_after.
+
+        :type page_size: int
+        :param page_size: Number of options to read per request. Up to 1 MB
+            per request if None
+        :type start_after: str
+        :param start_after: Only return options after this option name
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :returns: generator -- Generator of (option, {'key': 'value'}) tuples
+        """
+        conditions = {}
+        if start_after is not None:
+            conditions['{}__gt'.format(self._option_key)] = start_after
+
+        return self._query(
+            conditions, page_size=page_size, keys=keys, consistent=consistent)
+
+    def get_prefix(self, prefix, keys=None, consistent=None):
+        """ Get all options with names starting with a prefix
+
+        Only the matching options are read from DynamoDB, e.g.
+        get_prefix('db.') returns 'db.primary' and 'db.replica.1'.
+
+        :type prefix: str
+        :param prefix: Prefix of the option names
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        conditions = {'{}__beginswith'.format(self._option_key): prefix}
+
+        return dict(self._query(conditions, keys=keys, consistent=consistent))
+
+    def get_range(self, start, end, keys=None, consistent=None):
+        """ Get all options with names between start and end, inclusive
+
+        Only the matching options are read from DynamoDB. Option names are
+        compared as strings.
+
+        :type start: str
+        :param start: First option name in the range
+        :type end: str
+        :param end: Last option name in the range
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        conditions = {'{}__between'.format(self._option_key): (start, end)}
+
+        return dict(self._query(conditions, keys=keys, consistent=consistent))
+
+    def _query(
+            self, conditions, page_size=None, keys=None, consistent=None,
+            decode=True):
+        """ Query options in the store
+
+        :type conditions: dict
+        :param conditions: query_2 conditions on the option key
+        :type page_size: int
+        :param page_size: Number of options to read per request
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :type decode: bool
+        :param decode: Decode the options with the schema, if any
+        :returns: generator -- Generator of (option, {'key': 'value'}) tuples
+        """
+        query = {'{}__eq'.format(self._store_key): self._store_name}
+        query.update(conditions)
+
+        for item in self._table.query_2(
+                max_page_size=page_size,
+                consistent=self._consistent(consistent),
+                attributes=self._attributes(keys),
+                **query):
+            option = item[self._option_key]
+            data = self._parse_item(item, keys=keys)
+            if decode:
+                data = self._decode(option, data)
+
+            yield option, data
+
+    def get_option(self, option, keys=None, consistent=None):
         """ Get a specific option from the store.
 
         A query towards DynamoDB will always be executed when this
-        method is called.
+        method is called. Only the requested keys are read from DynamoDB.
 
         get_option('a') == get(option='a')
         get_option('a', keys=['b', 'c']) == get(option='a', keys=['b', 'c'])
@@ -84,27 +344,92 @@ class SimpleConfigStore(ConfigStore):
         :param option: Name of the configuration option
         :type keys: list
         :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        if self._single_flight is None:
+            return self._read_option(option, keys, consistent)
+
+        key = (option, tuple(keys or ()), self._consistent(consistent))
+        item = self._single_flight.do(
+            key, self._read_option, option, keys, consistent)
+
+        # The result is shared by all callers, give each one a copy
+        return self._copy(item)
+
+    def _read_option(self, option, keys, consistent):
+        """ Read an option from DynamoDB
+
+        Reads of whole options with the default consistency are batched if a
+        batch_window is set.
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use a strongly consistent read. Store default if
+            None
         :returns: dict -- Dictionary with all data; {'key': 'value'}
         """
+        if self._coalescer is not None and not keys and consistent is None:
+            item = self._coalescer.get(option)
+            if item is None:
+                raise ItemNotFound('Option {} not found'.format(option))
+
+            return self._copy(item)
+
         try:
             kwargs = {
                 self._store_key: self._store_name,
                 self._option_key: option
             }
 
-            item = self._table.get_item(**kwargs)
+            item = self._table.get_item(
+                consistent=self._consistent(consistent),
+                attributes=self._attributes(keys),
+                **kwargs)
 
-            del item[self._store_key]
-            del item[self._option_key]
-
-            if keys:
-                return {
-                    key: value
-                    for key, value in item.items()
-                    if key in keys
-                }
-            else:
-                return {key: value for key, value in item.items()}
+            return self._decode(option, self._parse_item(item, keys=keys))
 
         except ItemNotFound:
             raise
+
+    def get_many(self, options, keys=None, consistent=None):
+        """ Get a list of options from the store.
+
+        The options are fetched with BatchGetItem requests of up to 100
+        options each. Options that do not exist are left out of the result.
+
+        A dynamodb_config_store.exceptions.UnprocessedKeysException will be
+        thrown if DynamoDB did not process all options after retrying.
+
+        :type options: list
+        :param options: List of configuration option names
+        :type keys: list
+        :param keys: List of keys to return (used to get subsets of keys)
+        :type consistent: bool
+        :param consistent: Use strongly consistent reads. Store default if
+            None
+        :returns: dict -- Dictionary with {'option': {'key': 'value'}}
+        """
+        requested = []
+        for option in sorted(set(options)):
+            requested.append({
+                self._store_key: self._store_name,
+                self._option_key: option
+            })
+
+        items = {}
+        for item in batch_get(
+                self._table,
+                requested,
+                consistent=self._consistent(consistent),
+                attributes=self._attributes(keys)):
+            option = item[self._option_key]
+            items[option] = self._decode(
+                option, self._parse_item(item, keys=keys))
+
+        return items
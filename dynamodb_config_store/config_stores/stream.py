@@ -0,0 +1,375 @@
+""" Stream config store
+
+This config store loads the configuration once and then follows the changes
+through the DynamoDB Stream of the table
+"""
+import logging
+import threading
+
+from boto.dynamodb2.exceptions import ItemNotFound
+
+from dynamodb_config_store.config_stores import ConfigStore
+from dynamodb_config_store.exceptions import StreamNotEnabledException
+
+logger = logging.getLogger(__name__)
+
+
+def _error_code(error):
+    """ Get the error code of an exception from a streams client
+
+    Handles both botocore ClientErrors and boto JSONResponseErrors.
+
+    :type error: Exception
+    :param error: Exception raised by the streams client
+    :returns: str -- Error code, or the exception class name
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:
+        return response['Error'].get('Code')
+
+    return getattr(error, 'error_code', None) or type(error).__name__
+
+
+class StreamConfigStore(ConfigStore):
+    """ Keeps the Store up to date by tailing the table's DynamoDB Stream
+
+    The Store is read once with a query, after that INSERT, MODIFY and REMOVE
+    records for the Store are applied to the options as they arrive. The
+    stream should use the NEW_IMAGE or NEW_AND_OLD_IMAGES view type, for
+    KEYS_ONLY streams every changed option is read with a get_item.
+
+    The streams client is expected to have the same API as the boto3
+    ``dynamodbstreams`` client; describe_stream, get_shard_iterator and
+    get_records.
+
+    All internal variables and methods are private (with an leading _), as
+    the configuration options from DynamoDB will be exposed as instance
+    attributes.
+    """
+
+    _checkpoints = None     # Dict with {'shard_id': 'last sequence number'}
+    _closed = None          # threading.Event set when the store is closed
+    _finished = None        # Set of closed shard IDs that have been read
+    _iterators = None       # Dict with {'shard_id': 'shard iterator'}
+    _option_key = None      # Option key in DynamoDB
+    _poll_interval = 1      # Seconds to wait when there are no new records
+    _populated = False      # True when the first population has been done
+    _store_key = None       # Store key in DynamoDB
+    _store_name = None      # Name of the Store
+    _stream_arn = None      # ARN of the DynamoDB Stream
+    _streams = None         # DynamoDB Streams client
+    _table = None           # boto.dynamodb2.table.Table
+    _thread = None          # threading.Thread following the stream
+    _version_key = None     # Version key in DynamoDB, None if not versioned
+
+    def __init__(
+            self, table, store_name, store_key, option_key,
+            streams_connection, stream_arn=None, poll_interval=1,
+            version_key=None):
+        """ Constructor for the StreamConfigStore
+
+        :type table: boto.dynamodb2.table.Table
+        :param table: Table instance
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :type store_key: str
+        :param store_key: Key name for the store in DynamoDB. Default _store
+        :type option_key: str
+        :param option_key: Key name for the option in DynamoDB. Default _option
+        :type streams_connection: object
+        :param streams_connection: DynamoDB Streams client, e.g.
+            boto3.client('dynamodbstreams')
+        :type stream_arn: str
+        :param stream_arn: ARN of the stream. Looked up from the table if None
+        :type poll_interval: float
+        :param poll_interval: Seconds to wait when there are no new records
+        :type version_key: str
+        :param version_key: Key name for the version in DynamoDB, if versioned
+        :returns: None
+        """
+        self._checkpoints = {}
+        self._closed = threading.Event()
+        self._finished = set()
+        self._iterators = {}
+        self._option_key = option_key
+        self._poll_interval = poll_interval
+        self._store_key = store_key
+        self._store_name = store_name
+        self._streams = streams_connection
+        self._table = table
+        self._version_key = version_key
+
+        if stream_arn is None:
+            stream_arn = table.describe()[u'Table'].get(u'LatestStreamArn')
+            if not stream_arn:
+                raise StreamNotEnabledException
+
+        self._stream_arn = stream_arn
+
+        self._reload()
+
+        self._thread = threading.Thread(target=self._run, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """ Run the stream follower
+
+        Errors are logged and the stream is polled again after the poll
+        interval, the current options are served in the meantime.
+
+        :returns: None
+        """
+        while not self._closed.is_set():
+            try:
+                records_read = self._poll()
+            except Exception:
+                logger.exception(
+                    'Could not read the stream of store %s', self._store_name)
+                records_read = False
+
+            if not records_read:
+                self._closed.wait(self._poll_interval)
+
+    def close(self):
+        """ Stop following the stream
+
+        The current options are still served.
+
+        :returns: None
+        """
+        self._closed.set()
+
+    def _poll(self):
+        """ Read and apply new records from all shards
+
+        :returns: bool -- True if any records were read
+        """
+        changes = {}
+        records_read = False
+
+        for shard_id in list(self._iterators.keys()):
+            try:
+                response = self._streams.get_records(
+                    ShardIterator=self._iterators[shard_id])
+            except Exception as error:
+                if _error_code(error) != 'ExpiredIteratorException':
+                    raise
+
+                if not self._resume_shard(shard_id):
+                    self._reload()
+                    return True
+
+                continue
+
+            for record in response.get('Records', []):
+                records_read = True
+                self._read_record(record, changes)
+                self._checkpoints[shard_id] = \
+                    record['dynamodb']['SequenceNumber']
+
+            next_iterator = response.get('NextShardIterator')
+            if next_iterator:
+                self._iterators[shard_id] = next_iterator
+            else:
+                # The shard is closed, continue with its children
+                del self._iterators[shard_id]
+                self._finished.add(shard_id)
+                self._open_new_shards()
+
+        if changes:
+            options = dict(self._raw_snapshot)
+            for option, data in changes.items():
+                if data is None:
+                    options.pop(option, None)
+                else:
+                    options[option] = data
+
+            self._publish(options)
+
+        return records_read
+
+    def _read_record(self, record, changes):
+        """ Collect the change in a stream record
+
+        :type record: dict
+        :param record: Stream record
+        :type changes: dict
+        :param changes: Dict with {'option': data}, where data is None for
+            removed options
+        :returns: None
+        """
+        dynamizer = self._table._dynamizer
+        keys = record['dynamodb']['Keys']
+
+        if dynamizer.decode(keys[self._store_key]) != self._store_name:
+            return
+
+        option = dynamizer.decode(keys[self._option_key])
+
+        if record['eventName'] == 'REMOVE':
+            changes[option] = None
+        elif 'NewImage' in record['dynamodb']:
+            changes[option] = self._parse_image(
+                record['dynamodb']['NewImage'])
+        else:
+            try:
+                changes[option] = self._fetch_option(option)
+            except ItemNotFound:
+                changes[option] = None
+
+    def _parse_image(self, image):
+        """ Convert an item image from the stream to an option dict
+
+        :type image: dict
+        :param image: Item in the DynamoDB wire format
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        dynamizer = self._table._dynamizer
+        metadata = (self._store_key, self._option_key, self._version_key)
+
+        return {
+            key: dynamizer.decode(value)
+            for key, value in image.items()
+            if key not in metadata
+        }
+
+    def _fetch_option(self, option):
+        """ Read an option from DynamoDB
+
+        :type option: str
+        :param option: Name of the configuration option
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        kwargs = {
+            self._store_key: self._store_name,
+            self._option_key: option
+        }
+        item = self._table.get_item(**kwargs)
+
+        return self._parse_item(item)
+
+    def _parse_item(self, item):
+        """ Convert an item from DynamoDB to an option dict
+
+        :type item: boto.dynamodb2.items.Item
+        :param item: Item as returned from DynamoDB
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        metadata = (self._store_key, self._option_key, self._version_key)
+
+        return {k: v for k, v in item.items() if k not in metadata}
+
+    def _list_shards(self):
+        """ List all shards of the stream
+
+        :returns: list -- List of shard descriptions
+        """
+        shards = []
+        kwargs = {'StreamArn': self._stream_arn}
+
+        while True:
+            description = self._streams.describe_stream(**kwargs)
+            shards.extend(description['StreamDescription']['Shards'])
+
+            last_shard_id = description['StreamDescription'].get(
+                'LastEvaluatedShardId')
+            if not last_shard_id:
+                return shards
+
+            kwargs['ExclusiveStartShardId'] = last_shard_id
+
+    def _shard_iterator(self, shard_id, iterator_type, sequence_number=None):
+        """ Get a shard iterator
+
+        :type shard_id: str
+        :param shard_id: Shard ID
+        :type iterator_type: str
+        :param iterator_type: LATEST, TRIM_HORIZON or AFTER_SEQUENCE_NUMBER
+        :type sequence_number: str
+        :param sequence_number: Sequence number for AFTER_SEQUENCE_NUMBER
+        :returns: str -- Shard iterator
+        """
+        kwargs = {
+            'StreamArn': self._stream_arn,
+            'ShardId': shard_id,
+            'ShardIteratorType': iterator_type
+        }
+        if sequence_number is not None:
+            kwargs['SequenceNumber'] = sequence_number
+
+        return self._streams.get_shard_iterator(**kwargs)['ShardIterator']
+
+    def _open_new_shards(self):
+        """ Start reading shards that are not yet followed
+
+        New shards are read from the beginning, as they only contain records
+        written after the parent shards were closed. Closed shards are only
+        read if their parent has been read, older shards predate the Store.
+
+        :returns: None
+        """
+        for shard in self._list_shards():
+            shard_id = shard['ShardId']
+            if shard_id in self._iterators or shard_id in self._finished:
+                continue
+
+            closed = 'EndingSequenceNumber' in shard.get(
+                'SequenceNumberRange', {})
+            if closed and shard.get('ParentShardId') not in self._finished:
+                continue
+
+            self._iterators[shard_id] = self._shard_iterator(
+                shard_id, 'TRIM_HORIZON')
+
+    def _resume_shard(self, shard_id):
+        """ Get a new iterator for a shard from its checkpoint
+
+        :type shard_id: str
+        :param shard_id: Shard ID
+        :returns: bool -- True if the shard could be resumed
+        """
+        sequence_number = self._checkpoints.get(shard_id)
+        if sequence_number is None:
+            return False
+
+        try:
+            self._iterators[shard_id] = self._shard_iterator(
+                shard_id, 'AFTER_SEQUENCE_NUMBER', sequence_number)
+        except Exception as error:
+            if _error_code(error) != 'TrimmedDataAccessException':
+                raise
+            return False
+
+        return True
+
+    def _reload(self):
+        """ Read the full Store and start following the stream from now
+
+        The shard iterators are taken before the query, so no change is lost
+        between the query and the first read from the stream. Changes that
+        are read twice are harmless, as records carry the full item.
+
+        :returns: None
+        """
+        iterators = {}
+        for shard in self._list_shards():
+            if 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {}):
+                continue
+
+            iterators[shard['ShardId']] = self._shard_iterator(
+                shard['ShardId'], 'LATEST')
+
+        options = {}
+        query = {'{}__eq'.format(self._store_key): self._store_name}
+        try:
+            for item in self._table.query_2(**query):
+                options[item[self._option_key]] = self._parse_item(item)
+        except ItemNotFound:
+            pass
+
+        self._checkpoints = {}
+        self._finished = set()
+        self._iterators = iterators
+        self._publish(options)
+        self._populated = True
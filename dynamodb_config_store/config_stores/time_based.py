@@ -2,31 +2,90 @@
 
 This config store updates the configuration every x seconds
 """
+import logging
+import random
 import threading
 import time
 
 from boto.dynamodb2.exceptions import ItemNotFound
 
+from dynamodb_config_store.batch import backoff_delay
+from dynamodb_config_store.compact import CompactOption
 from dynamodb_config_store.config_stores import ConfigStore
+from dynamodb_config_store.decoding import Schema
+from dynamodb_config_store.exceptions import (
+    DecodingException,
+    PopulationTimeoutException)
+from dynamodb_config_store.snapshot import read_snapshot, write_snapshot
+from dynamodb_config_store.validation import VALIDATION_ERRORS
+from dynamodb_config_store.versioning import UNKNOWN_VERSION, get_store_version
+
+logger = logging.getLogger(__name__)
 
 
 class TimeBasedConfigStore(ConfigStore):
     """ Fetches Stores on a periodic interval from DynamoDB
 
     All internal variables and methods are private (with an leading _), as
-    the configuration options from DynamoDB will be set as instance attributes.
+    the configuration options from DynamoDB will be exposed as instance
+    attributes. Each update publishes a new snapshot of the options, see
+    ConfigStore.
+
+    If a version_key is given, the store only fetches the options that have
+    changed since the last update, and skips the update completely if the
+    store version has not changed. This requires all writes to the store to
+    be versioned, see DynamoDBConfigStore.
+
+    The update interval is randomized by +/- jitter (a fraction of the
+    interval), so that many processes started at the same time spread their
+    reads over time. Failed updates are logged and retried with exponential
+    backoff, the current options are served in the meantime.
+
+    If a snapshot_file is given, the options are written to it after each
+    update. At startup the options in the file are served right away while
+    the store is read from DynamoDB in the background.
+
+    If a scheduler is given, the store is updated by the scheduler instead
+    of by a thread of its own, see dynamodb_config_store.scheduler.
+
+    With compact the options are held as read-only CompactOptions instead of
+    dicts, which takes much less memory for stores with many options, see
+    dynamodb_config_store.compact.
+
+    If a schema is given, the option values are decoded once per update,
+    see dynamodb_config_store.decoding. An update with values that can not
+    be decoded fails, and the current options are served in the meantime.
     """
 
+    _closed = None          # threading.Event set when the store is closed
+    _compact = False        # Hold options as CompactOptions
+    _consistent_read = False  # Use strongly consistent reads
+    _full_reload_interval = 3600  # Seconds between full reads, if versioned
+    _jitter = 0.1           # Random variation of the update interval
+    _last_full_reload = None  # time.time() of the last full read
     _option_key = None      # Option key in DynamoDB
     _populated = False      # True when the first population has been done
+    _populated_event = None  # threading.Event set on the first population
+    _population_error = None  # Validation error of the first population
+    _scheduler = None       # RefreshScheduler updating the store, if any
+    _schema = None          # Schema decoding the options, if any
+    _snapshot_file = None   # Path to the local snapshot file, if any
     _store_key = None       # Store key in DynamoDB
     _store_name = None      # Name of the Store
+    _store_version = None   # Store version at the last update
     _table = None           # boto.dynamodb2.table.Table
     _update_interval = 300  # How often, in seconds, to fetch updates
+    _version_history = None  # List with (time.time(), store version) read
+    _version_key = None     # Version key in DynamoDB, None if not versioned
+    _version_overlap = 30   # Seconds a write may take after taking a version
+    _watermark = None       # Options up to this version have all been read
 
     def __init__(
             self, table, store_name, store_key, option_key,
-            update_interval=300):
+            update_interval=300, version_key=None, jitter=0.1,
+            blocking=True, timeout=None, fallback=None, snapshot_file=None,
+            consistent_read=False, scheduler=None, compact=False,
+            schema=None, full_reload_interval=3600):
         """ Constructor for the TimeBasedConfigStore
 
         :type table: boto.dynamodb2.table.Table
@@ -39,60 +98,370 @@ class TimeBasedConfigStore(ConfigStore):
         :param option_key: Key name for the option in DynamoDB. Default _option
         :type update_interval: int
         :param update_interval: How often, in seconds, to fetch updates
+        :type version_key: str
+        :param version_key: Key name for the version in DynamoDB. Enables
+            delta updates
+        :type jitter: float
+        :param jitter: Random variation of the update interval, as a fraction
+            of the interval. Default 0.1 (+/- 10%)
+        :type blocking: bool
+        :param blocking: Wait for the first population before returning
+        :type timeout: float
+        :param timeout: Maximum number of seconds to wait for the first
+            population. Wait forever if None
+        :type fallback: dict
+        :param fallback: Options, {'option': {'key': 'value'}}, to serve
+            until the first population is done
+        :type snapshot_file: str
+        :param snapshot_file: Path to a local snapshot file. Options in the
+            file are served until the first population is done, without
+            waiting for it
+        :type consistent_read: bool
+        :param consistent_read: Use strongly consistent reads. Updates are
+            eventually consistent by default, at half the read capacity
+        :type scheduler: dynamodb_config_store.scheduler.RefreshScheduler
+        :param scheduler: Scheduler to update the store with, instead of
+            starting an update thread for the store
+        :type compact: bool
+        :param compact: Hold options as read-only CompactOptions
+        :type schema: dynamodb_config_store.decoding.Schema or dict
+        :param schema: Types of the option values, as a Schema or a dict
+            with {'option': {'key': type}}
+        :type full_reload_interval: int
+        :param full_reload_interval: How often, in seconds, a versioned store
+            is read in full to drop deleted options. Never if None
         :returns: None
         """
+        if schema is not None and not isinstance(schema, Schema):
+            schema = Schema(schema)
+
+        self._closed = threading.Event()
+        self._compact = compact
+        self._consistent_read = consistent_read
+        self._full_reload_interval = full_reload_interval
+        self._jitter = jitter
         self._option_key = option_key
+        self._populated_event = threading.Event()
+        self._scheduler = scheduler
+        self._schema = schema
+        self._snapshot_file = snapshot_file
         self._store_key = store_key
         self._store_name = store_name
         self._table = table
         self._update_interval = update_interval
+        self._version_history = []
+        self._version_key = version_key
+
+        if snapshot_file is not None:
+            snapshot = read_snapshot(snapshot_file)
+            if snapshot is not None:
+                # The last known good options are newer than any fallback
+                fallback = snapshot
+                blocking = False
+
+        if fallback is not None:
+            self._publish(self._parse_options(fallback))
 
-        thread = threading.Thread(target=self._run, args=())
-        thread.daemon = True
-        thread.start()
+        if scheduler is not None:
+            scheduler.add(self)
+        else:
+            thread = threading.Thread(target=self._run, args=())
+            thread.daemon = True
+            thread.start()
 
-        while not self._populated:
-            time.sleep(0.5)
+        if blocking:
+            populated = self._populated_event.wait(timeout)
+
+            # A table that is not valid will never be populated
+            if self._population_error is not None:
+                self.close()
+                raise self._population_error
+
+            # The fallback is served if the first population is too slow
+            if not populated and fallback is None:
+                raise PopulationTimeoutException
 
     def _run(self):
         """ Run periodic fetcher
 
         :returns: None
         """
-        while True:
+        failures = 0
+        while not self._closed.is_set():
             # Get options from DynamoDB
-            options = self._fetch_options()
+            try:
+                self._refresh()
+            except Exception:
+                failures += 1
+                logger.exception(
+                    'Could not update store %s', self._store_name)
+                self._closed.wait(self._retry_interval(failures))
+                continue
+
+            failures = 0
+            self._closed.wait(self._next_interval())
+
+    def _refresh(self, store_version=UNKNOWN_VERSION):
+        """ Fetch the options from DynamoDB and publish them
+
+        :type store_version: int
+        :param store_version: Current store version, if it has already been
+            read. Only used for versioned stores
+        :returns: None
+        """
+        try:
+            options = self._fetch_options(store_version)
+        except VALIDATION_ERRORS as error:
+            self._population_failed(error)
+            raise
+
+        # Only publish a new snapshot if the store has changed
+        if options is not None:
+            try:
+                self._publish(options)
+            except DecodingException:
+                self._reset_versions()
+                raise
+
+            if self._snapshot_file is not None:
+                write_snapshot(self._snapshot_file, options)
 
-            # Delete old attributes
-            self._delete_instance_attributes()
+        self._populated = True
+        self._population_error = None
+        self._populated_event.set()
 
-            # Populate the attribute list with the new attributes
-            self._attributes = [key for key in options.keys()]
+    def _population_failed(self, error):
+        """ Stop waiting for a first population that can not succeed
 
-            # Add new attributes
-            self._set_instance_attributes(options)
+        Tables created with skip_validation are validated on the first
+        request. If the validation fails, the constructor raises the error
+        instead of waiting for the first population.
 
-            self._populated = True
+        :type error: Exception
+        :param error: Validation error
+        :returns: None
+        """
+        if not self._populated:
+            self._population_error = error
+            self._populated_event.set()
+
+    def _reset_versions(self):
+        """ Read the whole store again on the next update
+
+        Used when the options read could not be used, so that options that
+        have changed are not skipped by the next delta update.
+
+        :returns: None
+        """
+        self._store_version = UNKNOWN_VERSION
+        self._watermark = None
+
+    def _next_interval(self):
+        """ Get the number of seconds until the next update
+
+        :returns: float -- The update interval with random jitter
+        """
+        variation = random.uniform(-self._jitter, self._jitter)
+        return self._update_interval * (1 + variation)
 
-            time.sleep(self._update_interval)
+    def _retry_interval(self, failures):
+        """ Get the number of seconds until an update is retried
+
+        :type failures: int
+        :param failures: Number of consecutive failed updates
+        :returns: float -- Seconds to wait, at most the update interval
+        """
+        return backoff_delay(
+            failures - 1, base_delay=1, max_delay=self._next_interval())
+
+    def close(self):
+        """ Stop updating the store
+
+        The current options are still served.
+
+        :returns: None
+        """
+        self._closed.set()
+        if self._scheduler is not None:
+            self._scheduler.remove(self)
+
+    def wait_until_populated(self, timeout=None):
+        """ Wait for the first population of the store
+
+        :type timeout: float
+        :param timeout: Maximum number of seconds to wait, forever if None
+        :returns: bool -- True if the store has been populated
+        """
+        return self._populated_event.wait(timeout) and self._populated
 
-    def _fetch_options(self):
+    def _fetch_options(self, store_version=UNKNOWN_VERSION):
         """ Retrieve a dictionary with all options and values from DynamoDB
 
+        With versioning enabled only the options changed since the last
+        update are read and merged into the current options. The whole store
+        is read on the first update and every full_reload_interval seconds,
+        so that deleted options are dropped.
+
+        :type store_version: int
+        :param store_version: Current store version, if it has already been
+            read with a strongly consistent read. Only used for versioned
+            stores
+        :returns: dict or None -- Dict with {'option': {'key': 'value'}}, or
+            None if the store has not changed since the last update
+        """
+        if not self._version_key:
+            return self._query_options(consistent=self._consistent_read)
+
+        # The store version is always read consistently, a stale version
+        # could otherwise move the watermark past writes that are not done
+        if store_version is UNKNOWN_VERSION:
+            store_version = get_store_version(
+                self._table,
+                self._store_name,
+                self._store_key,
+                self._option_key,
+                self._version_key,
+                consistent=True)
+
+        now = time.time()
+        self._observe_version(now, store_version)
+
+        full = (
+            self._watermark is None or (
+                self._full_reload_interval is not None and
+                now - self._last_full_reload >= self._full_reload_interval))
+
+        if self._populated and not full and self._is_current(store_version):
+            return None
+
+        if full:
+            options = self._query_options(consistent=self._consistent_read)
+            self._last_full_reload = now
+        else:
+            options = dict(self._raw_snapshot)
+            options.update(self._query_options(
+                since=self._watermark, consistent=self._consistent_read))
+
+        # Writes that took a version before the watermark have completed
+        # before the query started
+        watermark = self._safe_version(now)
+        if full or watermark is not None and watermark > self._watermark:
+            self._watermark = watermark or 0
+
+        self._store_version = store_version
+        return options
+
+    def _is_current(self, store_version):
+        """ Check if all options up to a store version have been read
+
+        An eventually consistent query may miss the latest writes. Those are
+        read again by the following updates, until the watermark has caught
+        up with the store version.
+
+        :type store_version: int
+        :param store_version: Current store version, None if there is none
+        :returns: bool -- True if the update can be skipped
+        """
+        if store_version != self._store_version:
+            return False
+
+        if self._consistent_read or store_version is None:
+            return True
+
+        return self._watermark is not None and self._watermark >= store_version
+
+    def _observe_version(self, now, store_version):
+        """ Remember a store version that has been read
+
+        :type now: float
+        :param now: time.time() after the store version was read
+        :type store_version: int
+        :param store_version: Store version, None if there is none yet
+        :returns: None
+        """
+        if store_version is None:
+            return
+
+        history = self._version_history
+        history.append((now, store_version))
+
+        # Of the versions read before the overlap only the newest is needed
+        cutoff = now - self._version_overlap
+        while len(history) > 1 and history[1][0] <= cutoff:
+            history.pop(0)
+
+    def _safe_version(self, start):
+        """ Get the newest version all writes have completed for
+
+        Store versions only increase, so all writes with a version taken
+        before a store version read at least _version_overlap seconds
+        before the start of a query are visible to the query.
+
+        :type start: float
+        :param start: time.time() before the query
+        :returns: int or None -- Store version, None if none is old enough
+        """
+        version = None
+        for read_time, store_version in self._version_history:
+            if read_time > start - self._version_overlap:
+                break
+            version = store_version
+
+        return version
+
+    def _parse_item(self, item):
+        """ Convert an item from DynamoDB to an option
+
+        :type item: boto.dynamodb2.items.Item
+        :param item: Item as returned from DynamoDB
+        :returns: dict -- Dictionary with all data; {'key': 'value'}
+        """
+        metadata = (self._store_key, self._option_key, self._version_key)
+        data = (
+            (key, value)
+            for key, value in item.items()
+            if key not in metadata)
+
+        if self._compact:
+            return CompactOption(data)
+
+        return dict(data)
+
+    def _parse_options(self, options):
+        """ Convert options from a fallback or snapshot file
+
+        :type options: dict
+        :param options: Dict with {'option': {'key': 'value'}}
+        :returns: dict -- Dict with {'option': {'key': 'value'}}, owned by
+            the caller
+        """
+        if self._compact:
+            return {
+                option: CompactOption(data)
+                for option, data in options.items()
+            }
+
+        return dict(options)
+
+    def _query_options(self, since=None, consistent=False):
+        """ Query options and values from DynamoDB
+
+        :type since: int
+        :param since: Only fetch options with a newer version than this
+        :type consistent: bool
+        :param consistent: Use a strongly consistent query
         :returns: dict -- Dict with {'option': {'key': 'value'}}
         """
         try:
             items = {}
             query = {'{}__eq'.format(self._store_key): self._store_name}
+            if since is not None:
+                query['query_filter'] = {
+                    '{}__gt'.format(self._version_key): since
+                }
 
-            for item in self._table.query_2(**query):
-                option = item[self._option_key]
-
-                # Remove metadata
-                del item[self._store_key]
-                del item[self._option_key]
-
-                items[option] = {k: v for k, v in item.items()}
+            for item in self._table.query_2(consistent=consistent, **query):
+                items[item[self._option_key]] = self._parse_item(item)
 
             return items
 
@@ -0,0 +1,272 @@
+""" Typed decoding of option values
+
+boto returns values as DynamoDB types; numbers as Decimal, and anything else
+as strings, sets, lists and maps. A Schema declares the types of the keys of
+options, so that the values are converted once, when the options are read
+from DynamoDB, instead of by every caller on every read:
+::
+
+    schema = Schema({
+        'db': {'port': 'int', 'timeout': 'duration', 'ssl': 'bool'},
+        'features': {'flags': 'json'}
+    })
+
+    store = DynamoDBConfigStore(
+        connection, 'conf', 'app',
+        config_store='TimeBasedConfigStore',
+        config_store_kwargs={'schema': schema})
+
+    store.config.db['timeout']  # 30.0 if stored as '30s'
+
+The types are the names in CONVERTERS, or any callable taking the raw value.
+Keys and options that are not in the schema are returned as read.
+
+Config stores keeping a snapshot decode each update once, and reuse the
+decoded values of options that have not changed since the previous update.
+Snapshot files always hold the values as read from DynamoDB.
+"""
+import json
+import re
+from decimal import Decimal
+
+from dynamodb_config_store.compact import CompactOption
+from dynamodb_config_store.exceptions import DecodingException
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:
+    _STRING_TYPES = (str, )
+
+_TEXT_TYPE = type(u'')
+_NUMBER_TYPES = (Decimal, int, float)
+
+_TRUE = frozenset(['1', 'true', 'yes', 'on'])
+_FALSE = frozenset(['0', 'false', 'no', 'off'])
+
+# Durations are numbers of seconds, or strings such as '1h30m' or '250ms'
+_DURATION_PART = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h|d|w)\s*')
+_DURATION_UNITS = {
+    'ms': 0.001,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 604800
+}
+
+
+def _to_text(value):
+    """ Convert a value to text
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: str
+    """
+    if isinstance(value, bytes) and not isinstance(value, _TEXT_TYPE):
+        return value.decode('utf-8')
+
+    return _TEXT_TYPE(value)
+
+
+def _to_int(value):
+    """ Convert a number or a string to an integer
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: int
+    """
+    number = int(value)
+    if isinstance(value, _NUMBER_TYPES) and number != value:
+        raise ValueError('{!r} is not an integer'.format(value))
+
+    return number
+
+
+def _to_bool(value):
+    """ Convert a boolean, 0 or 1 or a string such as 'yes' to a boolean
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: bool
+    """
+    if isinstance(value, bool):
+        return value
+
+    if isinstance(value, _NUMBER_TYPES) and value in (0, 1):
+        return value == 1
+
+    if isinstance(value, _STRING_TYPES):
+        text = value.strip().lower()
+        if text in _TRUE:
+            return True
+        if text in _FALSE:
+            return False
+
+    raise ValueError('{!r} is not a boolean'.format(value))
+
+
+def _to_duration(value):
+    """ Convert a number of seconds or a string such as '1h30m' to seconds
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: float -- Number of seconds
+    """
+    if isinstance(value, _NUMBER_TYPES) and not isinstance(value, bool):
+        return float(value)
+
+    if not isinstance(value, _STRING_TYPES):
+        raise TypeError('{!r} is not a duration'.format(value))
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    seconds = 0.0
+    position = 0
+    while position < len(value):
+        match = _DURATION_PART.match(value, position)
+        if match is None:
+            raise ValueError('{!r} is not a duration'.format(value))
+
+        number, unit = match.groups()
+        seconds += float(number) * _DURATION_UNITS[unit]
+        position = match.end()
+
+    if not position:
+        raise ValueError('{!r} is not a duration'.format(value))
+
+    return seconds
+
+
+def _from_json(value):
+    """ Parse a JSON string
+
+    Maps and lists are already decoded by boto and returned as they are.
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: object -- The decoded JSON value
+    """
+    if isinstance(value, bytes) and not isinstance(value, _TEXT_TYPE):
+        value = value.decode('utf-8')
+
+    if isinstance(value, _STRING_TYPES):
+        return json.loads(value)
+
+    return value
+
+
+# Converters by type name
+CONVERTERS = {
+    'bool': _to_bool,
+    'duration': _to_duration,
+    'float': float,
+    'int': _to_int,
+    'json': _from_json,
+    'str': _to_text
+}
+
+
+class Schema(object):
+    """ Declared types of the keys of options
+
+    The schema is compiled when it is created; unknown type names raise a
+    ValueError right away instead of on the first update.
+    """
+
+    _options = None         # Dict with {'option': ((key, type, converter),)}
+
+    def __init__(self, options):
+        """ Constructor for the Schema
+
+        :type options: dict
+        :param options: Dict with {'option': {'key': type}}, where type is a
+            name in CONVERTERS or a callable converting the raw value
+        :returns: None
+        """
+        self._options = {}
+        for option, keys in options.items():
+            converters = []
+            for key, value_type in sorted(keys.items()):
+                if callable(value_type):
+                    name = getattr(value_type, '__name__', repr(value_type))
+                    converters.append((key, name, value_type))
+                elif value_type in CONVERTERS:
+                    converters.append(
+                        (key, value_type, CONVERTERS[value_type]))
+                else:
+                    raise ValueError(
+                        'Unknown type {!r} for key {} of option {}'.format(
+                            value_type, key, option))
+
+            self._options[option] = tuple(converters)
+
+    def decode(self, option, data):
+        """ Decode the values of an option
+
+        A dynamodb_config_store.exceptions.DecodingException is thrown if a
+        value can not be converted.
+
+        :type option: str
+        :param option: Name of the configuration option
+        :type data: dict
+        :param data: Dictionary with all data; {'key': 'value'}
+        :returns: dict -- Dictionary with the decoded data, data itself if
+            the option is not in the schema
+        """
+        converters = self._options.get(option)
+        if not converters:
+            return data
+
+        decoded = dict(data)
+        for key, name, converter in converters:
+            if key not in decoded:
+                continue
+
+            try:
+                decoded[key] = converter(decoded[key])
+            except Exception as error:
+                # Includes OverflowError, decimal.InvalidOperation and any
+                # error raised by a user supplied converter
+                raise DecodingException(
+                    'Could not decode {} of option {} as {}: {}'.format(
+                        key, option, name, error))
+
+        if isinstance(data, CompactOption):
+            return CompactOption(decoded)
+
+        return decoded
+
+    def decode_options(self, options, previous=None, decoded=None):
+        """ Decode the values of many options
+
+        Options that are unchanged since the previous update are not decoded
+        again; their decoded data is taken from the previous result.
+
+        :type options: dict
+        :param options: Dict with {'option': {'key': 'value'}}
+        :type previous: dict
+        :param previous: Options of the previous update, as read
+        :type decoded: dict
+        :param decoded: Options of the previous update, as decoded
+        :returns: dict -- Dict with {'option': {'key': 'value'}}, decoded
+        """
+        previous = previous or {}
+        decoded = decoded or {}
+
+        result = {}
+        for option, data in options.items():
+            if option not in self._options:
+                result[option] = data
+                continue
+
+            old = previous.get(option)
+            unchanged = old is data or (old is not None and old == data)
+            if unchanged and option in decoded:
+                result[option] = decoded[option]
+            else:
+                result[option] = self.decode(option, data)
+
+        return result
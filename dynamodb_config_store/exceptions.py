@@ -14,3 +14,33 @@ class TableNotReadyException(Exception):
 class MisconfiguredSchemaException(Exception):
     """ Exception thrown if the table does not match the configuration """
     pass
+
+
+class UnprocessedKeysException(Exception):
+    """ Exception thrown if a batch read could not process all keys """
+    pass
+
+
+class UnprocessedItemsException(Exception):
+    """ Exception recorded if a batch write could not process all items """
+    pass
+
+
+class StreamNotEnabledException(Exception):
+    """ Exception thrown if the table does not have a DynamoDB Stream """
+    pass
+
+
+class PopulationTimeoutException(Exception):
+    """ Exception thrown if a config store is not populated in time """
+    pass
+
+
+class CircuitOpenException(Exception):
+    """ Exception thrown if requests are blocked by an open circuit breaker """
+    pass
+
+
+class DecodingException(Exception):
+    """ Exception thrown if an option value does not match the schema """
+    pass
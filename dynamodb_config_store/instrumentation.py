@@ -0,0 +1,460 @@
+""" Instrumentation of DynamoDB requests and caches
+
+The InstrumentedConnection wraps a boto DynamoDBConnection and reports every
+request to a callback. The callback is called with an event dict:
+
+    {
+        'type': 'request',
+        'operation': 'get_item',    # Name of the DynamoDBConnection method
+        'kind': 'read',             # 'read', 'write' or 'control'
+        'table': 'conf',            # Table name(s), comma separated
+        'latency': 0.012,           # Seconds
+        'items': 1,                 # Items read or written
+        'capacity_units': 0.5,      # Consumed capacity, None if unknown
+        'bytes': None,              # Response size, if measure_bytes is set
+        'throttled': False,         # True if the request was throttled
+        'retries': 0,               # Throttled attempts retried by boto
+        'error': None               # Error code if the request failed
+    }
+
+The CachedConfigStore reports cache lookups with:
+
+    {
+        'type': 'cache',
+        'store': 'test',            # Store name
+        'option': 'db',             # Option name, None for the full store
+        'hit': True,
+        'stale': False              # True if an expired entry was served
+    }
+
+LoggingInstrumentation and MetricsInstrumentation are ready made callbacks.
+"""
+import json
+import logging
+import threading
+import time
+
+from dynamodb_config_store.retry import (
+    CONTROL_OPERATIONS,
+    READ_OPERATIONS,
+    WRITE_OPERATIONS,
+    consumed_capacity)
+
+logger = logging.getLogger(__name__)
+
+# Error codes of throttled requests
+THROTTLING_ERRORS = frozenset([
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException'
+])
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+def _table_name(args, kwargs):
+    """ Get the table name(s) of a request
+
+    :type args: tuple
+    :param args: Positional arguments of the request
+    :type kwargs: dict
+    :param kwargs: Keyword arguments of the request
+    :returns: str or None -- Table name(s), comma separated
+    """
+    request_items = kwargs.get('request_items')
+    if request_items is None and args and isinstance(args[0], dict):
+        request_items = args[0]
+
+    if request_items is not None:
+        return ','.join(sorted(request_items))
+
+    if 'table_name' in kwargs:
+        return kwargs['table_name']
+
+    return args[0] if args else None
+
+
+def _item_count(operation, result, args, kwargs):
+    """ Count the items read or written by a request
+
+    :type operation: str
+    :param operation: Name of the connection method
+    :type result: dict
+    :param result: Response of the request
+    :returns: int -- Number of items
+    """
+    if operation == 'get_item':
+        return 1 if result.get('Item') else 0
+
+    if operation in ('query', 'scan'):
+        return result.get('Count', 0)
+
+    if operation == 'batch_get_item':
+        return sum(len(items) for items in result.get('Responses', {}).values())
+
+    if operation == 'batch_write_item':
+        requested = kwargs.get('request_items') or args[0]
+        unprocessed = result.get('UnprocessedItems') or {}
+        return (
+            sum(len(items) for items in requested.values()) -
+            sum(len(items) for items in unprocessed.values()))
+
+    if operation in WRITE_OPERATIONS:
+        return 1
+
+    return 0
+
+
+class InstrumentedConnection(object):
+    """ DynamoDBConnection wrapper reporting every request to a callback
+
+    ReturnConsumedCapacity is requested for all table operations, so that
+    the consumed capacity can be reported. Every other attribute is passed on
+    to the wrapped connection.
+
+    boto retries throttled requests itself, up to connection.NumberRetries
+    times. Those retries are counted from the throughput_exceeded_events
+    counter of the connection. With concurrent requests on one connection
+    a retry may be reported on another request, the totals are right.
+    """
+
+    callback = None         # Callable receiving the events
+    connection = None       # Wrapped DynamoDBConnection
+    measure_bytes = False   # Report the size of the responses
+
+    def __init__(self, connection, callback, measure_bytes=False):
+        """ Constructor for the InstrumentedConnection
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to wrap
+        :type callback: callable
+        :param callback: Callable receiving the event dicts
+        :type measure_bytes: bool
+        :param measure_bytes: Report the size of the responses. The size is
+            measured by encoding the response as JSON again, which is slow
+        :returns: None
+        """
+        self.callback = callback
+        self.connection = connection
+        self.measure_bytes = measure_bytes
+
+    def __getattr__(self, name):
+        """ Wrap table operations of the connection
+
+        :type name: str
+        :param name: Attribute name
+        :returns: The attribute of the wrapped connection
+        """
+        attribute = getattr(self.connection, name)
+
+        if name in READ_OPERATIONS:
+            return self._wrap(name, 'read', attribute)
+        elif name in WRITE_OPERATIONS:
+            return self._wrap(name, 'write', attribute)
+        elif name in CONTROL_OPERATIONS:
+            return self._wrap(name, 'control', attribute)
+
+        return attribute
+
+    def _wrap(self, operation, kind, method):
+        """ Report calls of a connection method
+
+        :type operation: str
+        :param operation: Name of the connection method
+        :type kind: str
+        :param kind: 'read', 'write' or 'control'
+        :type method: callable
+        :param method: Connection method
+        :returns: callable -- Wrapped method
+        """
+        def wrapped(*args, **kwargs):
+            if kind != 'control':
+                kwargs.setdefault('return_consumed_capacity', 'TOTAL')
+
+            event = {
+                'type': 'request',
+                'operation': operation,
+                'kind': kind,
+                'table': _table_name(args, kwargs),
+                'items': 0,
+                'capacity_units': None,
+                'bytes': None,
+                'throttled': False,
+                'retries': 0,
+                'error': None
+            }
+
+            throttled = self._throttled_attempts()
+            start = time.time()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as error:
+                event['latency'] = time.time() - start
+                event['error'] = getattr(
+                    error, 'error_code', None) or type(error).__name__
+                event['throttled'] = event['error'] in THROTTLING_ERRORS
+
+                # The last throttled attempt is not retried, it is the error
+                retries = self._throttled_attempts() - throttled
+                if event['throttled']:
+                    retries -= 1
+                self._count_retries(event, retries)
+                self._emit(event)
+                raise
+
+            event['latency'] = time.time() - start
+            self._count_retries(event, self._throttled_attempts() - throttled)
+            if isinstance(result, dict):
+                event['items'] = _item_count(operation, result, args, kwargs)
+                event['capacity_units'] = consumed_capacity(result)
+                if self.measure_bytes:
+                    event['bytes'] = len(json.dumps(result))
+
+            self._emit(event)
+            return result
+
+        return wrapped
+
+    def _throttled_attempts(self):
+        """ Get the number of throttled attempts boto has seen
+
+        :returns: int -- Number of throttled attempts, 0 if not counted
+        """
+        return getattr(self.connection, 'throughput_exceeded_events', 0)
+
+    @staticmethod
+    def _count_retries(event, retries):
+        """ Add the retries made by boto to a request event
+
+        :type event: dict
+        :param event: Event dict
+        :type retries: int
+        :param retries: Number of throttled attempts retried by boto
+        :returns: None
+        """
+        if retries > 0:
+            event['retries'] = retries
+            event['throttled'] = True
+
+    def _emit(self, event):
+        """ Send an event to the callback
+
+        Errors in the callback are logged, they must not fail the request.
+
+        :type event: dict
+        :param event: Event dict
+        :returns: None
+        """
+        try:
+            self.callback(event)
+        except Exception:
+            logger.exception('Instrumentation callback failed')
+
+
+class LoggingInstrumentation(object):
+    """ Callback logging every event """
+
+    level = logging.DEBUG   # Log level of the events
+    logger = logger         # logging.Logger to log to
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """ Constructor for the LoggingInstrumentation
+
+        :type logger: logging.Logger
+        :param logger: Logger to log to. Defaults to this module's logger
+        :type level: int
+        :param level: Log level of the events
+        :returns: None
+        """
+        self.level = level
+        if logger is not None:
+            self.logger = logger
+
+    def __call__(self, event):
+        """ Log an event
+
+        :type event: dict
+        :param event: Event dict
+        :returns: None
+        """
+        if event['type'] == 'cache':
+            self.logger.log(
+                self.level, 'cache %s store=%s option=%s stale=%s',
+                'hit' if event['hit'] else 'miss',
+                event['store'], event['option'], event['stale'])
+        else:
+            self.logger.log(
+                self.level,
+                '%s table=%s latency=%.1fms items=%d capacity_units=%s '
+                'throttled=%s retries=%d error=%s',
+                event['operation'], event['table'], event['latency'] * 1000,
+                event['items'], event['capacity_units'], event['throttled'],
+                event['retries'], event['error'])
+
+
+class MetricsInstrumentation(object):
+    """ Callback keeping Prometheus style counters and histograms
+
+    The metrics can be read with snapshot() or exported in the Prometheus
+    text format with render().
+    """
+
+    prefix = 'dynamodb_config_store'  # Prefix of the metric names
+
+    def __init__(self, prefix='dynamodb_config_store'):
+        """ Constructor for the MetricsInstrumentation
+
+        :type prefix: str
+        :param prefix: Prefix of the metric names
+        :returns: None
+        """
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        """ Record an event
+
+        :type event: dict
+        :param event: Event dict
+        :returns: None
+        """
+        with self._lock:
+            if event['type'] == 'cache':
+                self._increment('cache_lookups_total', {
+                    'store': event['store'],
+                    'result': 'hit' if event['hit'] else 'miss'
+                })
+                if event['stale']:
+                    self._increment(
+                        'cache_stale_hits_total', {'store': event['store']})
+                return
+
+            labels = {'operation': event['operation']}
+            self._increment('requests_total', labels)
+            self._increment('items_total', labels, event['items'])
+            self._observe('request_latency_seconds', labels, event['latency'])
+
+            if event['capacity_units'] is not None:
+                self._increment(
+                    'consumed_capacity_units_total', labels,
+                    event['capacity_units'])
+            if event['bytes'] is not None:
+                self._increment('response_bytes_total', labels, event['bytes'])
+            if event['throttled']:
+                self._increment('throttled_requests_total', labels)
+            if event['retries']:
+                self._increment(
+                    'throttle_retries_total', labels, event['retries'])
+            if event['error'] is not None:
+                self._increment('failed_requests_total', labels)
+
+    def _increment(self, name, labels, value=1):
+        """ Increment a counter, the lock must be held """
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        """ Add a value to a histogram, the lock must be held """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0}
+            self._histograms[key] = histogram
+
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+
+        histogram['sum'] += value
+
+    def cache_hit_ratio(self, store=None):
+        """ Get the cache hit ratio
+
+        :type store: str
+        :param store: Store name, all stores if None
+        :returns: float -- Share of cache lookups that were hits
+        """
+        hits = misses = 0
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                labels = dict(labels)
+                if name != 'cache_lookups_total':
+                    continue
+                if store is not None and labels['store'] != store:
+                    continue
+
+                if labels['result'] == 'hit':
+                    hits += value
+                else:
+                    misses += value
+
+        total = hits + misses
+        return float(hits) / total if total else 0.0
+
+    def snapshot(self):
+        """ Get the current metrics
+
+        :returns: dict -- {'counters': {(name, labels): value},
+            'histograms': {(name, labels): {'buckets': [...], 'sum': s}}}
+        """
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {
+                    key: {
+                        'buckets': list(histogram['buckets']),
+                        'sum': histogram['sum']
+                    }
+                    for key, histogram in self._histograms.items()
+                }
+            }
+
+    def render(self):
+        """ Export the metrics in the Prometheus text format
+
+        :returns: str -- Metrics in the Prometheus text exposition format
+        """
+        def format_labels(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join(
+                '{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+
+        # The samples are sorted, so all samples of a metric follow its type
+        previous = None
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            if name != previous:
+                lines.append('# TYPE {}_{} counter'.format(self.prefix, name))
+                previous = name
+
+            lines.append('{}_{}{} {}'.format(
+                self.prefix, name, format_labels(labels), value))
+
+        previous = None
+        for (name, labels), histogram in sorted(
+                snapshot['histograms'].items()):
+            if name != previous:
+                lines.append(
+                    '# TYPE {}_{} histogram'.format(self.prefix, name))
+                previous = name
+
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                bucket_labels = labels + (
+                    ('le', '+Inf' if bound == float('inf') else bound),)
+                lines.append('{}_{}_bucket{} {}'.format(
+                    self.prefix, name, format_labels(bucket_labels), count))
+
+            lines.append('{}_{}_sum{} {}'.format(
+                self.prefix, name, format_labels(labels), histogram['sum']))
+            lines.append('{}_{}_count{} {}'.format(
+                self.prefix, name, format_labels(labels),
+                histogram['buckets'][-1]))
+
+        return '\n'.join(lines) + '\n'
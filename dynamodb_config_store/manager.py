@@ -0,0 +1,129 @@
+""" Many stores sharing one connection, table and update thread
+
+The ConfigStoreManager creates DynamoDBConfigStores for many stores. Each
+table is described and validated once, and all stores in a table share the
+same connection, Table and SchemaCache. TimeBasedConfigStores are updated by
+one shared RefreshScheduler instead of one thread per store:
+::
+
+    manager = ConfigStoreManager(
+        connection, config_store='TimeBasedConfigStore')
+
+    database = manager.get_store('conf', 'database')
+    features = manager.get_store('conf', 'features')
+"""
+import threading
+
+from dynamodb_config_store import DynamoDBConfigStore
+from dynamodb_config_store.config_stores.time_based import TimeBasedConfigStore
+from dynamodb_config_store.scheduler import RefreshScheduler
+from dynamodb_config_store.validation import SchemaCache
+
+
+class ConfigStoreManager(object):
+    """ Creates DynamoDBConfigStores sharing one connection
+
+    Stores are created on the first get_store() call and reused after that.
+    Stores are created without holding the lock of the manager, so a slow
+    table does not block the other get_store() calls.
+    """
+
+    connection = None       # boto.dynamodb2.layer1.DynamoDBConnection instance
+    schema_cache = None     # SchemaCache shared by the stores
+    scheduler = None        # RefreshScheduler updating TimeBasedConfigStores
+    _defaults = None        # Default keyword arguments for the stores
+    _lock = None            # threading.Lock protecting the stores and tables
+    _stores = None          # Dict with {(table, store): DynamoDBConfigStore}
+    _tables = None          # Dict with {(table, keys): Table}
+
+    def __init__(self, connection, merge_window=5, **kwargs):
+        """ Constructor for the ConfigStoreManager
+
+        Keyword arguments are passed on to each DynamoDBConfigStore, e.g.
+        config_store or retry_policy, and can be overridden per store. The
+        stores share one SchemaCache, unless a schema_cache is given.
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to use
+        :type merge_window: float
+        :param merge_window: Versioned TimeBasedConfigStores in the same
+            table that are due within this number of seconds are updated
+            together
+        :returns: None
+        """
+        self.connection = connection
+        self.schema_cache = kwargs.setdefault('schema_cache', SchemaCache())
+        self.scheduler = RefreshScheduler(merge_window=merge_window)
+        self._defaults = kwargs
+        self._lock = threading.Lock()
+        self._stores = {}
+        self._tables = {}
+
+    def get_store(self, table_name, store_name, **kwargs):
+        """ Get a store, creating it on the first call
+
+        Takes the same keyword arguments as DynamoDBConfigStore. They are
+        only used when the store is created. The connection wrappers (e.g.
+        retry_policy) are applied to the table when its first store is
+        created, and are shared by all stores in the table.
+
+        :type table_name: str
+        :param table_name: Name of the DynamoDB table to use
+        :type store_name: str
+        :param store_name: Name of the DynamoDB Config Store
+        :returns: dynamodb_config_store.DynamoDBConfigStore
+        """
+        options = dict(self._defaults)
+        options.update(kwargs)
+
+        if options.get('config_store') == 'TimeBasedConfigStore':
+            config_store_kwargs = dict(options.get('config_store_kwargs', {}))
+            config_store_kwargs.setdefault('scheduler', self.scheduler)
+            options['config_store_kwargs'] = config_store_kwargs
+
+        table_key = (
+            table_name,
+            options.get('store_key', '_store'),
+            options.get('option_key', '_option'))
+
+        with self._lock:
+            store = self._stores.get((table_name, store_name))
+            if store is not None:
+                return store
+
+            options['table'] = self._tables.get(table_key)
+
+        store = DynamoDBConfigStore(
+            self.connection, table_name, store_name, **options)
+
+        with self._lock:
+            existing = self._stores.setdefault((table_name, store_name), store)
+            self._tables.setdefault(table_key, store.table)
+
+        # Another thread has created the same store in the meantime
+        if existing is not store:
+            if isinstance(store.config, TimeBasedConfigStore):
+                store.config.close()
+
+        return existing
+
+    def stores(self):
+        """ Get all stores created by the manager
+
+        :returns: list -- List of DynamoDBConfigStore
+        """
+        with self._lock:
+            return list(self._stores.values())
+
+    def close(self):
+        """ Stop updating the stores
+
+        The stores keep serving their current options.
+
+        :returns: None
+        """
+        self.scheduler.stop()
+
+        for store in self.stores():
+            if isinstance(store.config, TimeBasedConfigStore):
+                store.config.close()
@@ -0,0 +1,807 @@
+""" In-memory DynamoDB backend
+
+MemoryConnection implements the parts of the boto DynamoDBConnection API
+that DynamoDB Config Store uses, keeping the tables in memory. It can be
+used wherever a DynamoDBConnection is expected, so the stores, the boto
+Table and the connection wrappers all run unchanged, without any network
+requests:
+::
+
+    from dynamodb_config_store import DynamoDBConfigStore
+    from dynamodb_config_store.memory import MemoryConnection
+
+    store = DynamoDBConfigStore(MemoryConnection(), 'conf', 'prod')
+
+Throttling can be simulated with throttle() or a throttle_rate, and batch
+requests can be made to leave items unprocessed with an unprocessed_rate.
+"""
+import copy
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+from boto.dynamodb2.exceptions import (
+    ConditionalCheckFailedException,
+    ProvisionedThroughputExceededException,
+    ResourceInUseException,
+    ResourceNotFoundException,
+    ValidationException)
+
+# Maximum size of an item in bytes
+MAX_ITEM_SIZE = 400 * 1024
+
+# Maximum number of keys in a BatchGetItem and items in a BatchWriteItem
+MAX_BATCH_GET = 100
+MAX_BATCH_WRITE = 25
+
+# Maximum size of a Query or Scan response page in bytes
+MAX_PAGE_SIZE = 1024 * 1024
+
+
+def _error(exception_class, error_code, message):
+    """ Create a boto exception like the ones raised for DynamoDB errors
+
+    :type exception_class: type
+    :param exception_class: boto JSONResponseError subclass
+    :type error_code: str
+    :param error_code: DynamoDB error code
+    :type message: str
+    :param message: Error message
+    :returns: boto.exception.JSONResponseError
+    """
+    return exception_class(400, 'Bad Request', {
+        '__type': 'com.amazonaws.dynamodb.v20120810#{}'.format(error_code),
+        'message': message
+    })
+
+
+def _value(attribute):
+    """ Get a comparable Python value of a DynamoDB attribute value
+
+    :type attribute: dict
+    :param attribute: Attribute value, e.g. {'N': '1'}
+    :returns: The value, with numbers as Decimal
+    """
+    (attribute_type, value), = attribute.items()
+    if attribute_type == 'N':
+        return Decimal(value)
+    if attribute_type == 'NS':
+        return frozenset(Decimal(number) for number in value)
+    if attribute_type in ('SS', 'BS'):
+        return frozenset(value)
+
+    return value
+
+
+def _item_size(item):
+    """ Approximate the size of an item the way DynamoDB counts it
+
+    :type item: dict
+    :param item: Item in the DynamoDB wire format
+    :returns: int -- Size in bytes
+    """
+    return sum(
+        len(name.encode('utf-8')) + len(json.dumps(value))
+        for name, value in item.items())
+
+
+def _matches(attribute, condition):
+    """ Check an attribute value against a key condition or filter
+
+    :type attribute: dict
+    :param attribute: Attribute value, or None if the attribute is missing
+    :type condition: dict
+    :param condition: Condition with ComparisonOperator and
+        AttributeValueList
+    :returns: bool -- True if the condition is met
+    """
+    operator = condition['ComparisonOperator']
+    values = [_value(value) for value in condition.get('AttributeValueList', [])]
+
+    if operator == 'NULL':
+        return attribute is None
+    if operator == 'NOT_NULL':
+        return attribute is not None
+    if attribute is None:
+        return False
+
+    value = _value(attribute)
+    if operator == 'EQ':
+        return value == values[0]
+    if operator == 'NE':
+        return value != values[0]
+    if operator == 'LT':
+        return value < values[0]
+    if operator == 'LE':
+        return value <= values[0]
+    if operator == 'GT':
+        return value > values[0]
+    if operator == 'GE':
+        return value >= values[0]
+    if operator == 'BEGINS_WITH':
+        return value.startswith(values[0])
+    if operator == 'BETWEEN':
+        return values[0] <= value <= values[1]
+    if operator == 'IN':
+        return value in values
+    if operator == 'CONTAINS':
+        return values[0] in value
+    if operator == 'NOT_CONTAINS':
+        return values[0] not in value
+
+    raise _error(
+        ValidationException, 'ValidationException',
+        'Unsupported comparison operator {}'.format(operator))
+
+
+def _project(item, attributes_to_get):
+    """ Copy an item, keeping only the requested attributes
+
+    :type item: dict
+    :param item: Item in the DynamoDB wire format
+    :type attributes_to_get: list
+    :param attributes_to_get: Attribute names, None for all attributes
+    :returns: dict -- Copy of the item
+    """
+    if attributes_to_get:
+        item = {
+            name: value for name, value in item.items()
+            if name in attributes_to_get
+        }
+
+    return copy.deepcopy(item)
+
+
+class _MemoryTable(object):
+    """ A table kept in memory """
+
+    def __init__(self, description, ready_at):
+        self.description = description
+        self.items = {}
+        self.ready_at = ready_at
+
+    @property
+    def key_names(self):
+        """ Names of the hash key and, if any, the range key """
+        return [key['AttributeName'] for key in self.description['KeySchema']]
+
+    def key(self, item):
+        """ Get the primary key of an item
+
+        A ValidationException is raised if the key is missing.
+        """
+        try:
+            return tuple(_value(item[name]) for name in self.key_names)
+        except KeyError:
+            raise _error(
+                ValidationException, 'ValidationException',
+                'The provided key element does not match the schema')
+
+
+class MemoryConnection(object):
+    """ In-memory stand-in for boto.dynamodb2.layer1.DynamoDBConnection
+
+    All tables are kept in memory and are lost when the connection is
+    garbage collected. Requests are thread safe.
+    """
+
+    host = 'memory'         # Endpoint name, unique per instance
+    port = None             # Used to identify the endpoint
+    is_secure = False       # Used to identify the endpoint
+    NumberRetries = 0       # No retries are made by the connection itself
+
+    calls = None            # Dict with {'operation': number of calls}
+    create_delay = 0        # Seconds a new table is in the CREATING state
+    throttle_rate = 0       # Share of requests that are throttled
+    unprocessed_rate = 0    # Share of batch items left unprocessed
+    _lock = None            # threading.RLock protecting the tables
+    _random = None          # random.Random for the simulated errors
+    _tables = None          # Dict with {'table_name': _MemoryTable}
+    _throttled = None       # List of (count, operations) to throttle
+
+    def __init__(
+            self, throttle_rate=0, unprocessed_rate=0, create_delay=0,
+            seed=None):
+        """ Constructor for the MemoryConnection
+
+        :type throttle_rate: float
+        :param throttle_rate: Share of requests, 0 to 1, that fail with a
+            ProvisionedThroughputExceededException
+        :type unprocessed_rate: float
+        :param unprocessed_rate: Share of items in batch requests, 0 to 1,
+            that are returned as unprocessed
+        :type create_delay: float
+        :param create_delay: Seconds a new table stays in the CREATING state
+        :type seed: int
+        :param seed: Seed for the random simulated errors
+        :returns: None
+        """
+        self.calls = {}
+        self.create_delay = create_delay
+        self.host = 'memory-{}'.format(id(self))
+        self.throttle_rate = throttle_rate
+        self.unprocessed_rate = unprocessed_rate
+        self._lock = threading.RLock()
+        self._random = random.Random(seed)
+        self._tables = {}
+        self._throttled = []
+
+    def throttle(self, count=1, operations=None):
+        """ Throttle the next requests
+
+        :type count: int
+        :param count: Number of requests to throttle
+        :type operations: list
+        :param operations: Operation names, e.g. ['get_item'], to throttle.
+            All table operations if None
+        :returns: None
+        """
+        with self._lock:
+            self._throttled.append(
+                [count, frozenset(operations) if operations else None])
+
+    def _request(self, operation, throttled=True):
+        """ Count a request and simulate throttling
+
+        :type operation: str
+        :param operation: Name of the operation
+        :type throttled: bool
+        :param throttled: False for operations that are never throttled
+        :returns: None
+        """
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+            if not throttled:
+                return
+
+            for entry in self._throttled:
+                count, operations = entry
+                if operations is None or operation in operations:
+                    entry[0] -= 1
+                    if entry[0] <= 0:
+                        self._throttled.remove(entry)
+                    break
+            else:
+                if (not self.throttle_rate or
+                        self._random.random() >= self.throttle_rate):
+                    return
+
+        raise _error(
+            ProvisionedThroughputExceededException,
+            'ProvisionedThroughputExceededException',
+            'The level of configured provisioned throughput for the table '
+            'was exceeded')
+
+    def _unprocessed(self, requests):
+        """ Split batch requests into processed and unprocessed ones
+
+        :type requests: list
+        :param requests: Keys or write requests
+        :returns: tuple -- (processed, unprocessed)
+        """
+        if not self.unprocessed_rate:
+            return requests, []
+
+        processed = []
+        unprocessed = []
+        with self._lock:
+            for request in requests:
+                if self._random.random() < self.unprocessed_rate:
+                    unprocessed.append(request)
+                else:
+                    processed.append(request)
+
+        return processed, unprocessed
+
+    def _table(self, table_name):
+        """ Get a table
+
+        :type table_name: str
+        :param table_name: Name of the table
+        :returns: _MemoryTable
+        """
+        table = self._tables.get(table_name)
+        if table is None:
+            raise _error(
+                ResourceNotFoundException, 'ResourceNotFoundException',
+                'Requested resource not found: Table: {} not found'.format(
+                    table_name))
+
+        return table
+
+    def _active_table(self, table_name):
+        """ Get a table that can be read from and written to
+
+        :type table_name: str
+        :param table_name: Name of the table
+        :returns: _MemoryTable
+        """
+        table = self._table(table_name)
+        if time.time() < table.ready_at:
+            raise _error(
+                ResourceNotFoundException, 'ResourceNotFoundException',
+                'Requested resource not found')
+
+        return table
+
+    @staticmethod
+    def _capacity(table_name, units, return_consumed_capacity):
+        """ Get the ConsumedCapacity of a response
+
+        :returns: dict -- Response fields with the consumed capacity
+        """
+        if return_consumed_capacity in (None, 'NONE'):
+            return {}
+
+        return {
+            'ConsumedCapacity': {
+                'TableName': table_name,
+                'CapacityUnits': units
+            }
+        }
+
+    @staticmethod
+    def _read_units(items, consistent_read):
+        """ Get the read capacity units of reading items
+
+        :type items: list
+        :param items: Items read, summed up like a Query does
+        :type consistent_read: bool
+        :param consistent_read: True for strongly consistent reads
+        :returns: float -- Read capacity units
+        """
+        size = sum(_item_size(item) for item in items)
+        units = max(1, -(-size // 4096))
+        return float(units) if consistent_read else units / 2.0
+
+    def _check_expected(self, item, expected):
+        """ Check the expected values of a conditional write
+
+        :type item: dict
+        :param item: Current item, or None
+        :type expected: dict
+        :param expected: Expected attribute values
+        :returns: None
+        """
+        for name, condition in (expected or {}).items():
+            attribute = item.get(name) if item is not None else None
+
+            if 'ComparisonOperator' in condition:
+                met = _matches(attribute, condition)
+            elif condition.get('Exists', True) is False:
+                met = attribute is None
+            else:
+                met = (
+                    attribute is not None and
+                    _value(attribute) == _value(condition['Value']))
+
+            if not met:
+                raise _error(
+                    ConditionalCheckFailedException,
+                    'ConditionalCheckFailedException',
+                    'The conditional request failed')
+
+    def create_table(
+            self, attribute_definitions, table_name, key_schema,
+            provisioned_throughput, local_secondary_indexes=None,
+            global_secondary_indexes=None, **kwargs):
+        """ Create a table """
+        self._request('create_table', throttled=False)
+
+        with self._lock:
+            if table_name in self._tables:
+                raise _error(
+                    ResourceInUseException, 'ResourceInUseException',
+                    'Table already exists: {}'.format(table_name))
+
+            description = {
+                'AttributeDefinitions': copy.deepcopy(attribute_definitions),
+                'CreationDateTime': time.time(),
+                'KeySchema': copy.deepcopy(key_schema),
+                'ProvisionedThroughput': {
+                    'NumberOfDecreasesToday': 0,
+                    'ReadCapacityUnits':
+                        provisioned_throughput['ReadCapacityUnits'],
+                    'WriteCapacityUnits':
+                        provisioned_throughput['WriteCapacityUnits']
+                },
+                'TableName': table_name
+            }
+            table = _MemoryTable(description, time.time() + self.create_delay)
+            self._tables[table_name] = table
+
+            return {'TableDescription': self._describe(table)}
+
+    def describe_table(self, table_name):
+        """ Describe a table """
+        self._request('describe_table', throttled=False)
+
+        with self._lock:
+            return {'Table': self._describe(self._table(table_name))}
+
+    @staticmethod
+    def _describe(table):
+        """ Get the description of a table
+
+        :type table: _MemoryTable
+        :param table: Table to describe
+        :returns: dict -- Table description
+        """
+        description = copy.deepcopy(table.description)
+        description['ItemCount'] = len(table.items)
+        description['TableSizeBytes'] = sum(
+            _item_size(item) for item in table.items.values())
+        if time.time() < table.ready_at:
+            description['TableStatus'] = 'CREATING'
+        else:
+            description['TableStatus'] = 'ACTIVE'
+
+        return description
+
+    def delete_table(self, table_name):
+        """ Delete a table """
+        self._request('delete_table', throttled=False)
+
+        with self._lock:
+            description = self._describe(self._table(table_name))
+            description['TableStatus'] = 'DELETING'
+            del self._tables[table_name]
+
+        return {'TableDescription': description}
+
+    def update_table(
+            self, table_name, provisioned_throughput=None, **kwargs):
+        """ Update the provisioned throughput of a table """
+        self._request('update_table', throttled=False)
+
+        with self._lock:
+            table = self._table(table_name)
+            if provisioned_throughput is not None:
+                table.description['ProvisionedThroughput'].update(
+                    provisioned_throughput)
+
+            return {'TableDescription': self._describe(table)}
+
+    def list_tables(self, exclusive_start_table_name=None, limit=None):
+        """ List the tables """
+        self._request('list_tables', throttled=False)
+
+        with self._lock:
+            names = sorted(self._tables)
+
+        if exclusive_start_table_name is not None:
+            names = [
+                name for name in names if name > exclusive_start_table_name]
+
+        response = {}
+        if limit is not None and len(names) > limit:
+            names = names[:limit]
+            response['LastEvaluatedTableName'] = names[-1]
+
+        response['TableNames'] = names
+        return response
+
+    def get_item(
+            self, table_name, key, attributes_to_get=None,
+            consistent_read=None, return_consumed_capacity=None, **kwargs):
+        """ Get an item """
+        self._request('get_item')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            item = table.items.get(table.key(key))
+            response = self._capacity(
+                table_name,
+                self._read_units([item] if item else [], consistent_read),
+                return_consumed_capacity)
+
+            if item is not None:
+                response['Item'] = _project(item, attributes_to_get)
+
+        return response
+
+    def put_item(
+            self, table_name, item, expected=None, return_values=None,
+            return_consumed_capacity=None, **kwargs):
+        """ Put an item """
+        self._request('put_item')
+
+        size = _item_size(item)
+        if size > MAX_ITEM_SIZE:
+            raise _error(
+                ValidationException, 'ValidationException',
+                'Item size has exceeded the maximum allowed size')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            key = table.key(item)
+            old = table.items.get(key)
+            self._check_expected(old, expected)
+            table.items[key] = copy.deepcopy(item)
+
+        response = self._capacity(
+            table_name, float(max(1, -(-size // 1024))),
+            return_consumed_capacity)
+        if return_values == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+
+        return response
+
+    def update_item(
+            self, table_name, key, attribute_updates=None, expected=None,
+            return_values=None, return_consumed_capacity=None, **kwargs):
+        """ Update an item with PUT, ADD and DELETE attribute updates """
+        self._request('update_item')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            item_key = table.key(key)
+            old = table.items.get(item_key)
+            self._check_expected(old, expected)
+
+            item = copy.deepcopy(old) if old is not None else copy.deepcopy(key)
+            for name, update in (attribute_updates or {}).items():
+                action = update.get('Action', 'PUT')
+                if action == 'PUT':
+                    item[name] = copy.deepcopy(update['Value'])
+                elif action == 'DELETE':
+                    item.pop(name, None)
+                elif action == 'ADD':
+                    current = item.get(name, {'N': '0'})
+                    item[name] = {'N': str(
+                        Decimal(current['N']) +
+                        Decimal(update['Value']['N']))}
+
+            table.items[item_key] = item
+
+        response = self._capacity(
+            table_name, float(max(1, -(-_item_size(item) // 1024))),
+            return_consumed_capacity)
+        if return_values in ('ALL_NEW', 'UPDATED_NEW'):
+            response['Attributes'] = copy.deepcopy(item)
+        elif return_values in ('ALL_OLD', 'UPDATED_OLD') and old is not None:
+            response['Attributes'] = old
+
+        return response
+
+    def delete_item(
+            self, table_name, key, expected=None, return_values=None,
+            return_consumed_capacity=None, **kwargs):
+        """ Delete an item """
+        self._request('delete_item')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            item_key = table.key(key)
+            old = table.items.get(item_key)
+            self._check_expected(old, expected)
+            table.items.pop(item_key, None)
+
+        response = self._capacity(table_name, 1.0, return_consumed_capacity)
+        if return_values == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+
+        return response
+
+    def _page(
+            self, table, items, limit, exclusive_start_key, reverse=False):
+        """ Get a page of items, sorted by their primary key
+
+        :returns: tuple -- (items, last_evaluated_key)
+        """
+        items = sorted(
+            items, key=lambda item: table.key(item), reverse=reverse)
+
+        if exclusive_start_key:
+            start = table.key(exclusive_start_key)
+            if reverse:
+                items = [item for item in items if table.key(item) < start]
+            else:
+                items = [item for item in items if table.key(item) > start]
+
+        page = []
+        size = 0
+        for item in items:
+            if limit is not None and len(page) >= limit:
+                break
+            if size >= MAX_PAGE_SIZE:
+                break
+
+            page.append(item)
+            size += _item_size(item)
+
+        last_evaluated_key = None
+        if len(page) < len(items):
+            last_evaluated_key = {
+                name: copy.deepcopy(page[-1][name])
+                for name in table.key_names
+            }
+
+        return page, last_evaluated_key
+
+    def query(
+            self, table_name, key_conditions, index_name=None, select=None,
+            attributes_to_get=None, limit=None, consistent_read=None,
+            query_filter=None, conditional_operator=None,
+            scan_index_forward=None, exclusive_start_key=None,
+            return_consumed_capacity=None, **kwargs):
+        """ Query a table, secondary indexes are not supported """
+        self._request('query')
+
+        if index_name is not None:
+            raise _error(
+                ValidationException, 'ValidationException',
+                'Secondary indexes are not supported by the MemoryConnection')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            items = [
+                item for item in table.items.values()
+                if all(
+                    _matches(item.get(name), condition)
+                    for name, condition in key_conditions.items())
+            ]
+            page, last_evaluated_key = self._page(
+                table, items, limit, exclusive_start_key,
+                reverse=scan_index_forward is False)
+
+            response = self._filter(
+                page, query_filter, conditional_operator, attributes_to_get,
+                select)
+
+        response.update(self._capacity(
+            table_name, self._read_units(page, consistent_read),
+            return_consumed_capacity))
+        if last_evaluated_key is not None:
+            response['LastEvaluatedKey'] = last_evaluated_key
+
+        return response
+
+    def scan(
+            self, table_name, attributes_to_get=None, limit=None,
+            select=None, scan_filter=None, conditional_operator=None,
+            exclusive_start_key=None, return_consumed_capacity=None,
+            **kwargs):
+        """ Scan a table, parallel scans are not supported """
+        self._request('scan')
+
+        with self._lock:
+            table = self._active_table(table_name)
+            page, last_evaluated_key = self._page(
+                table, list(table.items.values()), limit,
+                exclusive_start_key)
+
+            response = self._filter(
+                page, scan_filter, conditional_operator, attributes_to_get,
+                select)
+
+        response.update(self._capacity(
+            table_name, self._read_units(page, False),
+            return_consumed_capacity))
+        if last_evaluated_key is not None:
+            response['LastEvaluatedKey'] = last_evaluated_key
+
+        return response
+
+    @staticmethod
+    def _filter(items, conditions, conditional_operator, attributes_to_get,
+                select):
+        """ Filter and project a page of items
+
+        :returns: dict -- Response with Items, Count and ScannedCount
+        """
+        if conditions:
+            combine = any if conditional_operator == 'OR' else all
+            matched = [
+                item for item in items
+                if combine(
+                    _matches(item.get(name), condition)
+                    for name, condition in conditions.items())
+            ]
+        else:
+            matched = items
+
+        response = {'Count': len(matched), 'ScannedCount': len(items)}
+        if select != 'COUNT':
+            response['Items'] = [
+                _project(item, attributes_to_get) for item in matched]
+
+        return response
+
+    def batch_get_item(self, request_items, return_consumed_capacity=None):
+        """ Get items from one or more tables """
+        self._request('batch_get_item')
+
+        if sum(len(request['Keys'])
+               for request in request_items.values()) > MAX_BATCH_GET:
+            raise _error(
+                ValidationException, 'ValidationException',
+                'Too many items requested for the BatchGetItem call')
+
+        responses = {}
+        unprocessed_keys = {}
+        consumed = []
+        with self._lock:
+            for table_name, request in request_items.items():
+                table = self._active_table(table_name)
+                keys, unprocessed = self._unprocessed(request['Keys'])
+                if unprocessed:
+                    unprocessed_keys[table_name] = dict(
+                        request, Keys=unprocessed)
+
+                items = []
+                for key in keys:
+                    item = table.items.get(table.key(key))
+                    if item is not None:
+                        items.append(_project(
+                            item, request.get('AttributesToGet')))
+
+                responses[table_name] = items
+                consumed.append(self._capacity(
+                    table_name,
+                    sum(self._read_units(
+                        [item], request.get('ConsistentRead'))
+                        for item in items),
+                    return_consumed_capacity).get('ConsumedCapacity'))
+
+        response = {
+            'Responses': responses,
+            'UnprocessedKeys': unprocessed_keys
+        }
+        if return_consumed_capacity not in (None, 'NONE'):
+            response['ConsumedCapacity'] = consumed
+
+        return response
+
+    def batch_write_item(
+            self, request_items, return_consumed_capacity=None,
+            return_item_collection_metrics=None):
+        """ Put or delete items in one or more tables """
+        self._request('batch_write_item')
+
+        if sum(len(requests)
+               for requests in request_items.values()) > MAX_BATCH_WRITE:
+            raise _error(
+                ValidationException, 'ValidationException',
+                'Too many items requested for the BatchWriteItem call')
+
+        for requests in request_items.values():
+            for request in requests:
+                if 'PutRequest' in request and _item_size(
+                        request['PutRequest']['Item']) > MAX_ITEM_SIZE:
+                    raise _error(
+                        ValidationException, 'ValidationException',
+                        'Item size has exceeded the maximum allowed size')
+
+        unprocessed_items = {}
+        consumed = []
+        with self._lock:
+            for table_name, requests in request_items.items():
+                table = self._active_table(table_name)
+                requests, unprocessed = self._unprocessed(requests)
+                if unprocessed:
+                    unprocessed_items[table_name] = unprocessed
+
+                units = 0.0
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        table.items[table.key(item)] = copy.deepcopy(item)
+                        units += max(1, -(-_item_size(item) // 1024))
+                    else:
+                        table.items.pop(
+                            table.key(request['DeleteRequest']['Key']), None)
+                        units += 1
+
+                consumed.append(self._capacity(
+                    table_name, units,
+                    return_consumed_capacity).get('ConsumedCapacity'))
+
+        response = {'UnprocessedItems': unprocessed_items}
+        if return_consumed_capacity not in (None, 'NONE'):
+            response['ConsumedCapacity'] = consumed
+
+        return response
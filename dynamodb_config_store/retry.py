@@ -0,0 +1,404 @@
+""" Retries and client-side rate limiting of DynamoDB requests
+
+The RetryingConnection wraps a boto DynamoDBConnection. Throttled and failed
+requests are retried according to a RetryPolicy, and requests can be rate
+limited with a TokenBucket per direction (reads and writes), so that a fleet
+of processes stays within the provisioned capacity of the table instead of
+being throttled. A CircuitBreaker, see circuit_breaker, can stop requests
+while DynamoDB is unavailable.
+"""
+import random
+import socket
+import threading
+import time
+
+from boto.exception import JSONResponseError
+
+# Error codes of requests that may succeed if they are retried
+RETRYABLE_ERRORS = frozenset([
+    'InternalFailure',
+    'InternalServerError',
+    'LimitExceededException',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ServiceUnavailable',
+    'ThrottlingException'
+])
+
+# Connection methods reading from and writing to tables
+READ_OPERATIONS = frozenset([
+    'batch_get_item',
+    'get_item',
+    'query',
+    'scan'
+])
+WRITE_OPERATIONS = frozenset([
+    'batch_write_item',
+    'delete_item',
+    'put_item',
+    'update_item'
+])
+
+# Connection methods managing tables
+CONTROL_OPERATIONS = frozenset([
+    'create_table',
+    'delete_table',
+    'describe_table',
+    'update_table'
+])
+
+
+def is_retryable(error):
+    """ Check if a failed request may succeed if it is retried
+
+    :type error: Exception
+    :param error: Exception raised by the request
+    :returns: bool -- True if the request should be retried
+    """
+    if isinstance(error, JSONResponseError):
+        if getattr(error, 'error_code', None) in RETRYABLE_ERRORS:
+            return True
+
+        return error.status is not None and error.status >= 500
+
+    return isinstance(error, (socket.error, socket.timeout))
+
+
+class RetryBudget(object):
+    """ Limits retries to a fraction of all requests
+
+    Each request deposits ``ratio`` tokens and each retry withdraws one. When
+    the budget is empty, failed requests are not retried. This stops retries
+    from multiplying the load when DynamoDB is already overloaded.
+    """
+
+    _lock = None            # threading.Lock protecting the tokens
+    _max_tokens = 10        # Maximum number of tokens
+    _ratio = 0.1            # Tokens deposited per request
+    _tokens = 10            # Number of retries that can be made right now
+
+    def __init__(self, ratio=0.1, max_tokens=10):
+        """ Constructor for the RetryBudget
+
+        :type ratio: float
+        :param ratio: Retries allowed per request, e.g. 0.1 for 10%
+        :type max_tokens: int
+        :param max_tokens: Maximum number of retries that can be saved up
+        :returns: None
+        """
+        self._lock = threading.Lock()
+        self._max_tokens = max_tokens
+        self._ratio = ratio
+        self._tokens = max_tokens
+
+    def deposit(self):
+        """ Record a request
+
+        :returns: None
+        """
+        with self._lock:
+            self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self):
+        """ Try to make a retry
+
+        :returns: bool -- True if the retry is within the budget
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    """ Exponential backoff with full jitter
+
+    Retry n waits a random time between 0 and min(max_delay,
+    base_delay * 2 ** n) seconds, which spreads the retries of many clients
+    over time.
+    """
+
+    base_delay = 0.05       # Maximum delay, in seconds, of the first retry
+    budget = None           # RetryBudget, or None for unlimited retries
+    max_attempts = 5        # Maximum number of attempts, including the first
+    max_delay = 5           # Maximum delay, in seconds, of any retry
+
+    def __init__(
+            self, max_attempts=5, base_delay=0.05, max_delay=5, budget=None):
+        """ Constructor for the RetryPolicy
+
+        :type max_attempts: int
+        :param max_attempts: Maximum number of attempts, including the first
+        :type base_delay: float
+        :param base_delay: Maximum delay, in seconds, of the first retry
+        :type max_delay: float
+        :param max_delay: Maximum delay, in seconds, of any retry
+        :type budget: dynamodb_config_store.retry.RetryBudget
+        :param budget: Budget shared by all requests, None for no budget
+        :returns: None
+        """
+        self.base_delay = base_delay
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """ Get the delay before a retry
+
+        :type attempt: int
+        :param attempt: Retry attempt, starting at 0
+        :returns: float -- Number of seconds to wait
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, method, *args, **kwargs):
+        """ Call a method, retrying retryable errors
+
+        :type method: callable
+        :param method: Method to call
+        :returns: The return value of the method
+        """
+        if self.budget is not None:
+            self.budget.deposit()
+
+        attempt = 0
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except Exception as error:
+                attempt += 1
+                if attempt >= self.max_attempts or not is_retryable(error):
+                    raise
+
+                if self.budget is not None and not self.budget.withdraw():
+                    raise
+
+            time.sleep(self.delay(attempt - 1))
+
+
+def consumed_capacity(response):
+    """ Sum the consumed capacity of a response
+
+    :type response: dict
+    :param response: Response of a request with ReturnConsumedCapacity
+    :returns: float or None -- Consumed capacity units, None if not returned
+    """
+    consumed = response.get('ConsumedCapacity')
+    if consumed is None:
+        return None
+
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+
+    return sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+
+
+class TokenBucket(object):
+    """ Token bucket rate limiter
+
+    Tokens are added at ``rate`` per second, up to ``capacity``. Each request
+    takes a token and waits until one is available. The capacity units a
+    request consumed beyond that token are charged when its response has
+    been read, and later requests wait until that debt is paid off.
+    """
+
+    _capacity = 1           # Maximum number of tokens
+    _lock = None            # threading.Lock protecting the tokens
+    _rate = 1               # Tokens added per second
+    _tokens = 1             # Available tokens
+    _updated = None         # Time the tokens were last updated
+
+    def __init__(self, rate, capacity=None):
+        """ Constructor for the TokenBucket
+
+        :type rate: float
+        :param rate: Number of requests per second
+        :type capacity: float
+        :param capacity: Maximum burst of requests. Defaults to one second
+            worth of requests
+        :returns: None
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+
+        self._capacity = capacity if capacity is not None else max(rate, 1)
+        self._lock = threading.Lock()
+        self._rate = float(rate)
+        self._tokens = self._capacity
+        self._updated = time.time()
+
+    def acquire(self, tokens=1):
+        """ Take tokens, waiting until they are available
+
+        :type tokens: float
+        :param tokens: Number of tokens to take
+        :returns: float -- Number of seconds waited
+        """
+        wait = self._take(tokens)
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+    def charge(self, tokens):
+        """ Take tokens without waiting, going into debt if needed
+
+        :type tokens: float
+        :param tokens: Number of tokens to take
+        :returns: None
+        """
+        self._take(tokens)
+
+    def _take(self, tokens):
+        """ Take tokens
+
+        :type tokens: float
+        :param tokens: Number of tokens to take
+        :returns: float -- Number of seconds until the tokens are available
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+
+            # Take the tokens now, going into debt if needed, so that
+            # concurrent callers queue up behind each other
+            self._tokens -= tokens
+            return max(0, -self._tokens / self._rate)
+
+
+def provisioned_limiters(connection, table_name, share=1.0):
+    """ Create rate limiters sized to the provisioned capacity of a table
+
+    :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+    :param connection: Boto connection object to use
+    :type table_name: str
+    :param table_name: Name of the DynamoDB table
+    :type share: float
+    :param share: Share of the capacity for this process, e.g. 0.1 if the
+        capacity is shared by 10 processes
+    :returns: tuple -- (read_limiter, write_limiter), None for tables
+        without provisioned capacity
+    """
+    description = connection.describe_table(table_name)
+    throughput = description[u'Table'].get(u'ProvisionedThroughput', {})
+
+    limiters = []
+    for key in (u'ReadCapacityUnits', u'WriteCapacityUnits'):
+        units = throughput.get(key, 0)
+        if units:
+            limiters.append(TokenBucket(units * share))
+        else:
+            limiters.append(None)
+
+    return tuple(limiters)
+
+
+class RetryingConnection(object):
+    """ DynamoDBConnection wrapper with retries and rate limiting
+
+    Table operations are retried according to the retry policy and are rate
+    limited by the read and write limiters. Every other attribute is passed
+    on to the wrapped connection, so the wrapper can be used wherever boto
+    expects a DynamoDBConnection.
+
+    Rate limited requests ask for their consumed capacity, so that the
+    limiters are charged for the capacity units the request consumed.
+
+    Note that boto retries throttled requests itself, up to
+    connection.NumberRetries times, before the retry policy is applied.
+    """
+
+    circuit_breaker = None  # CircuitBreaker, None for no circuit breaker
+    connection = None       # Wrapped DynamoDBConnection
+    read_limiter = None     # TokenBucket for reads, None for no limit
+    retry_policy = None     # RetryPolicy, None for no retries
+    write_limiter = None    # TokenBucket for writes, None for no limit
+
+    def __init__(
+            self, connection, retry_policy=None, read_limiter=None,
+            write_limiter=None, circuit_breaker=None):
+        """ Constructor for the RetryingConnection
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to wrap
+        :type retry_policy: dynamodb_config_store.retry.RetryPolicy
+        :param retry_policy: Retry policy, None for no retries
+        :type read_limiter: dynamodb_config_store.retry.TokenBucket
+        :param read_limiter: Rate limiter for reads, None for no limit
+        :type write_limiter: dynamodb_config_store.retry.TokenBucket
+        :param write_limiter: Rate limiter for writes, None for no limit
+        :type circuit_breaker:
+            dynamodb_config_store.circuit_breaker.CircuitBreaker
+        :param circuit_breaker: Circuit breaker, applied around the retries
+        :returns: None
+        """
+        self.circuit_breaker = circuit_breaker
+        self.connection = connection
+        self.read_limiter = read_limiter
+        self.retry_policy = retry_policy
+        self.write_limiter = write_limiter
+
+    def __getattr__(self, name):
+        """ Wrap table operations of the connection
+
+        :type name: str
+        :param name: Attribute name
+        :returns: The attribute of the wrapped connection
+        """
+        attribute = getattr(self.connection, name)
+
+        if name in READ_OPERATIONS:
+            limiter = self.read_limiter
+        elif name in WRITE_OPERATIONS:
+            limiter = self.write_limiter
+        elif name in CONTROL_OPERATIONS:
+            limiter = None
+        else:
+            return attribute
+
+        return self._wrap(attribute, limiter)
+
+    def _wrap(self, method, limiter):
+        """ Add retries, rate limiting and the circuit breaker to a method
+
+        :type method: callable
+        :param method: Connection method
+        :type limiter: dynamodb_config_store.retry.TokenBucket
+        :param limiter: Rate limiter, or None
+        :returns: callable -- Wrapped method
+        """
+        def limited(*args, **kwargs):
+            if limiter is None:
+                return method(*args, **kwargs)
+
+            limiter.acquire()
+            kwargs.setdefault('return_consumed_capacity', 'TOTAL')
+            response = method(*args, **kwargs)
+
+            # The request has taken one token, charge the rest of what it
+            # has consumed
+            units = consumed_capacity(response or {})
+            if units is not None and units > 1:
+                limiter.charge(units - 1)
+
+            return response
+
+        def retried(*args, **kwargs):
+            if self.retry_policy is None:
+                return limited(*args, **kwargs)
+
+            return self.retry_policy.call(limited, *args, **kwargs)
+
+        def wrapped(*args, **kwargs):
+            if self.circuit_breaker is None:
+                return retried(*args, **kwargs)
+
+            return self.circuit_breaker.call(retried, *args, **kwargs)
+
+        return wrapped
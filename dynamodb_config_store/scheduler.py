@@ -0,0 +1,263 @@
+""" Shared updates of TimeBasedConfigStores
+
+A RefreshScheduler updates many TimeBasedConfigStores from one thread, instead
+of one thread per store. The first update of each store is made right away,
+the next ones are spread over the update interval so that the stores are not
+all read at the same time.
+
+Versioned stores in the same table that are due within merge_window seconds
+of each other are updated together, and their store versions are read with
+one BatchGetItem request instead of one GetItem request per store.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from dynamodb_config_store.batch import batch_get
+from dynamodb_config_store.versioning import UNKNOWN_VERSION, VERSION_STORE
+
+logger = logging.getLogger(__name__)
+
+# Used to spread the first updates of the stores over the update interval
+GOLDEN_RATIO = 0.6180339887
+
+
+def get_store_versions(
+        table, store_names, store_key, option_key, version_key,
+        consistent=False):
+    """ Get the versions of many stores with BatchGetItem requests
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type store_names: list
+    :param store_names: Names of the DynamoDB Config Stores
+    :type store_key: str
+    :param store_key: Key name for the store in DynamoDB
+    :type option_key: str
+    :param option_key: Key name for the option in DynamoDB
+    :type version_key: str
+    :param version_key: Key name for the version in DynamoDB
+    :type consistent: bool
+    :param consistent: Use strongly consistent reads
+    :returns: dict -- Dict with {'store_name': version}, where the version
+        is None if it is not known
+    """
+    keys = [
+        {store_key: VERSION_STORE, option_key: store_name}
+        for store_name in store_names
+    ]
+
+    versions = dict.fromkeys(store_names)
+    for item in batch_get(
+            table, keys, consistent=consistent,
+            attributes=[option_key, version_key]):
+        if item[version_key] is not None:
+            versions[item[option_key]] = int(item[version_key])
+
+    return versions
+
+
+class RefreshScheduler(object):
+    """ Updates TimeBasedConfigStores from one thread
+
+    Stores are added by passing the scheduler to the TimeBasedConfigStore,
+    and removed when the store is closed. The update thread is started when
+    the first store is added.
+    """
+
+    _condition = None       # threading.Condition protecting the queue
+    _failures = None        # Dict with {store: consecutive failed updates}
+    _merge_window = 5       # Seconds within which due stores are merged
+    _phases = None          # Dict with {store: share of the interval}
+    _queue = None           # Heap with (due, sequence, store)
+    _sequence = 0           # Number of stores added, orders the queue
+    _stopped = None         # threading.Event set when stopped
+    _thread = None          # Update thread, None until a store is added
+
+    def __init__(self, merge_window=5):
+        """ Constructor for the RefreshScheduler
+
+        :type merge_window: float
+        :param merge_window: Versioned stores in the same table that are due
+            within this number of seconds are updated together
+        :returns: None
+        """
+        self._condition = threading.Condition()
+        self._failures = {}
+        self._merge_window = merge_window
+        self._phases = {}
+        self._queue = []
+        self._stopped = threading.Event()
+
+    def add(self, store):
+        """ Start updating a store
+
+        The first update is made right away.
+
+        :type store: dynamodb_config_store.config_stores.time_based.
+            TimeBasedConfigStore
+        :param store: Store to update
+        :returns: None
+        """
+        with self._condition:
+            self._sequence += 1
+            self._phases[store] = (self._sequence * GOLDEN_RATIO) % 1 or 1
+            heapq.heappush(self._queue, (time.time(), self._sequence, store))
+            self._condition.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=())
+                self._thread.daemon = True
+                self._thread.start()
+
+    def remove(self, store):
+        """ Stop updating a store
+
+        :type store: dynamodb_config_store.config_stores.time_based.
+            TimeBasedConfigStore
+        :param store: Store to stop updating
+        :returns: None
+        """
+        with self._condition:
+            self._queue = [
+                entry for entry in self._queue if entry[2] is not store]
+            heapq.heapify(self._queue)
+            self._failures.pop(store, None)
+            self._phases.pop(store, None)
+
+    def stop(self):
+        """ Stop updating all stores
+
+        :returns: None
+        """
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify()
+
+    def _run(self):
+        """ Update stores as they become due
+
+        :returns: None
+        """
+        while not self._stopped.is_set():
+            with self._condition:
+                stores = self._pop_due()
+                if not stores:
+                    timeout = None
+                    if self._queue:
+                        timeout = max(0, self._queue[0][0] - time.time())
+
+                    self._condition.wait(timeout)
+                    continue
+
+            self._refresh(stores)
+
+    def _pop_due(self):
+        """ Remove the due stores from the queue, the lock must be held
+
+        If any versioned store is due, versioned stores due within the merge
+        window are taken as well.
+
+        :returns: list -- Stores to update
+        """
+        now = time.time()
+
+        stores = []
+        while self._queue and self._queue[0][0] <= now:
+            stores.append(heapq.heappop(self._queue)[2])
+
+        if any(store._version_key for store in stores):
+            merged = [
+                entry for entry in self._queue
+                if entry[2]._version_key and
+                entry[0] <= now + self._merge_window
+            ]
+            if merged:
+                self._queue = [
+                    entry for entry in self._queue if entry not in merged]
+                heapq.heapify(self._queue)
+                stores.extend(entry[2] for entry in merged)
+
+        return stores
+
+    def _store_versions(self, stores):
+        """ Read the versions of versioned stores sharing a table together
+
+        :type stores: list
+        :param stores: Stores to update
+        :returns: dict -- Dict with {store: version} of the stores whose
+            version has been read
+        """
+        groups = {}
+        for store in stores:
+            if not store._version_key:
+                continue
+
+            group = (
+                store._table.table_name,
+                store._store_key,
+                store._option_key,
+                store._version_key)
+            groups.setdefault(group, []).append(store)
+
+        versions = {}
+        for group, members in groups.items():
+            # A single store reads its version itself
+            if len(members) < 2:
+                continue
+
+            table_name, store_key, option_key, version_key = group
+            try:
+                store_versions = get_store_versions(
+                    members[0]._table,
+                    [store._store_name for store in members],
+                    store_key,
+                    option_key,
+                    version_key,
+                    consistent=True)
+            except Exception:
+                logger.warning(
+                    'Could not read the store versions in table %s',
+                    table_name, exc_info=True)
+                continue
+
+            for store in members:
+                versions[store] = store_versions[store._store_name]
+
+        return versions
+
+    def _refresh(self, stores):
+        """ Update stores and queue their next updates
+
+        :type stores: list
+        :param stores: Stores to update
+        :returns: None
+        """
+        versions = self._store_versions(stores)
+
+        for store in stores:
+            populated = store._populated
+            try:
+                store._refresh(versions.get(store, UNKNOWN_VERSION))
+            except Exception:
+                failures = self._failures.get(store, 0) + 1
+                self._failures[store] = failures
+                logger.exception(
+                    'Could not update store %s', store._store_name)
+                delay = store._retry_interval(failures)
+            else:
+                self._failures.pop(store, None)
+                delay = store._next_interval()
+
+                # Spread the stores over the interval after the first update
+                if not populated:
+                    delay *= self._phases.get(store, 1)
+
+            with self._condition:
+                # Skip stores removed during the update
+                if store in self._phases:
+                    self._sequence += 1
+                    heapq.heappush(
+                        self._queue,
+                        (time.time() + delay, self._sequence, store))
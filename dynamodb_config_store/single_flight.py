@@ -0,0 +1,149 @@
+""" Request coalescing
+
+SingleFlight lets concurrent identical requests share one call. BatchCoalescer
+collects distinct requests made within a short window and fetches them with
+one call.
+"""
+import threading
+import time
+
+
+class _Call(object):
+    """ A call shared by several callers """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+        self.result = None
+
+
+class SingleFlight(object):
+    """ Coalesces concurrent calls with the same key
+
+    The first caller for a key makes the call, callers arriving while it is
+    in flight wait for it and get the same result or exception.
+    """
+
+    _calls = None           # Dict with {key: _Call} of calls in flight
+    _lock = None            # threading.Lock protecting _calls
+
+    def __init__(self):
+        """ Constructor for the SingleFlight
+
+        :returns: None
+        """
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, method, *args, **kwargs):
+        """ Call a method, or wait for the call in flight with the same key
+
+        :type key: object
+        :param key: Hashable key identifying the call
+        :type method: callable
+        :param method: Method to call
+        :returns: The return value of the method
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = method(*args, **kwargs)
+            return call.result
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+
+class _Batch(object):
+    """ Keys collected during one batch window """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+        self.keys = set()
+        self.results = None
+
+
+class BatchCoalescer(object):
+    """ Fetches keys requested within a batch window with one call
+
+    The first caller opens a batch and waits for the window to pass, keys
+    requested by other callers in the meantime are added to the batch. The
+    first caller then fetches all keys at once and hands out the results.
+    """
+
+    _batch = None           # Open _Batch, or None
+    _fetch = None           # Callable taking a list of keys, returning a dict
+    _lock = None            # threading.Lock protecting _batch
+    _window = 0.005         # Seconds to collect keys for a batch
+
+    def __init__(self, fetch, window=0.005):
+        """ Constructor for the BatchCoalescer
+
+        :type fetch: callable
+        :param fetch: Callable taking a list of keys and returning a dict
+            with {key: result}. Keys that are not found are left out
+        :type window: float
+        :param window: Seconds to collect keys before fetching them
+        :returns: None
+        """
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._window = window
+
+    def get(self, key):
+        """ Get the result for a key
+
+        :type key: object
+        :param key: Hashable key to fetch
+        :returns: The result for the key, None if it was not found
+        """
+        with self._lock:
+            batch = self._batch
+            if batch is None:
+                batch = _Batch()
+                self._batch = batch
+                leader = True
+            else:
+                leader = False
+
+            batch.keys.add(key)
+
+        if leader:
+            time.sleep(self._window)
+
+            with self._lock:
+                self._batch = None
+
+            try:
+                batch.results = self._fetch(list(batch.keys))
+            except Exception as error:
+                batch.error = error
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+        return batch.results.get(key)
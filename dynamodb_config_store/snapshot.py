@@ -0,0 +1,169 @@
+""" Local snapshot files of a Store
+
+A snapshot file holds the last known good options of a Store, so that a
+process can start serving configuration before it has talked to DynamoDB.
+
+The file has two lines; the SHA-256 checksum of the payload and the payload,
+the options as JSON. DynamoDB types without a JSON counterpart (numbers,
+sets and binary data) are tagged to be restored with the right type.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from decimal import Decimal
+
+try:
+    from boto.dynamodb.types import Binary
+except ImportError:
+    Binary = None
+
+logger = logging.getLogger(__name__)
+
+# os.rename does not replace existing files on Windows
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _encode(value):
+    """ Convert a DynamoDB value to a JSON compatible value
+
+    :type value: object
+    :param value: Value as returned by boto
+    :returns: object -- JSON compatible value
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (Decimal, int, float)):
+        return {'__decimal__': str(value)}
+    if isinstance(value, (set, frozenset)):
+        return {'__set__': [_encode(item) for item in value]}
+    if Binary is not None and isinstance(value, Binary):
+        return {'__binary__': base64.b64encode(value.value).decode('ascii')}
+    if isinstance(value, dict) or hasattr(value, 'keys'):
+        return {key: _encode(value[key]) for key in value.keys()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    """ Restore a value converted by _encode
+
+    :type value: object
+    :param value: JSON compatible value
+    :returns: object -- Value as returned by boto
+    """
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if '__decimal__' in value:
+                return Decimal(value['__decimal__'])
+            if '__set__' in value:
+                return set(_decode(item) for item in value['__set__'])
+            if '__binary__' in value and Binary is not None:
+                return Binary(base64.b64decode(value['__binary__']))
+
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def dumps(options):
+    """ Serialize options to bytes
+
+    :type options: dict
+    :param options: Dict with {'option': {'key': 'value'}}
+    :returns: bytes -- Options as UTF-8 encoded JSON
+    """
+    payload = json.dumps(
+        _encode(options), separators=(',', ':'), sort_keys=True)
+    return payload.encode('utf-8')
+
+
+def loads(payload):
+    """ Deserialize options serialized with dumps
+
+    :type payload: bytes
+    :param payload: Options as UTF-8 encoded JSON
+    :returns: dict -- Dict with {'option': {'key': 'value'}}
+    """
+    return _decode(json.loads(payload.decode('utf-8')))
+
+
+def atomic_write(path, data, prefix='.tmp-'):
+    """ Write a file atomically
+
+    The data is written to a temporary file in the same directory, which is
+    then renamed to path. Readers never see a partly written file.
+
+    :type path: str
+    :param path: Path to the file
+    :type data: bytes
+    :param data: Content of the file
+    :type prefix: str
+    :param prefix: Prefix of the temporary file name
+    :returns: None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            output.write(data)
+            output.flush()
+            os.fsync(output.fileno())
+
+        _replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+def write_snapshot(path, options):
+    """ Write a snapshot file atomically, see atomic_write
+
+    Errors are logged and not raised, as a failing snapshot must not stop
+    the config store.
+
+    :type path: str
+    :param path: Path to the snapshot file
+    :type options: dict
+    :param options: Dict with {'option': {'key': 'value'}}
+    :returns: bool -- True if the snapshot was written
+    """
+    payload = dumps(options)
+    checksum = hashlib.sha256(payload).hexdigest().encode('ascii')
+
+    try:
+        atomic_write(path, checksum + b'\n' + payload, prefix='.snapshot-')
+    except (IOError, OSError) as error:
+        logger.warning('Could not write snapshot %s: %s', path, error)
+        return False
+
+    return True
+
+
+def read_snapshot(path):
+    """ Read a snapshot file
+
+    :type path: str
+    :param path: Path to the snapshot file
+    :returns: dict or None -- Dict with {'option': {'key': 'value'}}, or
+        None if the file is missing or corrupt
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            checksum, _, payload = snapshot.read().partition(b'\n')
+    except (IOError, OSError):
+        return None
+
+    if hashlib.sha256(payload).hexdigest().encode('ascii') != checksum:
+        logger.warning('Ignoring snapshot %s with a bad checksum', path)
+        return None
+
+    try:
+        return loads(payload)
+    except ValueError:
+        logger.warning('Ignoring snapshot %s that is not valid JSON', path)
+        return None
@@ -0,0 +1,217 @@
+""" Caching and deferral of table schema validation
+
+Creating a DynamoDBConfigStore describes the table to validate its schema.
+DescribeTable has a low request rate limit, and the extra round trip adds to
+the start time of short-lived processes. A SchemaCache remembers tables that
+have been validated, in memory and optionally in a local file, so that they
+are only described once per TTL. A LazyTable defers the validation to the
+first request made with the table.
+"""
+import json
+import logging
+import threading
+import time
+
+from boto.dynamodb2.table import Table
+
+from dynamodb_config_store.exceptions import (
+    MisconfiguredSchemaException,
+    TableNotCreatedException,
+    TableNotReadyException)
+from dynamodb_config_store.snapshot import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Errors raised when a table fails validation
+VALIDATION_ERRORS = (
+    MisconfiguredSchemaException,
+    TableNotCreatedException,
+    TableNotReadyException)
+
+
+class SchemaCache(object):
+    """ Remembers validated tables
+
+    Tables are identified by the endpoint of the connection, the table name
+    and the key names, see SchemaCache.key(). The cache can be shared by
+    all stores in a process.
+    """
+
+    _entries = None         # Dict with {key: time of the validation}
+    _loaded = False         # True when the cache file has been read
+    _lock = None            # threading.Lock protecting the entries
+    _path = None            # Path to the cache file, None if not persisted
+    _ttl = 3600             # Seconds a validation is trusted
+
+    def __init__(self, path=None, ttl=3600):
+        """ Constructor for the SchemaCache
+
+        :type path: str
+        :param path: Path to a local file to persist the cache in, so that
+            it is shared between processes. Not persisted if None
+        :type ttl: float
+        :param ttl: Seconds a validation is trusted. None to trust it until
+            the table is invalidated
+        :returns: None
+        """
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._path = path
+        self._ttl = ttl
+
+    @staticmethod
+    def key(connection, table_name, store_key, option_key):
+        """ Get the cache key of a table
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Connection to the table
+        :type table_name: str
+        :param table_name: Name of the DynamoDB table
+        :type store_key: str
+        :param store_key: Key name for the store in DynamoDB
+        :type option_key: str
+        :param option_key: Key name for the option in DynamoDB
+        :returns: str -- Cache key
+        """
+        return '{}:{}/{}/{}/{}'.format(
+            getattr(connection, 'host', None),
+            getattr(connection, 'port', None),
+            table_name,
+            store_key,
+            option_key)
+
+    def is_valid(self, key):
+        """ Check if a table has been validated within the TTL
+
+        :type key: str
+        :param key: Cache key, see SchemaCache.key()
+        :returns: bool -- True if the table does not have to be validated
+        """
+        with self._lock:
+            self._load()
+
+            validated = self._entries.get(key)
+            if validated is None:
+                return False
+
+            return self._ttl is None or time.time() - validated < self._ttl
+
+    def add(self, key):
+        """ Record that a table has been validated
+
+        :type key: str
+        :param key: Cache key, see SchemaCache.key()
+        :returns: None
+        """
+        with self._lock:
+            self._load()
+            self._entries[key] = time.time()
+            self._save()
+
+    def invalidate(self, key=None):
+        """ Forget a validated table
+
+        :type key: str
+        :param key: Cache key, see SchemaCache.key(). All tables if None
+        :returns: None
+        """
+        with self._lock:
+            self._load()
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+            self._save()
+
+    def _load(self):
+        """ Read the cache file, the lock must be held
+
+        :returns: None
+        """
+        if self._loaded or self._path is None:
+            return
+
+        self._loaded = True
+        try:
+            with open(self._path) as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(entries, dict):
+            for key, validated in entries.items():
+                self._entries.setdefault(key, validated)
+
+    def _save(self):
+        """ Write the cache file, the lock must be held
+
+        Errors are logged, a cache that can not be written is not fatal.
+
+        :returns: None
+        """
+        if self._path is None:
+            return
+
+        try:
+            atomic_write(
+                self._path,
+                json.dumps(self._entries).encode('utf-8'),
+                prefix='.schemas-')
+        except (IOError, OSError):
+            logger.warning(
+                'Could not write schema cache %s', self._path, exc_info=True)
+
+
+class LazyTable(Table):
+    """ Table validating itself before its first request
+
+    The validation is made the first time the connection of the table is
+    used. If it fails, the error is raised to the caller and the validation
+    is retried on the next request.
+    """
+
+    _validate = None        # Callable validating the table
+    _validated = False      # True when the table has been validated
+    _validation_lock = None  # threading.Lock serializing the validation
+
+    def __init__(self, table_name, connection, validate):
+        """ Constructor for the LazyTable
+
+        :type table_name: str
+        :param table_name: Name of the DynamoDB table
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to use
+        :type validate: callable
+        :param validate: Callable validating the table, raising an
+            exception if it is not valid
+        :returns: None
+        """
+        super(LazyTable, self).__init__(table_name, connection=connection)
+
+        self._validation_lock = threading.Lock()
+        self._validate = validate
+
+    @property
+    def connection(self):
+        """ Connection of the table, validating the table on first use
+
+        :returns: boto.dynamodb2.layer1.DynamoDBConnection
+        """
+        if self._validate is not None and not self._validated:
+            with self._validation_lock:
+                if not self._validated:
+                    self._validate()
+                    self._validated = True
+
+        return self._connection
+
+    @connection.setter
+    def connection(self, connection):
+        """ Set the connection of the table
+
+        :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+        :param connection: Boto connection object to use
+        :returns: None
+        """
+        self._connection = connection
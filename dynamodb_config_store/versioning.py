@@ -0,0 +1,134 @@
+""" Store versions for delta refreshes
+
+When versioning is enabled each store has a sentinel item, kept in a
+separate partition so it never shows up among the options, holding a
+counter. Each write takes the next value of the counter as the version of
+the items it writes, and increments the counter again once the items have
+been written. The counter is incremented atomically by DynamoDB, so
+versions do not depend on the clocks of the writers.
+
+Readers compare the counter with the last value they saw to find out if the
+store has changed without reading the store itself. The counter only moves
+forward, a reader that has seen the value v knows that all writes with a
+version up to v have taken their version before it read v.
+"""
+from boto.dynamodb2.exceptions import ItemNotFound
+
+VERSION_STORE = '__version__'   # Store name of the sentinel items
+
+# Passed instead of a store version when it has not been read
+UNKNOWN_VERSION = object()
+
+
+def _increment(table, store_name, store_key, option_key, version_key):
+    """ Increment the counter in the sentinel item of a store
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type store_name: str
+    :param store_name: Name of the DynamoDB Config Store
+    :type store_key: str
+    :param store_key: Key name for the store in DynamoDB
+    :type option_key: str
+    :param option_key: Key name for the option in DynamoDB
+    :type version_key: str
+    :param version_key: Key name for the version in DynamoDB
+    :returns: int -- The new value of the counter
+    """
+    key = {
+        store_key: table._dynamizer.encode(VERSION_STORE),
+        option_key: table._dynamizer.encode(store_name)
+    }
+
+    response = table.connection.update_item(
+        table.table_name,
+        key,
+        attribute_updates={
+            version_key: {
+                'Action': 'ADD',
+                'Value': table._dynamizer.encode(1)
+            }
+        },
+        return_values='UPDATED_NEW')
+
+    return int(table._dynamizer.decode(
+        response['Attributes'][version_key]))
+
+
+def next_version(table, store_name, store_key, option_key, version_key):
+    """ Take a version for items that are about to be written
+
+    The items must be written right after the version is taken, see
+    TimeBasedConfigStore for how long a write may take.
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type store_name: str
+    :param store_name: Name of the DynamoDB Config Store
+    :type store_key: str
+    :param store_key: Key name for the store in DynamoDB
+    :type option_key: str
+    :param option_key: Key name for the option in DynamoDB
+    :type version_key: str
+    :param version_key: Key name for the version in DynamoDB
+    :returns: int -- Version to write the items with
+    """
+    return _increment(table, store_name, store_key, option_key, version_key)
+
+
+def get_store_version(
+        table, store_name, store_key, option_key, version_key,
+        consistent=False):
+    """ Get the version of a store from its sentinel item
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type store_name: str
+    :param store_name: Name of the DynamoDB Config Store
+    :type store_key: str
+    :param store_key: Key name for the store in DynamoDB
+    :type option_key: str
+    :param option_key: Key name for the option in DynamoDB
+    :type version_key: str
+    :param version_key: Key name for the version in DynamoDB
+    :type consistent: bool
+    :param consistent: Use a strongly consistent read
+    :returns: int or None -- Version of the last write, None if unknown
+    """
+    kwargs = {
+        store_key: VERSION_STORE,
+        option_key: store_name
+    }
+
+    try:
+        item = table.get_item(
+            consistent=consistent, attributes=[version_key], **kwargs)
+    except ItemNotFound:
+        return None
+
+    version = item[version_key]
+    if version is None:
+        return None
+
+    return int(version)
+
+
+def set_store_version(table, store_name, store_key, option_key, version_key):
+    """ Update the sentinel item of a store after a write
+
+    Readers that saw the store version from before the write will read the
+    store again.
+
+    :type table: boto.dynamodb2.table.Table
+    :param table: Table instance
+    :type store_name: str
+    :param store_name: Name of the DynamoDB Config Store
+    :type store_key: str
+    :param store_key: Key name for the store in DynamoDB
+    :type option_key: str
+    :param option_key: Key name for the option in DynamoDB
+    :type version_key: str
+    :param version_key: Key name for the version in DynamoDB
+    :returns: int -- The new version of the store
+    """
+    return _increment(table, store_name, store_key, option_key, version_key)
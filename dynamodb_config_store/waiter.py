@@ -0,0 +1,109 @@
+""" Waiting for tables to reach a state
+
+Tables usually become ACTIVE within seconds, and within milliseconds in
+DynamoDB Local. The waiter polls describe_table with exponential backoff,
+starting at initial_delay and capped at max_delay, until the table reaches
+the target state or the timeout passes.
+"""
+import time
+
+from boto.exception import JSONResponseError
+
+from dynamodb_config_store.batch import backoff_delay
+
+# Status of tables that do not exist
+MISSING = 'MISSING'
+
+
+def table_status(connection, table_name):
+    """ Get the status of a table
+
+    :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+    :param connection: Boto connection object to use
+    :type table_name: str
+    :param table_name: Name of the DynamoDB table
+    :returns: str -- Table status, e.g. 'ACTIVE', or MISSING if the table
+        does not exist (yet)
+    """
+    try:
+        description = connection.describe_table(table_name)
+    except JSONResponseError as error:
+        if error.error_code == 'ResourceNotFoundException':
+            return MISSING
+
+        raise
+
+    return description[u'Table'][u'TableStatus']
+
+
+def poll_delays(initial_delay=0.05, max_delay=5, timeout=None):
+    """ Get the delays between the polls
+
+    One delay is yielded for each poll, to wait after it. With a timeout the
+    delays are cut to the time left, a last poll is made when the timeout
+    has passed and the generator ends after it.
+
+    :type initial_delay: float
+    :param initial_delay: Seconds to wait before the second poll
+    :type max_delay: float
+    :param max_delay: Maximum number of seconds between two polls
+    :type timeout: float
+    :param timeout: Maximum number of seconds to poll for, forever if None
+    :returns: generator -- Yields the number of seconds to wait
+    """
+    start = time.time()
+    attempt = 0
+    while True:
+        delay = backoff_delay(
+            attempt, base_delay=initial_delay, max_delay=max_delay)
+
+        if timeout is not None:
+            left = timeout - (time.time() - start)
+            if left <= 0:
+                yield 0
+                return
+
+            delay = min(delay, left)
+
+        yield delay
+        attempt += 1
+
+
+def wait_for_table(
+        connection, table_name, target_state='ACTIVE', timeout=150,
+        initial_delay=0.05, max_delay=5, callback=None):
+    """ Wait for a table to reach a state
+
+    :type connection: boto.dynamodb2.layer1.DynamoDBConnection
+    :param connection: Boto connection object to use
+    :type table_name: str
+    :param table_name: Name of the DynamoDB table
+    :type target_state: str
+    :param target_state: State to wait for, e.g. 'ACTIVE', or MISSING to
+        wait for a table to be deleted
+    :type timeout: float
+    :param timeout: Maximum number of seconds to wait, forever if None
+    :type initial_delay: float
+    :param initial_delay: Seconds to wait before the second poll
+    :type max_delay: float
+    :param max_delay: Maximum number of seconds between two polls
+    :type callback: callable
+    :param callback: Called after each poll with the table status and the
+        number of seconds waited so far
+    :returns: bool -- True if the target state was reached, else False
+    """
+    target_state = target_state.upper()
+    start = time.time()
+
+    for delay in poll_delays(initial_delay, max_delay, timeout):
+        status = table_status(connection, table_name)
+
+        if callback is not None:
+            callback(status, time.time() - start)
+
+        if status == target_state:
+            return True
+
+        time.sleep(delay)
+
+    return False
@@ -1,21 +1,318 @@
 """ Unit tests for DynamoDB Config Store """
+import os
+import pickle
+import shutil
+import socket
+import sys
+import struct
+import tempfile
+import threading
 import time
 import unittest
+from decimal import Decimal
 from random import random
 
 from boto.dynamodb2.layer1 import DynamoDBConnection
-from boto.dynamodb2.exceptions import ItemNotFound, ValidationException
+from boto.dynamodb2.exceptions import (
+    ItemNotFound,
+    ProvisionedThroughputExceededException,
+    ValidationException)
 from boto.dynamodb2.table import Table
+from boto.exception import JSONResponseError
 
 from dynamodb_config_store import DynamoDBConfigStore
-from dynamodb_config_store.exceptions import MisconfiguredSchemaException
+from dynamodb_config_store.batch import BatchWriter
+from dynamodb_config_store.config_stores import frozen_mapping
+from dynamodb_config_store.config_stores.cached import CachedConfigStore
+from dynamodb_config_store.config_stores import shared_memory
+from dynamodb_config_store.config_stores.shared_memory import (
+    SharedMemoryConfigStore)
+from dynamodb_config_store.config_stores.simple import SimpleConfigStore
+from dynamodb_config_store.config_stores.time_based import TimeBasedConfigStore
+from dynamodb_config_store.circuit_breaker import CircuitBreaker
+from dynamodb_config_store import compact
+from dynamodb_config_store.compact import CompactOption
+from dynamodb_config_store.decoding import Schema
+from dynamodb_config_store.exceptions import (
+    CircuitOpenException,
+    DecodingException,
+    MisconfiguredSchemaException,
+    PopulationTimeoutException,
+    UnprocessedItemsException)
+from dynamodb_config_store.instrumentation import (
+    InstrumentedConnection,
+    MetricsInstrumentation)
+from dynamodb_config_store.manager import ConfigStoreManager
+from dynamodb_config_store.memory import MemoryConnection
+from dynamodb_config_store.retry import (
+    RetryBudget, RetryingConnection, RetryPolicy, TokenBucket)
+from dynamodb_config_store.snapshot import read_snapshot, write_snapshot
+from dynamodb_config_store.validation import SchemaCache
+from dynamodb_config_store.waiter import wait_for_table
+
+# Set DYNAMODB_BACKEND=memory to run the tests without DynamoDB Local
+if os.environ.get('DYNAMODB_BACKEND') == 'memory':
+    connection = MemoryConnection()
+else:
+    connection = DynamoDBConnection(
+        aws_access_key_id='foo',
+        aws_secret_access_key='bar',
+        host='localhost',
+        port=8000,
+        is_secure=False)
+
+
+class LocalStream(object):
+    """ Stand-in for a DynamoDB Streams client with a single shard """
+
+    def __init__(self):
+        self.records = []
+        self.expired = False
+
+    def describe_stream(self, StreamArn, **kwargs):
+        return {
+            'StreamDescription': {
+                'Shards': [{
+                    'ShardId': 'shard-1',
+                    'SequenceNumberRange': {'StartingSequenceNumber': '0'}
+                }]
+            }
+        }
+
+    def get_shard_iterator(self, StreamArn, ShardId, ShardIteratorType,
+                           SequenceNumber=None):
+        if ShardIteratorType == 'LATEST':
+            position = len(self.records)
+        elif ShardIteratorType == 'AFTER_SEQUENCE_NUMBER':
+            position = int(SequenceNumber) + 1
+        else:
+            position = 0
+
+        return {'ShardIterator': str(position)}
+
+    def get_records(self, ShardIterator, **kwargs):
+        if self.expired:
+            self.expired = False
+            raise ExpiredIteratorException(
+                400, 'Bad Request', {'__type': 'ExpiredIteratorException'})
+
+        position = int(ShardIterator)
+        return {
+            'Records': self.records[position:],
+            'NextShardIterator': str(len(self.records))
+        }
+
+    def add_record(self, event_name, store, option, image=None):
+        record = {
+            'eventName': event_name,
+            'dynamodb': {
+                'Keys': {'_store': {'S': store}, '_option': {'S': option}},
+                'SequenceNumber': str(len(self.records))
+            }
+        }
+        if image is not None:
+            record['dynamodb']['NewImage'] = image
+
+        self.records.append(record)
+
+
+class ExpiredIteratorException(JSONResponseError):
+    pass
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio requires Python 3.5')
+class TestAsyncDynamoDBConfigStore(unittest.TestCase):
+
+    def setUp(self):
+        import asyncio
+        from dynamodb_config_store.aio import AsyncDynamoDBConfigStore
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.store = self.loop.run_until_complete(
+            AsyncDynamoDBConfigStore.create(
+                connection,
+                self.table_name,
+                self.store_name))
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_get_and_set(self):
+        """ Test that we can write and read options concurrently """
+        import asyncio
+
+        self.loop.run_until_complete(asyncio.gather(*[
+            self.store.set('option{}'.format(number), {'value': number})
+            for number in range(10)
+        ]))
+
+        options = self.loop.run_until_complete(asyncio.gather(*[
+            self.store.get_option('option{}'.format(number))
+            for number in range(10)
+        ]))
+        self.assertEqual(
+            [option['value'] for option in options], list(range(10)))
+
+        many = self.loop.run_until_complete(
+            self.store.get_many(['option1', 'option2']))
+        self.assertEqual(many['option2'], {'value': 2})
+
+        everything = self.loop.run_until_complete(self.store.get())
+        self.assertEqual(len(everything), 10)
+
+    def test_refresher(self):
+        """ Test that the refresher publishes the options in config """
+        import asyncio
+
+        self.loop.run_until_complete(
+            self.store.set('db', {'host': '127.0.0.1'}))
+        self.loop.run_until_complete(
+            self.store.start_refresher(update_interval=0.2))
+        self.assertEqual(self.store.config.db['host'], '127.0.0.1')
+
+        self.loop.run_until_complete(self.store.set('db', {'host': 'db.com'}))
+        self.loop.run_until_complete(asyncio.sleep(0.5))
+        self.assertEqual(self.store.config.db['host'], 'db.com')
+
+    def tearDown(self):
+        """ Tear down the test case """
+        import asyncio
+
+        self.loop.run_until_complete(self.store.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.table.delete()
+
+
+class TestCachedConfigStore(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='CachedConfigStore',
+            config_store_kwargs={'ttl': 2, 'max_size': 2})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_cache_hits_and_misses(self):
+        """ Test that repeated reads are served from the cache """
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        self.assertEqual(self.store.config.get('db')['port'], 27017)
+        self.assertEqual(
+            self.store.config.get('db', keys=['host']), {'host': '127.0.0.1'})
+
+        info = self.store.config.cache_info()
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['size'], 1)
+
+    def test_read_before_invalidation(self):
+        """ Test that reads racing with a write are not cached """
+        self.store.set('db', {'host': 'old'})
+
+        table = self.store.config._table
+        get_item = table.get_item
+
+        def racing_get_item(*args, **kwargs):
+            item = get_item(*args, **kwargs)
+
+            # The write lands while the read is in flight
+            self.store.set('db', {'host': 'new'})
+            return item
+
+        table.get_item = racing_get_item
+        self.assertEqual(self.store.config.get('db'), {'host': 'old'})
+        del table.get_item
+
+        self.assertEqual(self.store.config.get('db'), {'host': 'new'})
+
+    def test_revalidation_before_invalidation(self):
+        """ Test that revalidations racing with a write are not cached """
+        self.store.set('db', {'host': 'old'})
+
+        table = self.store.config._table
+        get_item = table.get_item
 
-connection = DynamoDBConnection(
-    aws_access_key_id='foo',
-    aws_secret_access_key='bar',
-    host='localhost',
-    port=8000,
-    is_secure=False)
+        def racing_get_item(*args, **kwargs):
+            item = get_item(*args, **kwargs)
+            self.store.set('db', {'host': 'new'})
+            return item
+
+        table.get_item = racing_get_item
+        self.store.config._revalidate('db')
+        del table.get_item
+
+        self.assertEqual(self.store.config.get('db'), {'host': 'new'})
+
+    def test_cache_invalidation(self):
+        """ Test that writes outside the store are seen after invalidation """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.assertEqual(self.store.config.get('db')['host'], '127.0.0.1')
+
+        # Update the item behind the back of the store
+        self.table.put_item(
+            {'_store': self.store_name, '_option': 'db', 'host': 'db.com'},
+            overwrite=True)
+        self.assertEqual(self.store.config.get('db')['host'], '127.0.0.1')
+
+        self.store.config.invalidate('db')
+        self.assertEqual(self.store.config.get('db')['host'], 'db.com')
+
+        self.table.put_item(
+            {'_store': self.store_name, '_option': 'db', 'host': 'x.com'},
+            overwrite=True)
+        self.store.config.invalidate_all()
+        self.assertEqual(self.store.config.get('db')['host'], 'x.com')
+
+    def test_cache_ttl(self):
+        """ Test that cached entries expire """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.config.get('db')
+
+        self.table.put_item(
+            {'_store': self.store_name, '_option': 'db', 'host': 'db.com'},
+            overwrite=True)
+        time.sleep(2)
+
+        self.assertEqual(self.store.config.get('db')['host'], 'db.com')
+
+    def test_cache_lru_eviction(self):
+        """ Test that the least recently used entry is evicted """
+        self.store.set('a', {'value': 1})
+        self.store.set('b', {'value': 2})
+        self.store.set('c', {'value': 3})
+
+        self.store.config.get('a')
+        self.store.config.get('b')
+        self.store.config.get('a')
+        self.store.config.get('c')
+
+        self.assertEqual(self.store.config.cache_info()['size'], 2)
+
+        # 'b' was the least recently used entry and should be a miss
+        misses = self.store.config.cache_info()['misses']
+        self.store.config.get('b')
+        self.assertEqual(self.store.config.cache_info()['misses'], misses + 1)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
 
 
 class TestCustomThroughput(unittest.TestCase):
@@ -221,6 +518,97 @@ class TestGetOptionAndKeysSubset(unittest.TestCase):
         self.table.delete()
 
 
+    def test_get_full_store(self):
+        """ Test that we can retrieve a subset of keys for all options """
+        self.store.set('api', {'endpoint': 'http://test.com', 'port': 80})
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        options = self.store.config.get(keys=['port'])
+
+        self.assertEqual(options, {'api': {'port': 80}, 'db': {'port': 27017}})
+
+    def test_attributes_pushed_down(self):
+        """ Test that only the requested keys are read from DynamoDB """
+        self.store.set('api', {'endpoint': 'http://test.com', 'port': 80})
+        table = RecordingTable(self.table_name, connection=connection)
+        self.store.config._table = table
+
+        self.store.config.get('api', keys=['port'])
+        self.store.config.get(keys=['port'])
+        self.store.config.get_many(['api'], keys=['port'])
+
+        for read in table.reads:
+            self.assertEqual(read['attributes'], ['_store', '_option', 'port'])
+        self.assertEqual(len(table.reads), 3)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestConsistentRead(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name)
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_eventually_consistent_by_default(self):
+        """ Test that reads are eventually consistent by default """
+        table = RecordingTable(self.table_name, connection=connection)
+        self.store.config._table = table
+
+        self.store.config.get('db')
+        self.store.config.get()
+        self.store.get_many(['db'])
+
+        self.assertEqual(
+            [read['consistent'] for read in table.reads], [False] * 3)
+
+    def test_per_call_override(self):
+        """ Test that the store default can be overridden per call """
+        table = RecordingTable(self.table_name, connection=connection)
+        self.store.config._table = table
+        self.store.config._consistent_read = True
+
+        self.store.config.get('db')
+        self.store.config.get('db', consistent=False)
+        self.store.get_many(['db'], consistent=False)
+
+        self.assertEqual(
+            [read['consistent'] for read in table.reads],
+            [True, False, False])
+
+    def test_cached_consistent_read(self):
+        """ Test that a consistent read skips the cache """
+        config = CachedConfigStore(
+            self.table, self.store_name, '_store', '_option')
+        config.get('db')
+
+        self.table.put_item(
+            {'_store': self.store_name, '_option': 'db', 'host': 'db.com'},
+            overwrite=True)
+
+        self.assertEqual(config.get('db')['host'], '127.0.0.1')
+        self.assertEqual(config.get('db', consistent=True)['host'], 'db.com')
+        self.assertEqual(config.get('db')['host'], 'db.com')
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
 class TestGetFullStore(unittest.TestCase):
 
     def setUp(self):
@@ -273,6 +661,88 @@ class TestGetFullStore(unittest.TestCase):
         self.assertEqual(optUser['username'], objUser['username'])
         self.assertEqual(optUser['password'], objUser['password'])
 
+    def test_iter_options(self):
+        """ Test that we can iterate over the store page by page """
+        for number in range(5):
+            self.store.set('option{}'.format(number), {'value': number})
+
+        options = list(self.store.config.iter_options(page_size=2))
+        self.assertEqual(
+            [option for option, _ in options],
+            ['option{}'.format(number) for number in range(5)])
+        self.assertEqual(options[3][1], {'value': 3})
+
+        # Resume after the last option seen
+        options = self.store.config.iter_options(
+            page_size=2, start_after='option2')
+        self.assertEqual(
+            [option for option, _ in options], ['option3', 'option4'])
+
+    def test_get_prefix_and_range(self):
+        """ Test that we can retrieve a namespace of options """
+        for option in ['db.primary', 'db.replica.1', 'dbx', 'feature.x']:
+            self.store.set(option, {'name': option})
+
+        self.assertEqual(
+            sorted(self.store.config.get_prefix('db.')),
+            ['db.primary', 'db.replica.1'])
+        self.assertEqual(
+            self.store.config.get_prefix('feature.', keys=['name']),
+            {'feature.x': {'name': 'feature.x'}})
+        self.assertEqual(self.store.config.get_prefix('api.'), {})
+
+        self.assertEqual(
+            sorted(self.store.config.get_range('db.replica.1', 'feature.x')),
+            ['db.replica.1', 'dbx', 'feature.x'])
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestGetMany(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name)
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_get_many(self):
+        """ Test that we can retrieve more options than fit in one batch """
+        for number in range(150):
+            self.store.set(
+                'option{}'.format(number),
+                {'number': number, 'name': 'option{}'.format(number)})
+
+        options = ['option{}'.format(number) for number in range(150)]
+        items = self.store.get_many(options + ['doesnotexist'])
+
+        self.assertEqual(len(items), 150)
+        self.assertNotIn('doesnotexist', items)
+        self.assertNotIn('_store', items['option42'])
+        self.assertNotIn('_option', items['option42'])
+        self.assertEqual(items['option42']['number'], 42)
+        self.assertEqual(items['option42']['name'], 'option42')
+
+    def test_get_many_keys_subset(self):
+        """ Test that we can retrieve a subset of keys for many options """
+        self.store.set('api', {'endpoint': 'http://test.com', 'port': 80})
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        items = self.store.config.get_many(['api', 'db'], keys=['port'])
+
+        self.assertEqual(items, {'api': {'port': 80}, 'db': {'port': 27017}})
+
     def tearDown(self):
         """ Tear down the test case """
         self.table.delete()
@@ -426,6 +896,86 @@ class TestSet(unittest.TestCase):
         self.table.delete()
 
 
+class TestSetMany(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name)
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_set_many(self):
+        """ Test that we can insert more objects than fit in one batch """
+        options = {
+            'option{}'.format(number): {'number': number}
+            for number in range(60)
+        }
+
+        results = self.store.set_many(options)
+
+        self.assertEqual(len(results), 60)
+        self.assertTrue(all(results.values()))
+
+        # Fetch an object directly from DynamoDB
+        kwargs = {
+            '_store': self.store_name,
+            '_option': 'option42'
+        }
+        item = self.table.get_item(**kwargs)
+
+        self.assertEqual(item['_store'], self.store_name)
+        self.assertEqual(item['_option'], 'option42')
+        self.assertEqual(item['number'], 42)
+
+    def test_batch_writer(self):
+        """ Test that the batch writer writes when the context is left """
+        with self.store.batch_writer() as batch:
+            batch.set('db', {'host': '127.0.0.1', 'port': 27017})
+            batch.set('api', {'endpoint': 'http://test.com'})
+            batch.set('db', {'host': 'db.com', 'port': 27017})
+
+        self.assertEqual(batch.results, {'db': True, 'api': True})
+        self.assertEqual(self.store.config.get('db')['host'], 'db.com')
+        self.assertEqual(
+            self.store.config.get('api')['endpoint'], 'http://test.com')
+
+    def test_callback_once_per_flush(self):
+        """ Test that the callback gets all options written by a flush """
+        calls = []
+        with BatchWriter(
+                self.table, self.store_name, '_store', '_option',
+                callback=calls.append) as batch:
+            for number in range(60):
+                batch.set('option{}'.format(number), {'number': number})
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(calls[0]), 60)
+
+    def test_network_errors(self):
+        """ Test that network errors are recorded for each option """
+        table = Table(
+            self.table_name, connection=UnreachableConnection(connection))
+
+        with BatchWriter(table, self.store_name, '_store', '_option') as batch:
+            batch.set('db', {'host': '127.0.0.1'})
+
+        self.assertEqual(batch.results, {'db': False})
+        self.assertIsInstance(batch.errors['db'], socket.error)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
 class TestTimeBasedConfigStore(unittest.TestCase):
 
     def setUp(self):
@@ -440,7 +990,7 @@ class TestTimeBasedConfigStore(unittest.TestCase):
             self.table_name,
             self.store_name,
             config_store='TimeBasedConfigStore',
-            config_store_kwargs={'update_interval': 5})
+            config_store_kwargs={'update_interval': 5, 'jitter': 0})
 
         # Get an Table instance for validation
         self.table = Table(self.table_name, connection=connection)
@@ -475,7 +1025,7 @@ class TestTimeBasedConfigStore(unittest.TestCase):
 
         self.assertEqual(self.store.config.db['host'], obj['host'])
         self.assertEqual(self.store.config.db['port'], obj['port'])
-        time.sleep(5)
+        time.sleep(6)
         self.assertEqual(self.store.config.db['host'], updatedObj['host'])
         self.assertEqual(self.store.config.db['port'], updatedObj['port'])
 
@@ -484,6 +1034,1875 @@ class TestTimeBasedConfigStore(unittest.TestCase):
         self.table.delete()
 
 
+class TestTimeBasedConfigStoreSnapshot(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore')
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_get_from_snapshot(self):
+        """ Test that get reads from the current snapshot """
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+        self.store.set('api', {'endpoint': 'http://test.com'})
+        self.store.reload()
+
+        options = self.store.config.get()
+        self.assertEqual(len(options), 2)
+        self.assertEqual(options['db']['host'], '127.0.0.1')
+        self.assertEqual(
+            self.store.config.get('db', keys=['port']), {'port': 27017})
+        self.assertIs(self.store.config.get('api'), self.store.config.api)
+
+        with self.assertRaises(ItemNotFound):
+            self.store.config.get('doesnotexist')
+
+    def test_snapshot_is_replaced(self):
+        """ Test that an update replaces the snapshot as a whole """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.reload()
+        snapshot = self.store.config.get()
+
+        self.store.set('db', {'host': 'db.com'})
+        self.store.set('api', {'endpoint': 'http://test.com'})
+        self.store.config._publish(self.store.config._fetch_options())
+
+        # The old snapshot is left untouched for readers still holding it
+        self.assertEqual(snapshot['db']['host'], '127.0.0.1')
+        self.assertNotIn('api', snapshot)
+        self.assertEqual(self.store.config.db['host'], 'db.com')
+        self.assertEqual(
+            self.store.config.api['endpoint'], 'http://test.com')
+
+    def test_options_are_read_only(self):
+        """ Test that the data of the options can not be modified """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.reload()
+
+        if frozen_mapping is dict:
+            # Python 2 has no read-only mapping, the options are copied
+            self.assertIsNot(
+                self.store.config.db, self.store.config._raw_snapshot['db'])
+            return
+
+        with self.assertRaises(TypeError):
+            self.store.config.db['host'] = 'db.com'
+        with self.assertRaises(TypeError):
+            self.store.config.get('db')['port'] = 27017
+
+        self.assertEqual(self.store.config.db, {'host': '127.0.0.1'})
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestStreamConfigStore(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.stream = LocalStream()
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='StreamConfigStore',
+            config_store_kwargs={
+                'streams_connection': self.stream,
+                'stream_arn': 'arn:local',
+                'poll_interval': 0.1
+            })
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_stream_records_are_applied(self):
+        """ Test that INSERT, MODIFY and REMOVE records are applied """
+        self.stream.add_record('INSERT', self.store_name, 'db', {
+            '_store': {'S': self.store_name},
+            '_option': {'S': 'db'},
+            'host': {'S': '127.0.0.1'},
+            'port': {'N': '27017'}
+        })
+        self.stream.add_record('INSERT', 'other', 'db', {
+            '_store': {'S': 'other'},
+            '_option': {'S': 'db'},
+            'host': {'S': 'other.com'}
+        })
+        time.sleep(0.5)
+
+        self.assertEqual(self.store.config.db['host'], '127.0.0.1')
+        self.assertEqual(self.store.config.db['port'], 27017)
+        self.assertNotIn('_store', self.store.config.db)
+
+        self.stream.add_record('MODIFY', self.store_name, 'db', {
+            '_store': {'S': self.store_name},
+            '_option': {'S': 'db'},
+            'host': {'S': 'db.com'}
+        })
+        time.sleep(0.5)
+        self.assertEqual(self.store.config.db, {'host': 'db.com'})
+
+        self.stream.add_record('REMOVE', self.store_name, 'db')
+        time.sleep(0.5)
+        with self.assertRaises(AttributeError):
+            self.store.config.db
+
+    def test_keys_only_records(self):
+        """ Test that options are read from the table without an image """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.stream.add_record('INSERT', self.store_name, 'db')
+        time.sleep(0.5)
+
+        self.assertEqual(self.store.config.db, {'host': '127.0.0.1'})
+
+    def test_expired_iterator(self):
+        """ Test that the store resumes from its checkpoint """
+        self.stream.add_record('INSERT', self.store_name, 'db', {
+            'host': {'S': '127.0.0.1'}
+        })
+        time.sleep(0.5)
+
+        self.stream.expired = True
+        self.stream.add_record('INSERT', self.store_name, 'api', {
+            'endpoint': {'S': 'http://test.com'}
+        })
+        time.sleep(0.5)
+
+        self.assertEqual(self.store.config.db, {'host': '127.0.0.1'})
+        self.assertEqual(self.store.config.api, {'endpoint': 'http://test.com'})
+
+    def test_reload_closes_store(self):
+        """ Test that a reload stops following the stream in the old store """
+        old_config = self.store.config
+        self.store.reload()
+        self.assertTrue(old_config._closed.is_set())
+
+        self.stream.add_record('INSERT', self.store_name, 'db', {
+            'host': {'S': '127.0.0.1'}
+        })
+        time.sleep(0.5)
+
+        self.assertEqual(self.store.config.db, {'host': '127.0.0.1'})
+        with self.assertRaises(AttributeError):
+            old_config.db
+
+    def test_close_during_reload(self):
+        """ Test that a close during a full reload stops the follower """
+        config = self.store.config
+        describe_stream = self.stream.describe_stream
+
+        def closing_describe_stream(**kwargs):
+            config.close()
+            return describe_stream(**kwargs)
+
+        # Without a checkpoint an expired iterator makes the store reload
+        self.stream.describe_stream = closing_describe_stream
+        self.stream.expired = True
+        config._thread.join(2)
+
+        self.assertTrue(config._closed.is_set())
+        self.assertFalse(config._thread.is_alive())
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.store.config.close()
+        self.table.delete()
+
+
+class BatchGetConnection(object):
+    """ Connection passing the BatchGetItem requests to a callback """
+
+    def __init__(self, connection, callback):
+        self.connection = connection
+        self.callback = callback
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def batch_get_item(self, request_items, **kwargs):
+        for request in request_items.values():
+            self.callback(request)
+
+        return self.connection.batch_get_item(request_items, **kwargs)
+
+
+class RecordingTable(Table):
+    """ Table recording the keyword arguments of reads from DynamoDB """
+
+    def __init__(self, *args, **kwargs):
+        self.reads = []
+        kwargs['connection'] = BatchGetConnection(
+            kwargs['connection'], self._record_batch_get)
+        super(RecordingTable, self).__init__(*args, **kwargs)
+
+    def _record_batch_get(self, request):
+        self.reads.append({
+            'attributes': request.get('AttributesToGet'),
+            'consistent': request.get('ConsistentRead', False)
+        })
+
+    def get_item(self, *args, **kwargs):
+        self.reads.append(kwargs)
+        return super(RecordingTable, self).get_item(*args, **kwargs)
+
+    def query_2(self, *args, **kwargs):
+        self.reads.append(kwargs)
+        return super(RecordingTable, self).query_2(*args, **kwargs)
+
+
+class ThrottledConnection(object):
+    """ Connection throttling the first get_item requests """
+
+    def __init__(self, connection, throttled=0):
+        self.connection = connection
+        self.throttled = throttled
+        self.attempts = 0
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def get_item(self, *args, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.throttled:
+            raise ProvisionedThroughputExceededException(
+                400, 'Bad Request',
+                {'__type': 'ProvisionedThroughputExceededException'})
+
+        return self.connection.get_item(*args, **kwargs)
+
+
+class BotoThrottledConnection(object):
+    """ Connection counting throttled attempts retried inside boto """
+
+    def __init__(self, connection, throttled=0):
+        self.connection = connection
+        self.throttled = throttled
+        self.throughput_exceeded_events = 0
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def get_item(self, *args, **kwargs):
+        self.throughput_exceeded_events += self.throttled
+        return self.connection.get_item(*args, **kwargs)
+
+
+class BlockingConnection(object):
+    """ Connection blocking the requests to a table until released """
+
+    def __init__(self, connection, table_name):
+        self.connection = connection
+        self.table_name = table_name
+        self.blocked = threading.Event()
+        self.released = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def describe_table(self, table_name):
+        if table_name == self.table_name:
+            self.blocked.set()
+            self.released.wait()
+
+        return self.connection.describe_table(table_name)
+
+
+class DownConnection(object):
+    """ Connection failing all requests with a network error """
+
+    def __getattr__(self, name):
+        def unreachable(*args, **kwargs):
+            raise socket.error('Connection refused')
+
+        return unreachable
+
+
+class UnreachableConnection(object):
+    """ Connection failing all batch writes with a network error """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def batch_write_item(self, *args, **kwargs):
+        raise socket.error('Connection refused')
+
+
+class FailingTable(Table):
+    """ Table failing the first queries with a server error """
+
+    def __init__(self, *args, **kwargs):
+        self.failures = kwargs.pop('failures', 0)
+        super(FailingTable, self).__init__(*args, **kwargs)
+
+    def query_2(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise JSONResponseError(500, 'Internal Server Error')
+
+        return super(FailingTable, self).query_2(*args, **kwargs)
+
+
+class CountingTable(Table):
+    """ Slow Table counting the item reads """
+
+    def __init__(self, *args, **kwargs):
+        self.get_items = 0
+        self.batch_gets = 0
+        kwargs['connection'] = BatchGetConnection(
+            kwargs['connection'], self._count_batch_get)
+        super(CountingTable, self).__init__(*args, **kwargs)
+
+    def _count_batch_get(self, request):
+        self.batch_gets += 1
+
+    def get_item(self, *args, **kwargs):
+        self.get_items += 1
+        time.sleep(0.1)
+        return super(CountingTable, self).get_item(*args, **kwargs)
+
+
+class SlowTable(Table):
+    """ Table with slow queries """
+
+    def query_2(self, *args, **kwargs):
+        time.sleep(1)
+        return super(SlowTable, self).query_2(*args, **kwargs)
+
+
+class TestTimeBasedConfigStoreStartup(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name)
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_timeout(self):
+        """ Test that a slow first population raises an exception """
+        with self.assertRaises(PopulationTimeoutException):
+            TimeBasedConfigStore(
+                SlowTable(self.table_name, connection=connection),
+                self.store_name,
+                '_store',
+                '_option',
+                timeout=0.1)
+
+    def test_fallback(self):
+        """ Test that the fallback is served until the store is populated """
+        config = TimeBasedConfigStore(
+            SlowTable(self.table_name, connection=connection),
+            self.store_name,
+            '_store',
+            '_option',
+            timeout=0.1,
+            fallback={'db': {'host': 'fallback'}})
+
+        self.assertEqual(config.db['host'], 'fallback')
+        self.assertTrue(config.wait_until_populated(5))
+        self.assertEqual(config.db['host'], '127.0.0.1')
+
+    def test_non_blocking(self):
+        """ Test that a non-blocking store returns before it is populated """
+        config = TimeBasedConfigStore(
+            SlowTable(self.table_name, connection=connection),
+            self.store_name,
+            '_store',
+            '_option',
+            blocking=False)
+
+        with self.assertRaises(AttributeError):
+            config.db
+
+        self.assertTrue(config.wait_until_populated(5))
+        self.assertEqual(config.db['host'], '127.0.0.1')
+
+    def test_jitter(self):
+        """ Test that the update interval is randomized within the jitter """
+        config = TimeBasedConfigStore(
+            self.table,
+            self.store_name,
+            '_store',
+            '_option',
+            update_interval=100,
+            jitter=0.2)
+
+        intervals = [config._next_interval() for _ in range(100)]
+        self.assertTrue(all(80 <= interval <= 120 for interval in intervals))
+        self.assertGreater(len(set(intervals)), 1)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestSnapshotFile(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.directory = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.directory, 'snapshot.json')
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store_kwargs={'snapshot_file': self.snapshot_file})
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_write_and_read(self):
+        """ Test that DynamoDB types survive a snapshot file """
+        options = {
+            'db': {
+                'host': '127.0.0.1',
+                'port': Decimal('27017'),
+                'ratio': Decimal('0.5'),
+                'enabled': True,
+                'tags': set(['a', 'b']),
+                'ports': set([Decimal(1), Decimal(2)])
+            }
+        }
+        self.assertTrue(write_snapshot(self.snapshot_file, options))
+        self.assertEqual(read_snapshot(self.snapshot_file), options)
+
+    def test_corrupt_snapshot(self):
+        """ Test that missing and corrupt snapshots are ignored """
+        self.assertIsNone(read_snapshot(self.snapshot_file))
+
+        write_snapshot(self.snapshot_file, {'db': {'host': '127.0.0.1'}})
+        with open(self.snapshot_file, 'ab') as snapshot:
+            snapshot.write(b' ')
+
+        self.assertIsNone(read_snapshot(self.snapshot_file))
+
+    def test_full_store_get_writes_snapshot(self):
+        """ Test that reading the full store writes the snapshot file """
+        options = self.store.config.get()
+        self.assertEqual(read_snapshot(self.snapshot_file), options)
+
+    def test_warm_start(self):
+        """ Test that the snapshot is served until the store is populated """
+        write_snapshot(self.snapshot_file, {'db': {'host': 'snapshot'}})
+
+        config = TimeBasedConfigStore(
+            SlowTable(self.table_name, connection=connection),
+            self.store_name,
+            '_store',
+            '_option',
+            snapshot_file=self.snapshot_file)
+
+        self.assertEqual(config.db['host'], 'snapshot')
+        self.assertTrue(config.wait_until_populated(5))
+        self.assertEqual(config.db['host'], '127.0.0.1')
+        self.assertEqual(
+            read_snapshot(self.snapshot_file)['db']['host'], '127.0.0.1')
+
+    def test_warm_start_without_dynamodb(self):
+        """ Test that the snapshot is served if DynamoDB is unreachable """
+        write_snapshot(self.snapshot_file, {'db': {'host': 'snapshot'}})
+
+        store = DynamoDBConfigStore(
+            DownConnection(),
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={'snapshot_file': self.snapshot_file})
+
+        self.assertEqual(store.config.db['host'], 'snapshot')
+        self.assertFalse(store.config.wait_until_populated(0.1))
+        store.config.close()
+
+        # Without a snapshot the table is validated right away
+        os.remove(self.snapshot_file)
+        with self.assertRaises(socket.error):
+            DynamoDBConfigStore(
+                DownConnection(),
+                self.table_name,
+                self.store_name,
+                config_store='TimeBasedConfigStore',
+                config_store_kwargs={'snapshot_file': self.snapshot_file})
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+        shutil.rmtree(self.directory)
+
+
+class TestSharedMemoryConfigStore(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'config')
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='SharedMemoryConfigStore',
+            config_store_kwargs={
+                'path': self.path,
+                'update_interval': 0.5,
+                'jitter': 0
+            })
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def _follower(self):
+        """ Create a second store sharing the snapshot """
+        return SharedMemoryConfigStore(
+            self.table,
+            self.store_name,
+            '_store',
+            '_option',
+            self.path,
+            update_interval=0.5,
+            jitter=0)
+
+    def test_shared_snapshot(self):
+        """ Test that only the writer reads and the snapshot is shared """
+        follower = self._follower()
+        self.assertTrue(self.store.config.is_writer())
+        self.assertFalse(follower.is_writer())
+
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+        self.store.config._update()
+
+        self.assertEqual(follower.db['host'], '127.0.0.1')
+        self.assertEqual(follower.get('db', keys=['port']), {'port': 27017})
+        self.assertIs(follower.get(), follower.get())
+        follower.close()
+
+    def test_take_over(self):
+        """ Test that another store takes over when the writer is closed """
+        follower = self._follower()
+        self.store.config.close()
+
+        self.store.set('db', {'host': '127.0.0.1'})
+        time.sleep(1.5)
+
+        self.assertTrue(follower.is_writer())
+        self.assertEqual(follower.db['host'], '127.0.0.1')
+        follower.close()
+
+    def test_grow_segment(self):
+        """ Test that snapshots larger than the segment are shared """
+        follower = self._follower()
+        value = 'x' * 100000
+
+        self.store.set('large', {'value': value})
+        self.store.config._update()
+
+        self.assertEqual(follower.large['value'], value)
+        follower.close()
+
+    def test_writer_died_during_write(self):
+        """ Test that readers and writers recover from an incomplete write """
+        follower = self._follower()
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.config._update()
+        self.assertEqual(follower.db['host'], '127.0.0.1')
+
+        # Leave the generation odd, as a writer dying during a write would
+        segment = self.store.config._segment
+        generation = segment.generation()
+        struct.pack_into(
+            '<Q',
+            segment._mmap,
+            shared_memory._GENERATION_OFFSET,
+            generation + 1)
+
+        # The last good copy is served, without waiting again
+        started = time.time()
+        self.assertEqual(follower.db['host'], '127.0.0.1')
+        self.assertEqual(follower.db['host'], '127.0.0.1')
+        self.assertLess(time.time() - started, 2)
+
+        self.store.set('db', {'host': 'db.com'})
+        self.store.config._update()
+
+        self.assertGreater(segment.generation(), generation + 1)
+        self.assertEqual(segment.generation() % 2, 0)
+        self.assertEqual(follower.db['host'], 'db.com')
+        follower.close()
+
+    def test_ignore_segment_of_other_store(self):
+        """ Test that a segment left by another store is not served """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.config._update()
+        self.store.config.close()
+
+        # Keep the segment as it is, as if its writer had crashed
+        writer = shared_memory._SharedSegment(self.path, 'crashed')
+        self.assertTrue(writer.try_lock())
+
+        other = SharedMemoryConfigStore(
+            self.table,
+            'other',
+            '_store',
+            '_option',
+            self.path,
+            update_interval=0.5,
+            jitter=0,
+            blocking=False)
+        self.assertFalse(other.wait_until_populated(0.5))
+        self.assertEqual(other.get(), {})
+        self.assertRaises(AttributeError, getattr, other, 'db')
+        other.close()
+        writer.unlock()
+
+    def test_ignore_segment_in_other_format(self):
+        """ Test that a segment in another format is treated as empty """
+        self.store.config.close()
+        with open(self.path, 'r+b') as segment:
+            segment.write(struct.pack('<QQ', 2, 0))
+
+        segment = shared_memory._SharedSegment(
+            self.path, '\n'.join(['conf', 'test', '_store', '_option']))
+        self.assertEqual(segment.generation(), 0)
+        self.assertEqual(segment.read(), (0, None))
+
+        self.assertEqual(segment.write(b'{}'), 2)
+        self.assertEqual(segment.read(), (2, b'{}'))
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.store.config.close()
+        self.table.delete()
+        shutil.rmtree(self.directory)
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.connection = ThrottledConnection(connection)
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            retry_policy=RetryPolicy(base_delay=0.01))
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_retry_throttled_requests(self):
+        """ Test that throttled requests are retried """
+        self.connection.throttled = 2
+
+        self.assertEqual(self.store.config.get('db')['host'], '127.0.0.1')
+        self.assertEqual(self.connection.attempts, 3)
+
+    def test_max_attempts(self):
+        """ Test that requests are given up after max_attempts """
+        self.connection.throttled = 5
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            self.store.config.get('db')
+
+        self.assertEqual(self.connection.attempts, 5)
+
+    def test_retry_budget(self):
+        """ Test that retries stop when the budget is spent """
+        self.store.connection.retry_policy = RetryPolicy(
+            base_delay=0.01, budget=RetryBudget(ratio=0, max_tokens=1))
+        self.connection.throttled = 2
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            self.store.config.get('db')
+
+        self.assertEqual(self.connection.attempts, 2)
+
+    def test_token_bucket(self):
+        """ Test that the token bucket limits the request rate """
+        bucket = TokenBucket(rate=100, capacity=1)
+
+        start = time.time()
+        for _ in range(5):
+            bucket.acquire()
+
+        # The first token is available right away
+        self.assertGreaterEqual(time.time() - start, 0.035)
+
+    def test_token_bucket_charges_consumed_capacity(self):
+        """ Test that the limiter is charged the capacity a request consumed """
+        bucket = TokenBucket(rate=1, capacity=100)
+        limited = RetryingConnection(connection, read_limiter=bucket)
+        self.store.set('large', {'value': 'x' * 20000})
+
+        response = limited.get_item(
+            self.table_name,
+            {'_store': {'S': self.store_name}, '_option': {'S': 'large'}},
+            consistent_read=True)
+
+        # 20 KB takes 5 read capacity units
+        self.assertEqual(response['ConsumedCapacity']['CapacityUnits'], 5)
+        self.assertAlmostEqual(bucket._tokens, 95, delta=0.5)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestResilience(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.connection = ThrottledConnection(connection)
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=2, reset_timeout=0.2))
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_circuit_breaker(self):
+        """ Test that the circuit opens and is closed by a probe """
+        breaker = self.store.connection.circuit_breaker
+        self.connection.throttled = 2
+
+        for _ in range(2):
+            with self.assertRaises(ProvisionedThroughputExceededException):
+                self.store.config.get('db')
+
+        # DynamoDB is not called while the circuit is open
+        with self.assertRaises(CircuitOpenException):
+            self.store.config.get('db')
+        self.assertEqual(self.connection.attempts, 2)
+        self.assertEqual(breaker.state, 'open')
+
+        time.sleep(0.25)
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual(self.store.config.get('db')['host'], '127.0.0.1')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_stale_while_revalidate(self):
+        """ Test that expired entries are served while they are refreshed """
+        config = CachedConfigStore(
+            self.table, self.store_name, '_store', '_option',
+            ttl=0.1, stale_ttl=10)
+        config.get('db')
+
+        self.table.put_item(
+            {'_store': self.store_name, '_option': 'db', 'host': 'db.com'},
+            overwrite=True)
+        time.sleep(0.15)
+
+        self.assertEqual(config.get('db')['host'], '127.0.0.1')
+        self.assertEqual(config.cache_info()['stale_hits'], 1)
+
+        time.sleep(0.1)
+        self.assertEqual(config.get('db')['host'], 'db.com')
+
+    def test_refresher_survives_errors(self):
+        """ Test that the refresher retries failed updates """
+        config = TimeBasedConfigStore(
+            FailingTable(self.table_name, connection=connection, failures=1),
+            self.store_name,
+            '_store',
+            '_option',
+            blocking=False)
+
+        self.assertTrue(config.wait_until_populated(5))
+        self.assertEqual(config.db['host'], '127.0.0.1')
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestRequestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name)
+        for number in range(5):
+            self.store.set('option{}'.format(number), {'value': number})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def _read_concurrently(self, config, options):
+        """ Read options from many threads at once """
+        results = {}
+
+        def read(option):
+            try:
+                results[option] = config.get_option(option)
+            except ItemNotFound as error:
+                results[option] = error
+
+        threads = [
+            threading.Thread(target=read, args=(option,))
+            for option in options
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_single_flight(self):
+        """ Test that concurrent reads of an option share one request """
+        table = CountingTable(self.table_name, connection=connection)
+        config = SimpleConfigStore(
+            table, self.store_name, '_store', '_option', single_flight=True)
+
+        results = {}
+
+        def read(number):
+            results[number] = config.get_option('option1')
+
+        threads = [
+            threading.Thread(target=read, args=(number,))
+            for number in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(table.get_items, 1)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(
+            result == {'value': 1} for result in results.values()))
+        self.assertIsNot(results[0], results[1])
+
+    def test_batch_window(self):
+        """ Test that concurrent reads are fetched with one BatchGetItem """
+        table = CountingTable(self.table_name, connection=connection)
+        config = SimpleConfigStore(
+            table, self.store_name, '_store', '_option', batch_window=0.1)
+
+        results = self._read_concurrently(
+            config, ['option{}'.format(number) for number in range(6)])
+
+        self.assertEqual(table.get_items, 0)
+        self.assertEqual(table.batch_gets, 1)
+        self.assertEqual(results['option3'], {'value': 3})
+        self.assertIsInstance(results['option5'], ItemNotFound)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.events = []
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='CachedConfigStore',
+            instrumentation=self.events.append)
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_request_events(self):
+        """ Test that requests towards DynamoDB are reported """
+        del self.events[:]
+        self.store.config.get_option('db')
+
+        requests = [
+            event for event in self.events if event['type'] == 'request']
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0]['operation'], 'get_item')
+        self.assertEqual(requests[0]['kind'], 'read')
+        self.assertEqual(requests[0]['table'], self.table_name)
+        self.assertEqual(requests[0]['items'], 1)
+        self.assertGreaterEqual(requests[0]['latency'], 0)
+        self.assertIsNone(requests[0]['error'])
+
+    def test_measure_bytes(self):
+        """ Test that the response size is reported with measure_bytes """
+        events = []
+        store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            instrumentation=events.append,
+            measure_bytes=True)
+        del events[:]
+        store.config.get_option('db')
+
+        requests = [event for event in events if event['type'] == 'request']
+        self.assertEqual(len(requests), 1)
+        self.assertGreater(requests[0]['bytes'], 0)
+
+        # Sizes are not measured by default
+        self.assertTrue(all(
+            event['bytes'] is None
+            for event in self.events if event['type'] == 'request'))
+
+    def test_cache_events(self):
+        """ Test that cache hits and misses are reported """
+        del self.events[:]
+        self.store.config.get_option('db')
+        self.store.config.get_option('db')
+
+        lookups = [
+            (event['option'], event['hit'])
+            for event in self.events if event['type'] == 'cache']
+        self.assertEqual(lookups, [('db', False), ('db', True)])
+
+    def test_metrics(self):
+        """ Test the Prometheus style metrics """
+        metrics = MetricsInstrumentation()
+        for event in self.events:
+            metrics(event)
+
+        self.store.config.get_option('db')
+        self.store.config.get_option('db')
+        for event in self.events[-3:]:
+            metrics(event)
+
+        self.assertEqual(metrics.cache_hit_ratio(), 0.5)
+
+        rendered = metrics.render()
+        self.assertIn(
+            'dynamodb_config_store_requests_total{operation="put_item"} 1',
+            rendered)
+        self.assertIn(
+            'dynamodb_config_store_request_latency_seconds_count'
+            '{operation="get_item"} 1',
+            rendered)
+        self.assertIn(
+            '# TYPE dynamodb_config_store_requests_total counter\n', rendered)
+        self.assertEqual(
+            rendered.count(
+                '# TYPE dynamodb_config_store_request_latency_seconds '
+                'histogram\n'),
+            1)
+
+    def test_boto_retries(self):
+        """ Test that throttled attempts retried by boto are reported """
+        events = []
+        instrumented = InstrumentedConnection(
+            BotoThrottledConnection(connection, throttled=2), events.append)
+        instrumented.get_item(
+            self.table_name,
+            {'_store': {'S': self.store_name}, '_option': {'S': 'db'}})
+
+        self.assertEqual(events[0]['retries'], 2)
+        self.assertTrue(events[0]['throttled'])
+        self.assertIsNone(events[0]['error'])
+
+        metrics = MetricsInstrumentation()
+        metrics(events[0])
+        self.assertIn(
+            'dynamodb_config_store_throttle_retries_total'
+            '{operation="get_item"} 2',
+            metrics.render())
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestMemoryConnection(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.connection = MemoryConnection(seed=1)
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name)
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=self.connection)
+
+    def test_read_write(self):
+        """ Test reads and writes through the store """
+        self.assertEqual(
+            self.store.config.get_option('db'),
+            {'host': '127.0.0.1', 'port': 27017})
+        self.assertEqual(
+            self.store.config.get(keys=['host']),
+            {'db': {'host': '127.0.0.1'}})
+
+        with self.assertRaises(ItemNotFound):
+            self.store.config.get_option('missing')
+
+    def test_throttle(self):
+        """ Test that throttled requests raise like DynamoDB """
+        self.connection.throttle(1, operations=['get_item'])
+
+        with self.assertRaises(ProvisionedThroughputExceededException):
+            self.store.config.get_option('db')
+
+        self.assertEqual(self.store.config.get_option('db')['port'], 27017)
+
+    def test_unprocessed_items(self):
+        """ Test that unprocessed batch items are retried """
+        self.connection.unprocessed_rate = 0.5
+
+        options = {
+            'option{}'.format(number): {'value': number}
+            for number in range(30)
+        }
+        results = self.store.set_many(options)
+
+        self.connection.unprocessed_rate = 0
+        self.assertTrue(all(results.values()))
+        self.assertEqual(len(self.store.config.get()), 31)
+
+    def test_unprocessed_items_errors(self):
+        """ Test that items left unprocessed are recorded as errors """
+        self.connection.unprocessed_rate = 1
+
+        with BatchWriter(
+                self.table, self.store_name, '_store', '_option',
+                max_retries=0) as batch:
+            batch.set('api', {'port': 80})
+
+        self.connection.unprocessed_rate = 0
+        self.assertEqual(batch.results, {'api': False})
+        self.assertIsInstance(batch.errors['api'], UnprocessedItemsException)
+
+    def test_consumed_capacity(self):
+        """ Test that the consumed capacity is returned """
+        response = self.connection.get_item(
+            self.table_name,
+            {'_store': {'S': self.store_name}, '_option': {'S': 'db'}},
+            consistent_read=True,
+            return_consumed_capacity='TOTAL')
+
+        self.assertEqual(response['ConsumedCapacity']['CapacityUnits'], 1.0)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestConfigStoreManager(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.events = []
+        self.connection = InstrumentedConnection(
+            connection, self.events.append)
+
+        # Instanciate the manager
+        self.manager = ConfigStoreManager(
+            self.connection,
+            merge_window=60,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={'update_interval': 0.2},
+            version_key='_version')
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def _operations(self, operation):
+        """ Count the requests of an operation """
+        return len([
+            event for event in self.events
+            if event['operation'] == operation])
+
+    def test_shared_table(self):
+        """ Test that the table is only described for the first store """
+        stores = [self.manager.get_store(self.table_name, 'store0')]
+        describes = self._operations('describe_table')
+
+        stores.extend([
+            self.manager.get_store(self.table_name, 'store{}'.format(number))
+            for number in range(1, 3)
+        ])
+
+        self.assertEqual(self._operations('describe_table'), describes)
+        self.assertIs(stores[0].table, stores[2].table)
+        self.assertIs(
+            self.manager.get_store(self.table_name, 'store1'), stores[1])
+
+    def test_shared_schema_cache(self):
+        """ Test that the stores share the schema cache of the manager """
+        store = self.manager.get_store(self.table_name, 'store0')
+        self.assertIs(store.schema_cache, self.manager.schema_cache)
+
+        # Another manager with the same cache does not describe the table
+        describes = self._operations('describe_table')
+        manager = ConfigStoreManager(
+            self.connection,
+            config_store='SimpleConfigStore',
+            schema_cache=self.manager.schema_cache)
+        manager.get_store(self.table_name, 'store1')
+        self.assertEqual(self._operations('describe_table'), describes)
+        manager.close()
+
+    def test_shared_scheduler(self):
+        """ Test that the stores are updated by the shared scheduler """
+        stores = [self.manager.get_store(self.table_name, 'store0')]
+        threads = threading.active_count()
+        stores.extend([
+            self.manager.get_store(self.table_name, 'store{}'.format(number))
+            for number in range(1, 3)
+        ])
+        self.assertEqual(threading.active_count(), threads)
+
+        stores[1].set('db', {'host': '127.0.0.1'})
+        time.sleep(1)
+
+        self.assertEqual(stores[1].config.db['host'], '127.0.0.1')
+        self.assertEqual(stores[0].config.get(), {})
+
+    def test_scheduler_starts_lazily(self):
+        """ Test that the scheduler thread is started by the first store """
+        self.assertIsNone(self.manager.scheduler._thread)
+
+        self.manager.get_store(self.table_name, 'store0')
+        self.assertTrue(self.manager.scheduler._thread.is_alive())
+
+    def test_slow_table_does_not_block(self):
+        """ Test that stores are created without holding the manager lock """
+        blocking = BlockingConnection(self.connection, 'slow')
+        manager = ConfigStoreManager(
+            blocking, config_store='SimpleConfigStore')
+        stores = []
+        thread = threading.Thread(
+            target=lambda: stores.append(manager.get_store('slow', 'test')))
+        thread.start()
+        self.assertTrue(blocking.blocked.wait(5))
+
+        store = manager.get_store(self.table_name, 'store0')
+        self.assertIs(manager.get_store(self.table_name, 'store0'), store)
+
+        blocking.released.set()
+        thread.join(5)
+        self.assertIs(manager.get_store('slow', 'test'), stores[0])
+        manager.close()
+        Table('slow', connection=connection).delete()
+
+    def test_merged_store_versions(self):
+        """ Test that the store versions are read together """
+        for number in range(3):
+            self.manager.get_store(self.table_name, 'store{}'.format(number))
+
+        del self.events[:]
+        time.sleep(1)
+
+        self.assertGreater(self._operations('batch_get_item'), 0)
+        self.assertEqual(self._operations('get_item'), 0)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.manager.close()
+        self.table.delete()
+
+
+class TestSchemaValidation(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.events = []
+        self.connection = InstrumentedConnection(
+            connection, self.events.append)
+        self.directory = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.directory, 'schemas.json')
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            schema_cache=SchemaCache(path=self.cache_file))
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def _describes(self):
+        """ Count the describe_table requests """
+        return len([
+            event for event in self.events
+            if event['operation'] == 'describe_table'])
+
+    def test_schema_cache(self):
+        """ Test that cached tables are not described again """
+        describes = self._describes()
+
+        store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            schema_cache=self.store.schema_cache)
+        self.assertEqual(store.config.get_option('db')['host'], '127.0.0.1')
+
+        # A new cache reads the validated tables from the file
+        DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            schema_cache=SchemaCache(path=self.cache_file))
+
+        self.assertEqual(self._describes(), describes)
+
+    def test_schema_cache_ttl(self):
+        """ Test that tables are described again after the TTL """
+        describes = self._describes()
+
+        DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            schema_cache=SchemaCache(path=self.cache_file, ttl=0))
+
+        self.assertEqual(self._describes(), describes + 1)
+
+    def test_skip_validation(self):
+        """ Test that the table is validated on first use """
+        describes = self._describes()
+
+        store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            skip_validation=True)
+        self.assertEqual(self._describes(), describes)
+
+        self.assertEqual(store.config.get_option('db')['host'], '127.0.0.1')
+        store.config.get_option('db')
+        self.assertEqual(self._describes(), describes + 1)
+
+    def test_skip_validation_error(self):
+        """ Test that validation errors are raised on first use """
+        store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            option_key='option',
+            skip_validation=True)
+
+        with self.assertRaises(MisconfiguredSchemaException):
+            store.set('db', {'host': '127.0.0.1'})
+
+    def test_skip_validation_blocking_store(self):
+        """ Test that a blocking store raises validation errors """
+        with self.assertRaises(MisconfiguredSchemaException):
+            DynamoDBConfigStore(
+                self.connection,
+                self.table_name,
+                self.store_name,
+                option_key='option',
+                config_store='TimeBasedConfigStore',
+                skip_validation=True)
+
+    def test_skip_validation_shared_table(self):
+        """ Test that sharing a lazy table does not validate it """
+        describes = self._describes()
+
+        store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            skip_validation=True)
+        other = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            'other',
+            table=store.table)
+        self.assertEqual(self._describes(), describes)
+
+        self.assertEqual(other.connection, self.connection)
+        self.assertEqual(store.config.get_option('db')['host'], '127.0.0.1')
+        self.assertEqual(self._describes(), describes + 1)
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+        shutil.rmtree(self.directory)
+
+
+class TestWaitForTable(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.connection = MemoryConnection(create_delay=0.3)
+        self.statuses = []
+
+    def _callback(self, status, elapsed):
+        self.statuses.append(status)
+
+    def _create_table(self):
+        """ Create a table without waiting for it """
+        self.connection.create_table(
+            [{'AttributeName': '_store', 'AttributeType': 'S'}],
+            self.table_name,
+            [{'AttributeName': '_store', 'KeyType': 'HASH'}],
+            {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1})
+
+    def test_wait_for_new_table(self):
+        """ Test that a new table is used as soon as it is ACTIVE """
+        start = time.time()
+        store = DynamoDBConfigStore(
+            self.connection,
+            self.table_name,
+            self.store_name,
+            wait_callback=self._callback)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(self.statuses[0], 'CREATING')
+        self.assertEqual(self.statuses[-1], 'ACTIVE')
+        self.assertTrue(store.set('db', {'host': '127.0.0.1'}))
+
+    def test_timeout(self):
+        """ Test that waiting stops at the timeout """
+        self.connection.create_delay = 10
+        self._create_table()
+
+        start = time.time()
+        self.assertFalse(wait_for_table(
+            self.connection, self.table_name, timeout=0.2))
+        self.assertLess(time.time() - start, 0.5)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'asyncio requires Python 3.5')
+    def test_wait_for_table_async(self):
+        """ Test waiting without blocking the event loop """
+        import asyncio
+        from dynamodb_config_store import aio
+
+        self._create_table()
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertTrue(loop.run_until_complete(aio.wait_for_table(
+                self.connection, self.table_name, callback=self._callback)))
+        finally:
+            loop.close()
+
+        self.assertEqual(self.statuses[-1], 'ACTIVE')
+
+    def test_timeout_async(self):
+        """ Test that waiting without blocking stops at the timeout """
+        import asyncio
+        from dynamodb_config_store import aio
+
+        self._create_table()
+
+        loop = asyncio.new_event_loop()
+        try:
+            start = time.time()
+            self.assertFalse(loop.run_until_complete(aio.wait_for_table(
+                self.connection, self.table_name, timeout=0.1)))
+        finally:
+            loop.close()
+
+        self.assertLess(time.time() - start, 0.3)
+
+
+class TestCompactOptions(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={'update_interval': 300, 'compact': True})
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_read_only_mapping(self):
+        """ Test that compact options behave like read-only dicts """
+        option = CompactOption({'port': 27017, 'host': '127.0.0.1'})
+
+        self.assertEqual(option, {'host': '127.0.0.1', 'port': 27017})
+        self.assertEqual(list(option), ['host', 'port'])
+        self.assertEqual(option['port'], 27017)
+        self.assertEqual(option.get('user'), None)
+        self.assertTrue('host' in option)
+        self.assertEqual(len(option), 2)
+
+        with self.assertRaises(KeyError):
+            option['user']
+
+        with self.assertRaises(TypeError):
+            option['port'] = 8000
+
+        with self.assertRaises(AttributeError):
+            option.extra = True
+
+        with self.assertRaises(ValueError):
+            CompactOption([('host', 'a'), ('host', 'b')])
+
+        self.assertEqual(pickle.loads(pickle.dumps(option)), option)
+
+    def test_shared_key_table(self):
+        """ Test that options with the same keys share one key table """
+        first = CompactOption({'host': 'a', 'port': 1})
+        second = CompactOption([('port', 2), ('host', 'b')])
+
+        self.assertTrue(first._shape is second._shape)
+        self.assertTrue(
+            sys.getsizeof(second) + sys.getsizeof(second._values) <
+            sys.getsizeof({'host': 'b', 'port': 2}))
+
+    def test_bounded_key_tables(self):
+        """ Test that only the most recently used key tables are kept """
+        max_shapes = compact.MAX_SHAPES
+        compact.MAX_SHAPES = 2
+        try:
+            first = CompactOption({'a': 1})
+            CompactOption({'b': 1})
+            CompactOption({'c': 1})
+            self.assertEqual(compact.shape_count(), 2)
+
+            # Evicted key tables are still used by their options
+            self.assertEqual(first, {'a': 1})
+            self.assertFalse(CompactOption({'a': 2})._shape is first._shape)
+        finally:
+            compact.MAX_SHAPES = max_shapes
+
+    def test_time_based_config_store(self):
+        """ Test that time based config stores hold compact options """
+        self.store.set('db', {'host': '127.0.0.1', 'port': 27017})
+        self.store.reload()
+
+        option = self.store.config.db
+        self.assertTrue(isinstance(option, CompactOption))
+        self.assertEqual(option, {'host': '127.0.0.1', 'port': 27017})
+        self.assertEqual(
+            self.store.config.get('db', keys=['host']), {'host': '127.0.0.1'})
+
+    def test_cached_config_store(self):
+        """ Test that cached config stores return compact options """
+        store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='CachedConfigStore',
+            config_store_kwargs={'compact': True})
+        store.set('db', {'host': '127.0.0.1', 'port': 27017})
+
+        first = store.config.get('db')
+        self.assertTrue(isinstance(first, CompactOption))
+        self.assertEqual(first, {'host': '127.0.0.1', 'port': 27017})
+
+        # Read-only options are shared instead of copied
+        self.assertTrue(store.config.get('db') is first)
+        self.assertEqual(
+            store.config.get('db', keys=['port']), {'port': 27017})
+        self.assertEqual(store.config.get(), {'db': first})
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestDecoding(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+        self.schema = {
+            'db': {
+                'port': 'int',
+                'timeout': 'duration',
+                'ssl': 'bool',
+                'replicas': 'json'
+            }
+        }
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={
+                'update_interval': 300,
+                'schema': self.schema
+            })
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+        self.store.set('db', {
+            'host': '127.0.0.1',
+            'port': 27017,
+            'timeout': '1m30s',
+            'ssl': 'yes',
+            'replicas': '["a", "b"]'
+        })
+
+        self.decoded = {
+            'host': '127.0.0.1',
+            'port': 27017,
+            'timeout': 90.0,
+            'ssl': True,
+            'replicas': ['a', 'b']
+        }
+
+    def test_schema(self):
+        """ Test decoding values with a schema """
+        schema = Schema({'db': {'port': 'int', 'weight': float}})
+
+        decoded = schema.decode('db', {'port': Decimal('8000'), 'a': 'b'})
+        self.assertEqual(decoded, {'port': 8000, 'a': 'b'})
+        self.assertTrue(isinstance(decoded['port'], int))
+
+        self.assertEqual(
+            schema.decode('db', {'weight': Decimal('0.5')}), {'weight': 0.5})
+        self.assertEqual(schema.decode('api', {'port': '1'}), {'port': '1'})
+        self.assertTrue(isinstance(
+            schema.decode('db', CompactOption({'port': '1'})), CompactOption))
+
+        with self.assertRaises(DecodingException):
+            schema.decode('db', {'port': Decimal('1.5')})
+
+        with self.assertRaises(ValueError):
+            Schema({'db': {'port': 'integer'}})
+
+    def test_durations(self):
+        """ Test decoding durations to seconds """
+        schema = Schema({'db': {'timeout': 'duration'}})
+
+        for value, seconds in [
+                (Decimal('2.5'), 2.5), ('30', 30), ('250ms', 0.25),
+                ('1h 30m', 5400), ('2d', 172800)]:
+            self.assertEqual(
+                schema.decode('db', {'timeout': value}), {'timeout': seconds})
+
+        for value in ['', '1x', 'm', True]:
+            with self.assertRaises(DecodingException):
+                schema.decode('db', {'timeout': value})
+
+    def test_converter_errors(self):
+        """ Test that any error of a converter is a DecodingException """
+        def lookup(value):
+            return {'low': 1, 'high': 2}[value]
+
+        schema = Schema({'db': {'port': 'int', 'level': lookup}})
+
+        with self.assertRaises(DecodingException):
+            schema.decode('db', {'port': Decimal('Infinity')})
+        with self.assertRaises(DecodingException):
+            schema.decode('db', {'level': 'medium'})
+
+        self.assertEqual(
+            schema.decode('db', {'port': Decimal(80), 'level': 'high'}),
+            {'port': 80, 'level': 2})
+
+    def test_time_based_config_store(self):
+        """ Test that options are decoded once per update """
+        self.store.reload()
+
+        # Lists are frozen to tuples in the shared snapshot
+        option = self.store.config.db
+        self.assertEqual(option, dict(self.decoded, replicas=('a', 'b')))
+        self.assertEqual(self.store.config._raw_snapshot['db']['ssl'], 'yes')
+
+        # Unchanged options are not decoded again
+        self.store.config._refresh()
+        self.assertTrue(self.store.config.db is option)
+
+        self.store.set('db', {'port': 8000})
+        self.store.config._refresh()
+        self.assertEqual(self.store.config.db, {'port': 8000})
+
+    def test_time_based_config_store_invalid_value(self):
+        """ Test that updates with invalid values are not published """
+        self.store.reload()
+
+        self.store.set('db', {'port': 'not a port'})
+        with self.assertRaises(DecodingException):
+            self.store.config._refresh()
+
+        self.assertEqual(
+            self.store.config.db, dict(self.decoded, replicas=('a', 'b')))
+
+    def test_decoded_values_are_read_only(self):
+        """ Test that decoded maps and lists can not be modified """
+        self.store.set('db', {'replicas': '{"hosts": ["a"], "weight": 1}'})
+        self.store.reload()
+
+        replicas = self.store.config.db['replicas']
+        self.assertEqual(replicas['hosts'], ('a', ))
+        if frozen_mapping is not dict:
+            with self.assertRaises(TypeError):
+                replicas['weight'] = 2
+
+        schema = Schema({'db': {'replicas': 'json'}})
+        option = schema.decode(
+            'db', CompactOption({'replicas': '{"hosts": ["a"]}'}))
+        self.assertEqual(option['replicas']['hosts'], ('a', ))
+
+    def test_simple_config_store(self):
+        """ Test that simple config stores decode the options read """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot_file = os.path.join(directory, 'snapshot')
+
+        store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='SimpleConfigStore',
+            config_store_kwargs={
+                'schema': Schema(self.schema),
+                'snapshot_file': snapshot_file
+            })
+
+        self.assertEqual(store.config.get_option('db'), self.decoded)
+        self.assertEqual(
+            store.config.get('db', keys=['ssl']), {'ssl': True})
+        self.assertEqual(store.config.get_many(['db']), {'db': self.decoded})
+        self.assertEqual(store.config.get(), {'db': self.decoded})
+
+        # Snapshot files hold the values as read
+        self.assertEqual(read_snapshot(snapshot_file)['db']['ssl'], 'yes')
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
+class TestVersionedTimeBasedConfigStore(unittest.TestCase):
+
+    def setUp(self):
+
+        # Configuration options
+        self.table_name = 'conf'
+        self.store_name = 'test'
+
+        # Instanciate the store
+        self.store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={
+                'update_interval': 300,
+                'consistent_read': True
+            },
+            version_key='_version')
+
+        # Get an Table instance for validation
+        self.table = Table(self.table_name, connection=connection)
+
+    def test_versioned_set(self):
+        """ Test that writes are stamped and the store version is updated """
+        self.store.set('db', {'host': '127.0.0.1'})
+
+        item = self.table.get_item(_store=self.store_name, _option='db')
+        self.assertIsNotNone(item['_version'])
+
+        sentinel = self.table.get_item(
+            _store='__version__', _option=self.store_name)
+        self.assertGreaterEqual(sentinel['_version'], item['_version'])
+
+    def test_delta_update(self):
+        """ Test that only changed options are fetched """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.set('api', {'endpoint': 'http://test.com'})
+        self.store.reload()
+
+        self.assertEqual(self.store.config.db, {'host': '127.0.0.1'})
+        self.assertNotIn('_version', self.store.config.api)
+
+        # Nothing has changed, so there is nothing to update
+        self.assertIsNone(self.store.config._fetch_options())
+
+        self.store.set('db', {'host': 'db.com'})
+        options = self.store.config._fetch_options()
+
+        self.assertEqual(options['db'], {'host': 'db.com'})
+        self.assertEqual(options['api'], {'endpoint': 'http://test.com'})
+
+    def test_versions_from_counter(self):
+        """ Test that versions are taken from the store version counter """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.set('api', {'endpoint': 'http://test.com'})
+
+        db = self.table.get_item(_store=self.store_name, _option='db')
+        api = self.table.get_item(_store=self.store_name, _option='api')
+        sentinel = self.table.get_item(
+            _store='__version__', _option=self.store_name)
+
+        # Each write takes a version and publishes it
+        self.assertEqual(
+            [db['_version'], api['_version'], sentinel['_version']],
+            [1, 3, 4])
+
+    def test_delta_update_since_watermark(self):
+        """ Test that delta updates only read options after the watermark """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.reload()
+        config = self.store.config
+        config._version_overlap = 0
+
+        queries = []
+        query_options = config._query_options
+
+        def recording_query_options(since=None, consistent=False):
+            queries.append((since, consistent))
+            return query_options(since=since, consistent=consistent)
+
+        config._query_options = recording_query_options
+
+        self.store.set('api', {'endpoint': 'http://test.com'})
+        config._refresh()
+        self.store.set('cache', {'ttl': 60})
+        config._refresh()
+
+        # The second update starts after the version read by the first one
+        self.assertEqual(queries, [(0, True), (4, True)])
+        self.assertEqual(
+            config.get(),
+            {
+                'api': {'endpoint': 'http://test.com'},
+                'cache': {'ttl': 60},
+                'db': {'host': '127.0.0.1'}
+            })
+
+    def test_eventually_consistent_delta_update(self):
+        """ Test that updates are read again until the watermark catches up """
+        self.store.set('db', {'host': '127.0.0.1'})
+        store = DynamoDBConfigStore(
+            connection,
+            self.table_name,
+            self.store_name,
+            config_store='TimeBasedConfigStore',
+            config_store_kwargs={'update_interval': 300},
+            version_key='_version')
+        config = store.config
+        config._version_overlap = 0
+
+        queries = []
+        query_options = config._query_options
+
+        def recording_query_options(since=None, consistent=False):
+            queries.append(consistent)
+            return query_options(since=since, consistent=consistent)
+
+        config._query_options = recording_query_options
+
+        # The first read may have missed the latest writes
+        self.assertIsNotNone(config._fetch_options())
+        self.assertIsNone(config._fetch_options())
+        self.assertEqual(queries, [False])
+        config.close()
+
+    def test_full_reload_drops_deleted_options(self):
+        """ Test that a full reload drops deleted options """
+        self.store.set('db', {'host': '127.0.0.1'})
+        self.store.set('api', {'endpoint': 'http://test.com'})
+        self.store.reload()
+        config = self.store.config
+
+        self.table.delete_item(_store=self.store_name, _option='api')
+        self.store.set('db', {'host': 'db.com'})
+        config._refresh()
+        self.assertIn('api', config.get())
+
+        # Due even though the store version has not changed
+        config._last_full_reload -= config._full_reload_interval
+        config._refresh()
+        self.assertEqual(config.get(), {'db': {'host': 'db.com'}})
+
+    def tearDown(self):
+        """ Tear down the test case """
+        self.table.delete()
+
+
 class TestNotImplementedConfigStore(unittest.TestCase):
 
     def test_not_implemented_config_store(self):
@@ -515,11 +2934,33 @@ def suite():
     suite_builder.addTest(unittest.makeSuite(TestDefaultThroughput))
     suite_builder.addTest(unittest.makeSuite(TestCustomThroughput))
     suite_builder.addTest(unittest.makeSuite(TestSet))
+    suite_builder.addTest(unittest.makeSuite(TestSetMany))
+    suite_builder.addTest(unittest.makeSuite(TestRetry))
+    suite_builder.addTest(unittest.makeSuite(TestResilience))
     suite_builder.addTest(unittest.makeSuite(TestGetOption))
     suite_builder.addTest(unittest.makeSuite(TestGetOptionAndKeysSubset))
+    suite_builder.addTest(unittest.makeSuite(TestConsistentRead))
     suite_builder.addTest(unittest.makeSuite(TestGetFullStore))
+    suite_builder.addTest(unittest.makeSuite(TestGetMany))
+    suite_builder.addTest(unittest.makeSuite(TestRequestCoalescing))
+    suite_builder.addTest(unittest.makeSuite(TestInstrumentation))
+    suite_builder.addTest(unittest.makeSuite(TestMemoryConnection))
+    suite_builder.addTest(unittest.makeSuite(TestConfigStoreManager))
+    suite_builder.addTest(unittest.makeSuite(TestSchemaValidation))
+    suite_builder.addTest(unittest.makeSuite(TestWaitForTable))
     suite_builder.addTest(unittest.makeSuite(TestCustomStoreAndOptionKeys))
     suite_builder.addTest(unittest.makeSuite(TestTimeBasedConfigStore))
+    suite_builder.addTest(unittest.makeSuite(TestTimeBasedConfigStoreSnapshot))
+    suite_builder.addTest(unittest.makeSuite(TestTimeBasedConfigStoreStartup))
+    suite_builder.addTest(unittest.makeSuite(TestSnapshotFile))
+    suite_builder.addTest(unittest.makeSuite(TestSharedMemoryConfigStore))
+    suite_builder.addTest(
+        unittest.makeSuite(TestVersionedTimeBasedConfigStore))
+    suite_builder.addTest(unittest.makeSuite(TestCachedConfigStore))
+    suite_builder.addTest(unittest.makeSuite(TestCompactOptions))
+    suite_builder.addTest(unittest.makeSuite(TestDecoding))
+    suite_builder.addTest(unittest.makeSuite(TestAsyncDynamoDBConfigStore))
+    suite_builder.addTest(unittest.makeSuite(TestStreamConfigStore))
     suite_builder.addTest(unittest.makeSuite(TestNotImplementedConfigStore))
 
     return suite_builder